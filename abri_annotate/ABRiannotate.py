@@ -1,29 +1,90 @@
+from __future__ import annotations
+
 import os
+import re
+import shutil
+import signal
 from io import StringIO
 import logging
-from subprocess import run, PIPE
+import time
+import threading
+from subprocess import PIPE, CompletedProcess
 from functools import cached_property
-from tempfile import TemporaryDirectory
-from typing import Union
-
-import pandas as pd
-from Bio import SeqIO, BiopythonWarning
-import warnings
-
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryDirectory, mkdtemp
+from typing import Union, TYPE_CHECKING
+
+from .cache import ResultCache, MetadataCache, file_digest
+from .errors import AbricateError, AbricateTimeout
+from .retry import RetryPolicy
+from .combined_db import COMBINED_DB, combined_db_key, write_combined_sequences, split_hits
+from .metrics import Metrics, run_measured
+from .manifest import ResultManifest
 from .markdown_generator import create_markdown, inject_markdown
 from .utils import logger, init_logfile
 
-expected_columns = {'#FILE', 'SEQUENCE', 'START', 'END', 'STRAND', 'GENE', 'COVERAGE', 'COVERAGE_MAP', 'GAPS',
-                    '%COVERAGE', '%IDENTITY', 'DATABASE', 'ACCESSION', 'PRODUCT', 'RESISTANCE'}
+# pandas, numpy and asyncio are imported where they are used, which keeps the startup of the CLI fast
+if TYPE_CHECKING:
+    import asyncio
+    import pandas as pd
+    from .gene_index import GeneIndex
+    from .scheduler import CpuBudget
+
+abricate_columns = ['#FILE', 'SEQUENCE', 'START', 'END', 'STRAND', 'GENE', 'COVERAGE', 'COVERAGE_MAP', 'GAPS',
+                    '%COVERAGE', '%IDENTITY', 'DATABASE', 'ACCESSION', 'PRODUCT', 'RESISTANCE']
+expected_columns = set(abricate_columns)
+
+
+def malformed_output(stdout: str) -> str:
+    """:return: why stdout is not the complete output of abricate v1+, or None if it is"""
+    if not stdout.endswith('\n'):
+        return 'truncated, no newline at the end'
+    lines = stdout.splitlines()
+    columns = lines[0].split('\t')
+    if set(columns) != expected_columns:
+        return f'columns do not match: {columns}'
+    for i, line in enumerate(lines[1:], start=2):
+        n_fields = line.count('\t') + 1
+        if n_fields != len(columns):
+            return f'line {i} has {n_fields} fields instead of {len(columns)}'
+    return None
 
 
 class ABRiannotate:
-    def __init__(self, merge_annotations: bool = False, skip_bad_hits: bool = False):
+    # abricate runs blastn with -culling_limit 1, also on a combined database: a hit of one db would be dropped if a
+    # higher-scoring hit of another db envelops it, so combined databases of several dbs are refused. Engines that
+    # cull each source db separately set this to False.
+    culls_across_dbs = True
+
+    def __init__(self, merge_annotations: bool = False, skip_bad_hits: bool = False,
+                 cache_dir: str = None, cache_max_mb: float = 1024,
+                 metadata_cache_dir: str = None, metadata_ttl: float = 24 * 60 * 60, refresh_metadata: bool = False,
+                 combined_db_dir: str = None, sketch_dir: str = None, timeout: float = None, retries: int = 0,
+                 backoff: float = 1, hedge: float = None):
+        """
+        :param timeout: seconds after which an abricate call is killed, see RetryPolicy
+        :param retries: how often abricate calls that failed transiently (e.g. timeouts) are retried
+        :param backoff: seconds before the first retry, doubled for every further retry
+        :param hedge: start a second, identical abricate call when a call takes hedge times longer than usual for
+                      its db; the first to succeed wins
+        """
         self.merge_annotations = merge_annotations
         self.skip_bad_hits = skip_bad_hits
+        self.cache = None if cache_dir is None else ResultCache(cache_dir, max_bytes=int(cache_max_mb * 1024 ** 2))
+        self.metadata_cache = None if metadata_cache_dir is None else \
+            MetadataCache(metadata_cache_dir, ttl=metadata_ttl, refresh=refresh_metadata)
+        self.combined_db_dir = None if combined_db_dir is None else os.path.abspath(combined_db_dir)
+        self.sketch_dir = sketch_dir  # k-mer sketches of the dbs for the prefilter, None: kept in memory only
+        self.__sketches = None
+        self.retry = RetryPolicy(timeout=timeout, retries=retries, backoff=backoff, hedge=hedge)
+        self.tmpdir = None  # parent directory for temporary workdirs, None: system default
         self.__db_versions = None
 
-    def _build_cmd(self, args: [str], file: str = None) -> [str]:
+    def _build_cmd(self, args: [str], file: str = None, datadir: str = None) -> [str]:
+        raise NotImplementedError('This is an abstract class!')
+
+    def _read_db_sequences(self, db: str) -> [str]:
         raise NotImplementedError('This is an abstract class!')
 
     def init_outdir_logging(self, outdir: str, genome_identifier: str, logfile: bool = False):
@@ -35,91 +96,389 @@ class ABRiannotate:
         logger.info(f'Annotating {genome_identifier} with {self.version}...')
         logger.info(f'Available databases: {self.db_versions}...')
 
+    def _metadata_identity(self) -> str:
+        raise NotImplementedError('This is an abstract class!')
+
+    def _run_metadata(self, args: [str]) -> (str, str):
+        if self.metadata_cache is not None:
+            identity = self._metadata_identity()
+            cached = self.metadata_cache.get(identity, args)
+            if cached is not None:
+                logger.debug(f'Using cached output of abricate {" ".join(args)} ({identity=})')
+                return cached
+
+        stdout, stderr = self._execute_metadata(args)
+        if self.metadata_cache is not None:
+            self.metadata_cache.put(identity, args, stdout=stdout, stderr=stderr)
+        return stdout, stderr
+
+    def _execute_metadata(self, args: [str]) -> (str, str):
+        """:return: stdout and stderr of abricate {args}, e.g. --version, without the metadata cache"""
+        command = self._build_cmd(args)
+        subprocess, attempts, hedged = self.retry.call(lambda cancel: self._run_command(command, cancel=cancel),
+                                                       description=' '.join(command))
+        return subprocess.stdout, subprocess.stderr
+
+    async def _run_metadata_async(self, args: [str], timeout: float = None) -> (str, str):
+        import asyncio
+        if self.metadata_cache is not None:
+            identity = self._metadata_identity()
+            cached = self.metadata_cache.get(identity, args)
+            if cached is not None:
+                logger.debug(f'Using cached output of abricate {" ".join(args)} ({identity=})')
+                return cached
+
+        command = await asyncio.to_thread(self._build_cmd, args)
+
+        async def run() -> CompletedProcess:
+            subprocess = await self._run_async(command, timeout=timeout or self.retry.timeout,
+                                               on_kill=lambda: self._on_kill(command))
+            if subprocess.returncode != 0:
+                raise AbricateError.from_process(subprocess)
+            return subprocess
+
+        subprocess, attempts, hedged = await self.retry.call_async(run, description=' '.join(command))
+
+        if self.metadata_cache is not None:
+            self.metadata_cache.put(identity, args, stdout=subprocess.stdout, stderr=subprocess.stderr)
+        return subprocess.stdout, subprocess.stderr
+
+    async def load_metadata_async(self, timeout: float = None):
+        """Determine version and db_versions without blocking the event loop."""
+        # populate the cached properties
+        if 'version' not in self.__dict__:
+            stdout, stderr = await self._run_metadata_async(['--version'], timeout=timeout)
+            self.__dict__['version'] = stdout.strip()
+        if 'db_versions' not in self.__dict__:
+            stdout, stderr = await self._run_metadata_async(['--list'], timeout=timeout)
+            self.__dict__['db_versions'] = self._parse_db_versions(stdout)
+
+    def _run_command(self, command: [str], cancel: threading.Event = None) -> CompletedProcess:
+        """
+        Run a command with the timeout of self.retry.
+
+        :raise AbricateError: if the command fails or times out
+        """
+        try:
+            subprocess, usage = run_measured(command, timeout=self.retry.timeout, cancel=cancel,
+                                             on_kill=lambda: self._on_kill(command))
+        except TimeoutError as e:
+            raise AbricateTimeout(str(e), command=command, timeout=self.retry.timeout)
+        if subprocess.returncode != 0:
+            raise AbricateError.from_process(subprocess)
+        return subprocess
+
+    def _on_kill(self, command: [str]):
+        """Called after command was killed (timeout or cancelled), to stop what outlives its process group."""
+        pass
+
+    @staticmethod
+    async def _run_async(command: [str], timeout: float = None, on_kill=None) -> CompletedProcess:
+        """:param on_kill: function() called after the process was killed, see run_measured"""
+        import asyncio
+
+        async def kill():
+            # the process has its own session, so that its children (e.g. blastn of abricate) are killed too
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass  # exited in the meantime
+            await process.wait()
+            if on_kill is not None:
+                await asyncio.to_thread(on_kill)
+
+        process = await asyncio.create_subprocess_exec(*command, stdout=PIPE, stderr=PIPE, start_new_session=True)
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            await kill()
+            raise AbricateTimeout(f'command timed out after {timeout} seconds: {command}', command=command,
+                                  timeout=timeout)
+        except asyncio.CancelledError:
+            await kill()
+            raise
+        return CompletedProcess(command, process.returncode, stdout.decode('ascii'), stderr.decode('ascii'))
+
     @cached_property
     def version(self) -> str:
-        command = self._build_cmd(['--version'])
-        subprocess = run(command, stdout=PIPE, stderr=PIPE, encoding='ascii')
-        assert subprocess.returncode == 0, F'command failed: {command},\n stdout: {subprocess.stdout},\n stderr: {subprocess.stderr}'
-        return subprocess.stdout.strip()
+        stdout, stderr = self._run_metadata(['--version'])
+        return stdout.strip()
 
     @cached_property
     def check(self) -> str:
-        command = self._build_cmd(['--check'])
-        subprocess = run(command, stdout=PIPE, stderr=PIPE, encoding='ascii')
-        assert subprocess.returncode == 0, F'command failed: {command},\n stdout: {subprocess.stdout},\n stderr: {subprocess.stderr}'
-        return subprocess.stderr.strip()
+        stdout, stderr = self._run_metadata(['--check'])
+        return stderr.strip()
 
     @cached_property
     def db_versions(self) -> pd.DataFrame:
         if self.__db_versions is None:
-            command = self._build_cmd(['--list'])
-            subprocess = run(command, stdout=PIPE, stderr=PIPE, encoding='ascii')
-            assert subprocess.returncode == 0, F'command failed: {command},\n stdout: {subprocess.stdout},\n stderr: {subprocess.stderr}'
-            databases_table = pd.read_csv(StringIO(subprocess.stdout), sep="\t", index_col=0, parse_dates=['DATE'])
-            self.__db_versions = databases_table
+            stdout, stderr = self._run_metadata(['--list'])
+            self.__db_versions = self._parse_db_versions(stdout)
         return self.__db_versions
 
-    def abricate(self, file: str, db: str, outdir: str = None) -> pd.DataFrame:
-        assert os.path.isfile(file), F'file does not exist: {file}'
-        assert ' ' not in file, F'file path may not contain blanks: {file}'
-        if outdir:
-            assert os.path.isdir(outdir), F'outdir does not exist: {outdir}'
-            assert ' ' not in outdir, F'outdir path may not contain blanks: {outdir}'
+    @staticmethod
+    def _parse_db_versions(stdout: str) -> pd.DataFrame:
+        import pandas as pd
+        return pd.read_csv(StringIO(stdout), sep="\t", index_col=0, parse_dates=['DATE'])
 
+    @cached_property
+    def datadir(self) -> str:
+        stdout, stderr = self._run_metadata(['--help'])
+        match = re.search(r"--datadir.*?default '([^']+)'", stdout + stderr)
+        assert match, f'Could not determine the datadir of abricate from abricate --help:\n{stdout}{stderr}'
+        return match.group(1)
+
+    def db_version(self, db: str) -> str:
+        db_info = self.db_versions.loc[db]
+        return f'SEQUENCES={db_info.SEQUENCES}, DATE={db_info.DATE}'
+
+    def combined_db(self, dbs: [str]) -> str:
+        """
+        Build (once) an ABRicate database that contains the sequences of all dbs.
+
+        :return: the datadir that contains the database 'combined'
+        """
+        assert self.combined_db_dir is not None, 'combined_db_dir must be set to use a combined database!'
+        assert not (self.culls_across_dbs and len(dbs) > 1), \
+            f'{type(self).__name__} cannot combine {dbs=}: abricate culls overlapping hits across the dbs of a ' \
+            f'combined database, so hits of one db would be lost where another db has a better hit. Use ' \
+            f'ABRiannotateBlast for single_pass.'
+        key = combined_db_key({db: self.db_version(db) for db in dbs}, version=self.version)
+        datadir = os.path.join(self.combined_db_dir, key)
+        if os.path.isdir(datadir):
+            return datadir
+
+        logger.info(f'Building combined database of {dbs=} in {datadir}')
+        os.makedirs(self.combined_db_dir, exist_ok=True)
+        # build next to the final location, then rename: concurrent builders never see a half-built database
+        builddir = mkdtemp(dir=self.combined_db_dir, prefix=f'.{key}-')
+        try:
+            write_combined_sequences({db: self._read_db_sequences(db) for db in dbs}, datadir=builddir)
+            self._setupdb(builddir)
+
+            try:
+                os.rename(builddir, datadir)
+            except OSError:
+                # built concurrently by another process
+                assert os.path.isdir(datadir), f'Failed to move combined database to {datadir}'
+        finally:
+            shutil.rmtree(builddir, ignore_errors=True)  # no-op after a successful rename
+        return datadir
+
+    def _setupdb(self, datadir: str):
+        """Index the databases in datadir (abricate --setupdb)"""
+        command = self._build_cmd(['--setupdb'], datadir=datadir)
+        self.retry.call(lambda cancel: self._run_command(command, cancel=cancel), description=' '.join(command))
+
+    def _run_abricate(self, file: str, db: str, datadir: str = None, threads: int = 1, timeout: float = None,
+                      cancel: threading.Event = None) -> (CompletedProcess, dict):
+        """:return: the completed abricate process and its resource usage, see run_measured"""
         command = self._build_cmd(
-            args=['--quiet', '--db', db],
-            file=file
+            args=['--quiet', *(['--threads', str(threads)] if threads > 1 else []), '--db', db],
+            file=file,
+            datadir=datadir
         )
 
         logger.info(' '.join(command))
 
-        subprocess = run(command, stdout=PIPE, stderr=PIPE, encoding='ascii')
+        return run_measured(command, timeout=timeout, cancel=cancel, on_kill=lambda: self._on_kill(command))
+
+    def abricate(self, file: str, db: str, outdir: str = None, datadir: str = None,
+                 metrics: Metrics = None, threads: int = 1, timeout: float = None) -> pd.DataFrame:
+        """
+        :param metrics: record wall time, CPU time and peak memory of the call here
+        :param threads: number of blastn threads (abricate --threads)
+        :param timeout: seconds after which abricate is killed and AbricateTimeout is raised, default: self.retry
+        """
+        timeout = timeout or self.retry.timeout
+        self._check_abricate_args(file=file, outdir=outdir)
+        start = time.perf_counter()
+
+        cache_key, stdout = self._abricate_cache_lookup(file=file, db=db, datadir=datadir)
+        usage, attempts, hedged = {'cpu_s': None, 'max_rss_kb': None}, 0, False
+        cached = stdout is not None
+        if cached:
+            abricate_df = self._abricate_parse(stdout, db=db, metrics=metrics)
+        else:
+            def run(cancel: threading.Event) -> (str, pd.DataFrame, dict):
+                try:
+                    subprocess, usage = self._run_abricate(file=file, db=db, datadir=datadir, threads=threads,
+                                                           timeout=timeout, cancel=cancel)
+                except TimeoutError as e:
+                    raise AbricateTimeout(str(e), db=db, file=file, timeout=timeout)
+                # parsed here, so that output that cannot be parsed is retried too
+                stdout = self._abricate_stdout(subprocess.args, subprocess, db=db, file=file)
+                return stdout, self._abricate_parse(stdout, db=db, metrics=metrics), usage
+
+            size = os.path.getsize(file)
+            (stdout, abricate_df, usage), attempts, hedged = self.retry.call(
+                run, description=f'abricate db={db} (file={file})', db=db, size=size)
+            if attempts == 1 and not hedged:
+                self.retry.record(db, size=size, seconds=time.perf_counter() - start)
+            if cache_key is not None:
+                self.cache.put(cache_key, stdout)
+
+        wall_s = time.perf_counter() - start
+        if outdir:
+            self.__dump(outdir, file=f'db_{db}.original.tsv', content=stdout)
+        if metrics is not None:
+            metrics.add_call(db=db, file=file, cached=cached, threads=threads, wall_s=wall_s, **usage,
+                             n_hits=len(abricate_df), attempts=attempts, hedged=hedged)
+            metrics.count('retries', max(0, attempts - 1))
+            metrics.count('hedged_calls', int(hedged))
+        return abricate_df
 
-        error_message = F'command failed: {command},\n stdout: {subprocess.stdout},\n stderr: {subprocess.stderr}'
-        assert subprocess.stderr == '', error_message
-        assert subprocess.returncode == 0, error_message
+    async def abricate_async(self, file: str, db: str, outdir: str = None, datadir: str = None,
+                             semaphore: asyncio.Semaphore = None, timeout: float = None,
+                             metrics: Metrics = None) -> pd.DataFrame:
+        """
+        Like abricate, but based on an asyncio subprocess.
+
+        :param semaphore: limits the number of concurrent abricate processes
+        :param timeout: seconds after which abricate is killed and AbricateTimeout is raised, default: self.retry
+        :param metrics: record the wall time of the call here (CPU time and memory are not measured)
+        """
+        import asyncio
+        self._check_abricate_args(file=file, outdir=outdir)
+        semaphore = semaphore or asyncio.BoundedSemaphore(1)
+
+        cache_key, stdout = await asyncio.to_thread(self._abricate_cache_lookup, file=file, db=db, datadir=datadir)
+        attempts, hedged = 0, False
+        cached = stdout is not None
+        start = time.perf_counter()
+        if cached:
+            abricate_df = self._abricate_parse(stdout, db=db, metrics=metrics)
+        else:
+            command = await asyncio.to_thread(self._build_cmd, args=['--quiet', '--db', db], file=file, datadir=datadir)
+
+            async def run() -> (str, pd.DataFrame):
+                async with semaphore:
+                    logger.info(' '.join(command))
+                    try:
+                        subprocess = await self._run_async(command, timeout=timeout or self.retry.timeout,
+                                                           on_kill=lambda: self._on_kill(command))
+                    except AbricateTimeout as e:
+                        e.db, e.file = db, file
+                        raise
+                # parsed here, so that output that cannot be parsed is retried too
+                stdout = self._abricate_stdout(command, subprocess, db=db, file=file)
+                return stdout, self._abricate_parse(stdout, db=db, metrics=metrics)
+
+            size = os.path.getsize(file)
+            (stdout, abricate_df), attempts, hedged = await self.retry.call_async(
+                run, description=f'abricate db={db} (file={file})', db=db, size=size)
+            if attempts == 1 and not hedged:
+                self.retry.record(db, size=size, seconds=time.perf_counter() - start)
+            if cache_key is not None:
+                await asyncio.to_thread(self.cache.put, cache_key, stdout)
+
+        wall_s = time.perf_counter() - start
+        if outdir:
+            await asyncio.to_thread(self.__dump, outdir, file=f'db_{db}.original.tsv', content=stdout)
+        if metrics is not None:
+            metrics.add_call(db=db, file=file, cached=cached, threads=1, wall_s=wall_s, cpu_s=None, max_rss_kb=None,
+                             n_hits=len(abricate_df), attempts=attempts, hedged=hedged)
+            metrics.count('retries', max(0, attempts - 1))
+            metrics.count('hedged_calls', int(hedged))
+        return abricate_df
 
+    @staticmethod
+    def _check_abricate_args(file: str, outdir: str = None):
+        assert os.path.isfile(file), F'file does not exist: {file}'
+        assert ' ' not in file, F'file path may not contain blanks: {file}'
         if outdir:
-            self.__dump(outdir, file=f'db_{db}.original.tsv', content=subprocess.stdout)
+            assert os.path.isdir(outdir), F'outdir does not exist: {outdir}'
+            assert ' ' not in outdir, F'outdir path may not contain blanks: {outdir}'
 
-        logger.debug(f'Output:\n{subprocess.stdout}')
-        abricate_df = pd.read_csv(StringIO(subprocess.stdout), sep="\t")
+    def _abricate_cache_lookup(self, file: str, db: str, datadir: str = None) -> (str, str):
+        """:return: cache key (None if there is no cache) and the cached output (None if there is none)"""
+        if self.cache is None:
+            return None, None
+
+        db_version = self.db_version(db) if datadir is None else f'datadir={datadir}'
+        cache_key = self.cache.key(file=file, db=db, db_version=db_version, version=self.version)
+        stdout = self.cache.get(cache_key, file=file)
+        if stdout is not None:
+            logger.info(f'Using cached result for db={db} (file={file}, key={cache_key})')
+        return cache_key, stdout
+
+    @staticmethod
+    def _abricate_stdout(command: [str], subprocess: CompletedProcess, db: str = None, file: str = None) -> str:
+        """:raise AbricateError: if abricate failed, wrote to stderr or its output is malformed (transient)"""
+        if subprocess.returncode != 0 or subprocess.stderr != '':
+            raise AbricateError.from_process(subprocess, db=db, file=file)
+        problem = malformed_output(subprocess.stdout)
+        if problem is not None:
+            raise AbricateError(f'malformed output of {command}: {problem}', command=command, returncode=0,
+                                stdout=subprocess.stdout, stderr=subprocess.stderr, db=db, file=file, transient=True)
+        return subprocess.stdout
+
+    def _abricate_parse(self, stdout: str, db: str, outdir: str = None, metrics: Metrics = None) -> pd.DataFrame:
+        import pandas as pd
+        if outdir:
+            self.__dump(outdir, file=f'db_{db}.original.tsv', content=stdout)
+
+        logger.debug(f'Output:\n{stdout}')
+        with metrics.stage('parse') if metrics else nullcontext():
+            try:
+                abricate_df = pd.read_csv(StringIO(stdout), sep="\t")
+            except (pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+                raise AbricateError(f'Failed to parse the output of db={db}: {e}', stdout=stdout, db=db, transient=True)
         columns = set(abricate_df.columns.tolist())
-        assert columns == expected_columns, f'Columns do not match: {columns}! Please update abricate to v1+'
+        if columns != expected_columns:
+            raise AbricateError(f'Columns do not match: {columns}! Please update abricate to v1+', stdout=stdout, db=db,
+                                transient=True)
 
         return abricate_df
 
     def abriannotate(
             self, gbk: str, db: str, genes_df: pd.DataFrame = None,
-            save_output=True, outdir: str = None, anno_prefix: str = None
+            save_output=True, outdir: str = None, anno_prefix: str = None, gene_index: GeneIndex = None,
+            fasta: str = None, abricate_df: pd.DataFrame = None, return_hits: bool = False
     ) -> (dict, dict):
+        from .gene_index import GeneIndex
+        from .inputs import is_plain_genbank, write_fasta
+        from .results import hits_table
+
         if outdir:
             assert os.path.isdir(outdir), F'outdir does not exist: {outdir}'
             assert ' ' not in outdir, F'outdir path may not contain blanks: {outdir}'
-        if genes_df is None:
+        if genes_df is None and gene_index is None:
             genes_df = self.load_gbk(gbk=gbk)
 
-        abricate_df = self.abricate(file=gbk, db=db, outdir=outdir)
+        if abricate_df is None:
+            with TemporaryDirectory(dir=self.tmpdir) as tempdir:
+                if fasta is None and not is_plain_genbank(gbk):
+                    fasta = os.path.join(tempdir, 'input.fasta')
+                    write_fasta(gbk, fasta)
+                abricate_df = self.abricate(file=fasta or gbk, db=db, outdir=outdir)
+
+        if gene_index is None:
+            gene_index = GeneIndex(genes_df)
+
+        assignments = gene_index.assign(abricate_df)
 
         gene_to_annotations = {}
         annotation_to_description = {}
+        hit_annotations = [None] * len(abricate_df)
+        bad_hits = [False] * len(abricate_df)
 
-        for i, abricate_hit in abricate_df.iterrows():
-            hit_location = abricate_hit.START + abricate_hit.END * 1j  # imaginary number
+        for i, (abricate_hit, best_gene) in enumerate(zip(abricate_df.itertuples(), assignments.itertuples())):
             hit_length = abs(abricate_hit.END - abricate_hit.START)
-
-            # calculate distance between hit and all genes (distance between imaginary numbers = euclidian distance)
-            genes_df['distance'] = (genes_df.location - hit_location).abs().astype(float)
-
-            # pick closest gene
-            best_gene = genes_df.nsmallest(1, 'distance').iloc[0]
             description = f'GENE={abricate_hit.GENE}, RESISTANCE={abricate_hit.RESISTANCE}, ACCESSION={abricate_hit.ACCESSION}, DB={db}'
 
+            if best_gene.gene is None:
+                logger.warning(f'{gbk}:{abricate_hit.SEQUENCE}:{abricate_hit.START}-{abricate_hit.END}:{abricate_hit.GENE}, db={db}\n'
+                               f'\tNo gene to map hit onto!')
+                continue
+
             # print warning if closest gene does not match hit well
             if best_gene.distance > hit_length / 20:
+                bad_hits[i] = True
                 logger.warning(
-                    f'{gbk}:{abricate_hit.SEQUENCE}:{hit_location}:{abricate_hit.GENE}, db={db}\n'
-                    f'\tDistance between closest gene ({best_gene.name}) and hit is large: best_gene.distance={best_gene.distance}'
+                    f'{gbk}:{abricate_hit.SEQUENCE}:{abricate_hit.START}-{abricate_hit.END}:{abricate_hit.GENE}, db={db}\n'
+                    f'\tDistance between closest gene ({best_gene.gene}) and hit is large: '
+                    f'best_gene.distance={best_gene.distance}, best_gene.overlap={best_gene.overlap:.2f}'
                 )
                 if self.skip_bad_hits:
                     continue
@@ -130,15 +489,20 @@ class ABRiannotate:
             if anno_prefix:
                 annotation_name = f'{anno_prefix}{annotation_name}'
 
-            gene_to_annotations[best_gene.name] = gene_to_annotations \
-                .get(best_gene.name, set()) \
+            gene_to_annotations[best_gene.gene] = gene_to_annotations \
+                .get(best_gene.gene, set()) \
                 .union([annotation_name])
             annotation_to_description[annotation_name] = description
+            hit_annotations[i] = annotation_name
 
         if outdir and save_output:
             self.__dump(outdir, file=f'db_{db}.annotations.tsv', content=gene_to_annotations)
             self.__dump(outdir, file=f'db_{db}.descriptions.tsv', content=annotation_to_description)
 
+        if return_hits:
+            hits_df = hits_table(abricate_df, assignments, db=db, annotations=hit_annotations, bad_hits=bad_hits)
+            return gene_to_annotations, annotation_to_description, hits_df
+
         return gene_to_annotations, annotation_to_description
 
     def abriannotate_multidb(
@@ -149,14 +513,196 @@ class ABRiannotate:
             dbs: [str] = None,
             abricate_dir: str = None,
             anno_prefix: str = 'AR:',
-            markdown_file: str = None
+            markdown_file: str = None,
+            max_workers: int = 1,
+            single_pass: bool = False,
+            hits_format: str = None,
+            return_hits: bool = False,
+            n_shards: int = 1,
+            prometheus_file: str = None,
+            incremental: bool = True,
+            cpus: Union[int, CpuBudget] = None,
+            matrix_dir: str = None,
+            results_db: str = None,
+            prefilter: bool = False
+    ) -> (dict, dict):
+        """
+        :param max_workers: number of abricate processes that may run concurrently
+        :param n_shards: split the scaffolds into up to n_shards files of similar total length and run abricate on
+                         each of them, e.g. for very large assemblies. Combine with max_workers.
+        :param prometheus_file: also write the metrics ({genome_identifier}.abricate.metrics.json) to this file in
+                                the Prometheus text format
+        :param incremental: if abricate_dir is given, reuse the results of a previous run for all dbs whose version
+                            and input did not change (see abriannotate.manifest.json in abricate_dir)
+        :param cpus: number of CPUs for all abricate calls together, or a CpuBudget shared with other genomes;
+                     replaces max_workers. Decides how many abricate calls run concurrently and how many threads
+                     (abricate --threads) each of them gets, depending on the number of pending calls and the size
+                     of their dbs.
+        :param matrix_dir: add the annotations of this genome to the presence/absence matrix in this directory
+                           (see PresenceMatrix)
+        :param results_db: also write the hits, gene assignments and versions into this SQLite file (see ResultStore)
+        :param prefilter: skip the abricate calls of dbs that share no k-mer with the genome, i.e. that cannot have
+                          any hit (see prefilter.py). Their sketches are cached in sketch_dir.
+        """
+        assert max_workers >= 1, f'max_workers must be at least 1: {max_workers=}'
+        metrics = Metrics(genome_identifier)
+        tempdir, workdir, dbs, gene_index, fasta, shards = self._prepare_multidb(
+            gbk=gbk, genome_identifier=genome_identifier, outdir=outdir, dbs=dbs, abricate_dir=abricate_dir,
+            hits_format=hits_format, n_shards=n_shards, metrics=metrics)
+        manifest, stored, stale_dbs = self._stored_results(
+            workdir=workdir, dbs=dbs, fasta=fasta, persistent=bool(abricate_dir), incremental=incremental,
+            single_pass=single_pass, metrics=metrics)
+        if prefilter:
+            stale_dbs, skipped = self._prefilter(stale_dbs, fasta=fasta, workdir=workdir, manifest=manifest,
+                                                 metrics=metrics)
+            stored = {**stored, **skipped}
+
+        # with single_pass, one blastn pass covers all dbs, hits are split back into the source dbs later
+        with metrics.stage('combined_db'):
+            datadir = self.combined_db(stale_dbs) if single_pass and stale_dbs else None
+        run_dbs = ([COMBINED_DB] if stale_dbs else []) if single_pass else list(reversed(stale_dbs))
+
+        def run_abricate(job: (str, str), threads: int = 1) -> pd.DataFrame:
+            db, shard = job
+            logger.info(f'Working on db={db} (gbk={gbk}, file={shard}, {threads=})')
+            return self.abricate(file=shard, db=db, outdir=workdir if len(shards) == 1 else None, datadir=datadir,
+                                 metrics=metrics, threads=threads)
+
+        # the abricate calls may run concurrently, results are merged in the order of reversed(dbs) later
+        with metrics.stage('abricate'):
+            results = self._run_jobs(
+                [(db, shard) for db in run_dbs for shard in shards], run_abricate, max_workers=max_workers,
+                cpus=cpus, stale_dbs=stale_dbs)
+        abricate_dfs = self._collect_results(
+            run_dbs=run_dbs, stale_dbs=stale_dbs, shards=shards, results=results, fasta=fasta, workdir=workdir,
+            single_pass=single_pass, manifest=manifest, stored=stored)
+
+        return self._finish_multidb(
+            gbk=gbk, genome_identifier=genome_identifier, outdir=outdir, dbs=dbs, workdir=workdir,
+            gene_index=gene_index, abricate_dfs=abricate_dfs, anno_prefix=anno_prefix, markdown_file=markdown_file,
+            hits_format=hits_format, return_hits=return_hits, metrics=metrics, prometheus_file=prometheus_file,
+            matrix_dir=matrix_dir, results_db=results_db)
+
+    async def abriannotate_multidb_async(
+            self,
+            gbk: str,
+            genome_identifier: str,
+            outdir: str,
+            dbs: [str] = None,
+            abricate_dir: str = None,
+            anno_prefix: str = 'AR:',
+            markdown_file: str = None,
+            max_workers: int = 1,
+            single_pass: bool = False,
+            hits_format: str = None,
+            return_hits: bool = False,
+            n_shards: int = 1,
+            prometheus_file: str = None,
+            incremental: bool = True,
+            matrix_dir: str = None,
+            results_db: str = None,
+            prefilter: bool = False,
+            semaphore: asyncio.Semaphore = None,
+            timeout: float = None
     ) -> (dict, dict):
+        """
+        Like abriannotate_multidb, but without blocking the event loop.
+
+        :param semaphore: limits the number of concurrent abricate processes; share one semaphore between calls to
+                          limit the total over many genomes. Default: asyncio.BoundedSemaphore(max_workers)
+        :param timeout: per abricate call, in seconds
+        """
+        import asyncio
+
+        if semaphore is None:
+            semaphore = asyncio.BoundedSemaphore(max_workers)
+
+        metrics = Metrics(genome_identifier)
+        await self.load_metadata_async(timeout=timeout)
+        tempdir, workdir, dbs, gene_index, fasta, shards = await asyncio.to_thread(
+            self._prepare_multidb, gbk=gbk, genome_identifier=genome_identifier, outdir=outdir, dbs=dbs,
+            abricate_dir=abricate_dir, hits_format=hits_format, n_shards=n_shards, metrics=metrics)
+        manifest, stored, stale_dbs = await asyncio.to_thread(
+            self._stored_results, workdir=workdir, dbs=dbs, fasta=fasta,
+            persistent=bool(abricate_dir), incremental=incremental, single_pass=single_pass, metrics=metrics)
+        if prefilter:
+            stale_dbs, skipped = await asyncio.to_thread(
+                self._prefilter, stale_dbs, fasta=fasta, workdir=workdir, manifest=manifest, metrics=metrics)
+            stored = {**stored, **skipped}
+
+        with metrics.stage('combined_db'):
+            datadir = await asyncio.to_thread(self.combined_db, stale_dbs) if single_pass and stale_dbs else None
+        run_dbs = ([COMBINED_DB] if stale_dbs else []) if single_pass else list(reversed(stale_dbs))
+
+        tasks = [
+            asyncio.ensure_future(self.abricate_async(
+                file=shard, db=db, outdir=workdir if len(shards) == 1 else None, datadir=datadir,
+                semaphore=semaphore, timeout=timeout, metrics=metrics))
+            for db in run_dbs for shard in shards
+        ]
+        try:
+            with metrics.stage('abricate'):
+                results = await asyncio.gather(*tasks)
+        except BaseException:
+            # do not leave abricate processes running if one db failed or the caller cancelled
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        abricate_dfs = self._collect_results(
+            run_dbs=run_dbs, stale_dbs=stale_dbs, shards=shards, results=results, fasta=fasta, workdir=workdir,
+            single_pass=single_pass, manifest=manifest, stored=stored)
+
+        return await asyncio.to_thread(
+            self._finish_multidb, gbk=gbk, genome_identifier=genome_identifier, outdir=outdir, dbs=dbs,
+            workdir=workdir, gene_index=gene_index, abricate_dfs=abricate_dfs, anno_prefix=anno_prefix,
+            markdown_file=markdown_file, hits_format=hits_format, return_hits=return_hits, metrics=metrics,
+            prometheus_file=prometheus_file, matrix_dir=matrix_dir, results_db=results_db)
+
+    def _run_jobs(self, jobs: [(str, str)], run_abricate, max_workers: int, cpus: Union[int, CpuBudget],
+                  stale_dbs: [str]) -> [pd.DataFrame]:
+        """
+        :param jobs: list of (db, shard)
+        :return: the results of run_abricate(job, threads) in the order of jobs
+        """
+        from .scheduler import CpuBudget, db_weights
+
+        if cpus is None:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                return list(executor.map(run_abricate, jobs))
+
+        budget = cpus if isinstance(cpus, CpuBudget) else CpuBudget(cpus)
+        weights = db_weights(self.db_versions, stale_dbs)
+        weights[COMBINED_DB] = sum(weights.values())
+        for db, shard in jobs:
+            budget.add_pending(weights[db])
+
+        def run(job: (str, str)) -> pd.DataFrame:
+            with budget.reserve(weights[job[0]]) as threads:
+                return run_abricate(job, threads=threads)
+
+        # the budget limits the concurrency, start with the largest dbs
+        with ThreadPoolExecutor(max_workers=max(1, min(len(jobs), budget.cpus))) as executor:
+            futures = {job: executor.submit(run, job) for job in sorted(jobs, key=lambda job: -weights[job[0]])}
+            return [futures[job].result() for job in jobs]
+
+    def _prepare_multidb(self, gbk: str, genome_identifier: str, outdir: str, dbs: [str], abricate_dir: str,
+                         hits_format: str, n_shards: int = 1,
+                         metrics: Metrics = None) -> (TemporaryDirectory, str, [str], GeneIndex, str, [str]):
+        from .gene_index import GeneIndex
+        from .inputs import write_fasta
+        from .results import HIT_FORMATS
+        from .sharding import write_shards
+
+        metrics = metrics or Metrics(genome_identifier)
+        assert n_shards >= 1, f'n_shards must be at least 1: {n_shards=}'
+        assert hits_format in [None, *HIT_FORMATS], f'Unknown hits_format: {hits_format}! Choose one of {HIT_FORMATS}'
         if abricate_dir:
             logger.debug(f'Storing raw output of ABRicate here: {abricate_dir=}')
             os.makedirs(abricate_dir, exist_ok=True)
             tempdir, workdir = None, abricate_dir
         else:
-            tempdir = TemporaryDirectory()
+            tempdir = TemporaryDirectory(dir=self.tmpdir)
             workdir = tempdir.name
             logger.debug(f'Created temporary directory: {workdir}')
 
@@ -168,21 +714,145 @@ class ABRiannotate:
         for db in dbs:
             assert db in self.db_versions.index, f'db={db} does not exist. ABRicate has these dbs: {self.db_versions.index.to_list()}'
 
-        genes_df = self.load_gbk(gbk=gbk)
-
+        with metrics.stage('load_gbk'):
+            genes_df = self.load_gbk(gbk=gbk)
+            gene_index = GeneIndex(genes_df)
+        metrics.count('genes', len(genes_df))
+
+        # convert once instead of letting abricate run any2fasta on the gbk for every db, this is also the only
+        # uncompressed copy of the sequences of compressed or GFF3 inputs
+        with metrics.stage('write_fasta'):
+            fasta = os.path.join(workdir, f'{genome_identifier}.fasta')
+            metrics.count('scaffolds', len(write_fasta(gbk, fasta)))
+            shards = write_shards(fasta, n_shards) if n_shards > 1 else [fasta]
+        metrics.count('shards', len(shards))
+
+        return tempdir, workdir, dbs, gene_index, fasta, shards
+
+    def _stored_results(self, workdir: str, dbs: [str], fasta: str, persistent: bool, incremental: bool,
+                        single_pass: bool, metrics: Metrics) -> (ResultManifest, {str: pd.DataFrame}, [str]):
+        """
+        :param persistent: whether workdir is kept after the run, i.e. whether to maintain a manifest
+        :param incremental: whether to reuse the stored results
+        :param single_pass: results of the other mode are not reused
+        :return: the manifest of workdir (None if not persistent), the stored results that are still current and the
+                 dbs that need to be run
+        """
+        if not persistent:
+            return None, {}, dbs
+
+        manifest = ResultManifest(workdir, version=self.version, input_digest=file_digest(fasta),
+                                  engine=type(self).__name__, mode='single_pass' if single_pass else 'per_db')
+        stored = {}
+        for db in dbs:
+            if incremental and manifest.is_current(db, db_version=self.db_version(db)):
+                logger.info(f'Reusing stored result for db={db} (abricate_dir={workdir})')
+                with open(os.path.join(workdir, manifest.result_file(db))) as f:
+                    stored[db] = self._abricate_parse(f.read(), db=db, metrics=metrics)
+        metrics.count('reused_dbs', len(stored))
+
+        # invalidate first, so results of an interrupted run are never mistaken for current ones
+        stale_dbs = [db for db in dbs if db not in stored]
+        for db in stale_dbs:
+            manifest.invalidate(db)
+        manifest.save()
+        return manifest, stored, stale_dbs
+
+    def _prefilter(self, dbs: [str], fasta: str, workdir: str, manifest: ResultManifest,
+                   metrics: Metrics) -> ([str], {str: pd.DataFrame}):
+        """
+        Screen fasta against the k-mer sketches of the dbs. Inputs larger than prefilter.MAX_BASES are not screened.
+
+        :return: the dbs that need to be run and the empty results of the skipped dbs
+        """
+        from .prefilter import DbSketches, MAX_BASES
+
+        size = os.path.getsize(fasta)
+        if size > MAX_BASES:
+            # the size of the FASTA file is close enough to its number of bases
+            logger.info(f'Prefilter: not screening {fasta} ({size} bytes), it shares 11-mers with any db by chance')
+            metrics.count('prefiltered_dbs', 0)
+            return dbs, {}
+
+        if self.__sketches is None:
+            self.__sketches = DbSketches(self.sketch_dir)
+        with metrics.stage('prefilter'):
+            may_hit = self.__sketches.screen(fasta, {db: self.db_version(db) for db in dbs},
+                                             read_sequences=lambda db: list(self._read_db_sequences(db)))
+
+        skipped = {}
+        for db in dbs:
+            if not may_hit[db]:
+                skipped[db] = self._abricate_parse('\t'.join(abricate_columns) + '\n', db=db, outdir=workdir,
+                                                   metrics=metrics)
+                if manifest is not None:
+                    manifest.update(db, db_version=self.db_version(db))
+        metrics.count('prefiltered_dbs', len(skipped))
+        logger.info(f'Prefilter: skipping {len(skipped)} of {len(dbs)} dbs without shared k-mers: {list(skipped)}')
+        return [db for db in dbs if db not in skipped], skipped
+
+    def _collect_results(self, run_dbs: [str], stale_dbs: [str], shards: [str], results: [pd.DataFrame], fasta: str,
+                         workdir: str, single_pass: bool, manifest: ResultManifest,
+                         stored: {str: pd.DataFrame}) -> {str: pd.DataFrame}:
+        abricate_dfs = self._merge_shards(run_dbs=run_dbs, shards=shards, results=results, fasta=fasta, workdir=workdir)
+        if single_pass and stale_dbs:
+            abricate_dfs = split_hits(abricate_dfs[COMBINED_DB], stale_dbs)
+            for db, abricate_df in abricate_dfs.items():
+                self.__dump(workdir, file=f'db_{db}.original.tsv', content=abricate_df.to_csv(sep='\t', index=False))
+
+        if manifest is not None:
+            for db in stale_dbs:
+                manifest.update(db, db_version=self.db_version(db))
+            manifest.save()
+
+        return {**stored, **abricate_dfs}
+
+    def _merge_shards(self, run_dbs: [str], shards: [str], results: [pd.DataFrame], fasta: str,
+                      workdir: str) -> {str: pd.DataFrame}:
+        """
+        :param results: output of abricate for each db in run_dbs and each shard, in this order
+        :return: maps the dbs to the output of abricate as if it had been run on fasta
+        """
+        from .sharding import merge_shard_hits
+
+        if len(shards) == 1:
+            return dict(zip(run_dbs, results))
+
+        abricate_dfs = {}
+        for i, db in enumerate(run_dbs):
+            abricate_df = merge_shard_hits(results[i * len(shards):(i + 1) * len(shards)], file=fasta)
+            self.__dump(workdir, file=f'db_{db}.original.tsv', content=abricate_df.to_csv(sep='\t', index=False))
+            abricate_dfs[db] = abricate_df
+        return abricate_dfs
+
+    def _finish_multidb(self, gbk: str, genome_identifier: str, outdir: str, dbs: [str], workdir: str,
+                        gene_index: GeneIndex, abricate_dfs: {str: pd.DataFrame}, anno_prefix: str,
+                        markdown_file: str, hits_format: str, return_hits: bool, metrics: Metrics = None,
+                        prometheus_file: str = None, matrix_dir: str = None,
+                        results_db: str = None) -> (dict, dict):
+        from .results import concat_hits, write_hits
+
+        metrics = metrics or Metrics(genome_identifier)
         gene_to_annotations = {}
         annotation_to_description = {}
+        hits_dfs = []
 
         for db in reversed(dbs):
-            logger.info(f'Working on db={db} (gbk={gbk})')
-
-            new_gene_to_annotations, new_annotation_to_description = self.abriannotate(
-                gbk=gbk, db=db, genes_df=genes_df, save_output=False, outdir=workdir, anno_prefix=anno_prefix)
+            with metrics.stage('mapping'):
+                new_gene_to_annotations, new_annotation_to_description, hits_df = self.abriannotate(
+                    gbk=gbk, db=db, gene_index=gene_index, save_output=False, outdir=workdir, anno_prefix=anno_prefix,
+                    abricate_df=abricate_dfs[db], return_hits=True)
+
+            with metrics.stage('merge'):
+                gene_to_annotations = self.__merge_dicts(
+                    old=gene_to_annotations, new=new_gene_to_annotations, replace=self.merge_annotations
+                )
+                annotation_to_description.update(new_annotation_to_description)
+            hits_dfs.append(hits_df)
 
-            gene_to_annotations = self.__merge_dicts(
-                old=gene_to_annotations, new=new_gene_to_annotations, replace=self.merge_annotations
-            )
-            annotation_to_description.update(new_annotation_to_description)
+            metrics.count_db(db, 'hits', len(hits_df))
+            metrics.count_db(db, 'bad_hits', int(hits_df.bad_hit.sum()))
+            metrics.count_db(db, 'annotated_genes', len(new_gene_to_annotations))
 
         used_annotations = set(a for as_ in gene_to_annotations.values() for a in as_)
         obsolete_annotations = {a for a in annotation_to_description if a not in used_annotations}
@@ -196,33 +866,53 @@ class ABRiannotate:
             for a in as_:
                 assert a in annotation_to_description, f'Failed to describe annotation: {a}'
 
-        self.__dump(outdir, file=f'{genome_identifier}.abricate.annotations.AR',
-                    content=gene_to_annotations, values_are_lists=True)
-        self.__dump(outdir, file=f'{genome_identifier}.abricate.descriptions.AR',
-                    content=annotation_to_description)
+        with metrics.stage('dump'):
+            self.__dump(outdir, file=f'{genome_identifier}.abricate.annotations.AR',
+                        content=gene_to_annotations, values_are_lists=True)
+            self.__dump(outdir, file=f'{genome_identifier}.abricate.descriptions.AR',
+                        content=annotation_to_description)
 
-        markdown = create_markdown(self.version, genome_identifier=genome_identifier, dbs=dbs,
-                                   n_genes=len(gene_to_annotations), anno_type=anno_prefix.strip(':_-'))
-        if markdown_file:
-            inject_markdown(markdown_file, markdown)
-        else:
-            self.__dump(outdir, file=f'{genome_identifier}.abricate.summary.md', content=markdown)
+            markdown = create_markdown(self.version, genome_identifier=genome_identifier, dbs=dbs,
+                                       n_genes=len(gene_to_annotations), anno_type=anno_prefix.strip(':_-'))
+            if markdown_file:
+                inject_markdown(markdown_file, markdown)
+            else:
+                self.__dump(outdir, file=f'{genome_identifier}.abricate.summary.md', content=markdown)
+
+        with metrics.stage('hits_table'):
+            hits_df = concat_hits(hits_dfs, genome_identifier=genome_identifier)
+            if hits_format:
+                write_hits(hits_df, os.path.join(outdir, f'{genome_identifier}.abricate.hits.{hits_format}'), hits_format)
+
+        if matrix_dir:
+            from .matrix import PresenceMatrix
+            with metrics.stage('matrix'):
+                PresenceMatrix(matrix_dir).append(genome_identifier, annotation_to_description)
+        if results_db:
+            from .store import ResultStore
+            with metrics.stage('results_db'):
+                ResultStore(results_db).write(
+                    genome_identifier, hits_df, version=self.version,
+                    db_versions={db: self.db_version(db) for db in dbs}, gbk=os.path.abspath(gbk),
+                    n_genes=len(gene_to_annotations), n_annotations=len(annotation_to_description))
+
+        metrics.count('hits', len(hits_df))
+        metrics.count('bad_hits', int(hits_df.bad_hit.sum()))
+        metrics.count('annotated_genes', len(gene_to_annotations))
+        metrics.count('annotations', len(annotation_to_description))
+        metrics.write_json(os.path.join(outdir, f'{genome_identifier}.abricate.metrics.json'))
+        if prometheus_file:
+            metrics.write_prometheus(prometheus_file)
+
+        if return_hits:
+            return gene_to_annotations, annotation_to_description, hits_df
 
         return gene_to_annotations, annotation_to_description
 
     def load_gbk(self, gbk) -> pd.DataFrame:
-        genes_df = pd.DataFrame(columns=['location', 'scf_id', 'strand'])
-        with open(gbk) as input_handle, warnings.catch_warnings():
-            warnings.simplefilter('ignore', BiopythonWarning)
-            for scf in SeqIO.parse(input_handle, "genbank"):
-                for f in scf.features:
-                    if 'locus_tag' in f.qualifiers:
-                        genes_df.loc[f.qualifiers['locus_tag'][0]] = [
-                            f.location.nofuzzy_start + f.location.nofuzzy_end * 1j,  # imaginary number
-                            scf.id,
-                            '+' if f.strand else '-'
-                        ]
-        return genes_df
+        """:param gbk: GenBank or GFF3 with a ##FASTA section, optionally gzip or bgzip compressed"""
+        from .inputs import load_genes
+        return load_genes(gbk)
 
     @staticmethod
     def __dump(outdir: str, file: str, content: Union[str, dict, pd.DataFrame], values_are_lists: bool = False):
@@ -234,7 +924,7 @@ class ABRiannotate:
             elif type(content) is dict:
                 content = '\n'.join(f"{k}\t{v}" for k, v in content.items())
                 f.write(content)
-            elif type(content) is pd.DataFrame:
+            elif hasattr(content, 'to_csv'):  # pd.DataFrame
                 content.to_csv(f, sep='\t')
             else:
                 raise AssertionError(f'Cannot dump content of unknown type: {type(content)}')
@@ -253,3 +943,24 @@ class ABRiannotate:
     @staticmethod
     def filter_string(string: str, allowed_chars=':()_-/') -> str:
         return ''.join(char for char in string if char.isalnum() or char in allowed_chars)
+
+
+# the inputs and outputs of abriannotate_multidb that a job, not the command line of a runner, determines
+_JOB_ARGS = {'self', 'gbk', 'genome_identifier', 'outdir', 'return_hits'}
+
+
+def split_options(options: dict) -> (dict, dict):
+    """
+    Split the options of a command line runner (e.g. serve_runner) into those of the ABRiannotate constructor
+    (e.g. cache_dir, timeout) and those passed on to abriannotate_multidb (e.g. dbs, cpus).
+
+    :return: the constructor options and the abriannotate_multidb options
+    """
+    import inspect
+
+    engine_args = set(inspect.signature(ABRiannotate.__init__).parameters) - {'self'}
+    multidb_args = set(inspect.signature(ABRiannotate.abriannotate_multidb).parameters) - _JOB_ARGS
+    unknown = set(options) - engine_args - multidb_args
+    assert not unknown, f'Unknown options: {sorted(unknown)}'
+    return ({k: v for k, v in options.items() if k in engine_args},
+            {k: v for k, v in options.items() if k not in engine_args})
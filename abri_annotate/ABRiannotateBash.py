@@ -1,4 +1,6 @@
-from .ABRiannotate import ABRiannotate, os, logger
+import shutil
+
+from .ABRiannotate import ABRiannotate, os, logger, split_options
 
 
 class ABRiannotateBash(ABRiannotate):
@@ -8,9 +10,12 @@ class ABRiannotateBash(ABRiannotate):
         self.abricate_path = abricate_path
         super().__init__(*args, **kwargs)
 
-    def _build_cmd(self, args: [str], file: str = None) -> [str]:
+    def _build_cmd(self, args: [str], file: str = None, datadir: str = None) -> [str]:
         cmd = list.copy(self.abricate_path)
 
+        if datadir is not None:
+            cmd.extend(['--datadir', datadir])
+
         cmd.extend(args)
 
         if file is not None:
@@ -19,6 +24,15 @@ class ABRiannotateBash(ABRiannotate):
 
         return cmd
 
+    def _metadata_identity(self) -> str:
+        executable = shutil.which(self.abricate_path[0])
+        mtime = None if executable is None else os.stat(executable).st_mtime_ns
+        return f'{" ".join(self.abricate_path)} ({executable=}, {mtime=})'
+
+    def _read_db_sequences(self, db: str) -> [str]:
+        with open(os.path.join(self.datadir, db, 'sequences')) as f:
+            yield from f
+
 
 def runner(
         abricate_path: [str],
@@ -30,26 +44,178 @@ def runner(
         merge_annotations: bool = False,
         verbose: bool = True,
         skip_bad_hits: bool = False,
+        max_workers: int = 1,
+        cpus: int = None,
+        cache_dir: str = None,
+        cache_max_mb: float = 1024,
+        metadata_cache_dir: str = None,
+        metadata_ttl: float = 24 * 60 * 60,
+        refresh_metadata: bool = False,
+        single_pass: bool = False,
+        combined_db_dir: str = None,
+        hits_format: str = None,
+        n_shards: int = 1,
+        incremental: bool = True,
+        abricate_dir: str = None,
+        matrix_dir: str = None,
+        results_db: str = None,
+        prefilter: bool = False,
+        sketch_dir: str = None,
+        timeout: float = None,
+        retries: int = 0,
+        hedge: float = None,
+        prometheus_file: str = None,
 ):
     abr = ABRiannotateBash(
         abricate_path=abricate_path,
         merge_annotations=merge_annotations,
-        skip_bad_hits=skip_bad_hits
+        skip_bad_hits=skip_bad_hits,
+        cache_dir=cache_dir,
+        cache_max_mb=cache_max_mb,
+        metadata_cache_dir=metadata_cache_dir,
+        metadata_ttl=metadata_ttl,
+        refresh_metadata=refresh_metadata,
+        combined_db_dir=combined_db_dir,
+        sketch_dir=sketch_dir,
+        timeout=timeout,
+        retries=retries,
+        hedge=hedge
     )
 
     abr.init_outdir_logging(outdir, genome_identifier, logfile=verbose)
 
-    gta, atd = abr.abriannotate_multidb(gbk=gbk, genome_identifier=genome_identifier,
-                                         dbs=dbs, outdir=outdir, markdown_file=markdown_file)
+    gta, atd = abr.abriannotate_multidb(gbk=gbk, genome_identifier=genome_identifier, dbs=dbs, outdir=outdir,
+                                         markdown_file=markdown_file, max_workers=max_workers, cpus=cpus,
+                                         single_pass=single_pass, hits_format=hits_format, n_shards=n_shards,
+                                         prometheus_file=prometheus_file, incremental=incremental,
+                                         abricate_dir=abricate_dir, matrix_dir=matrix_dir,
+                                         results_db=results_db, prefilter=prefilter)
 
     logger.info(f'Success! ABRicate found {len(atd)} annotations for {len(gta)} genes.')
 
 
+def batch_runner(
+        abricate_path: [str],
+        manifest: str,
+        dbs: [str] = None,
+        merge_annotations: bool = False,
+        verbose: bool = True,
+        skip_bad_hits: bool = False,
+        max_workers: int = 1,
+        cpus: int = None,
+        cache_dir: str = None,
+        cache_max_mb: float = 1024,
+        metadata_cache_dir: str = None,
+        metadata_ttl: float = 24 * 60 * 60,
+        refresh_metadata: bool = False,
+        single_pass: bool = False,
+        combined_db_dir: str = None,
+        hits_format: str = None,
+        n_shards: int = 1,
+        incremental: bool = True,
+        abricate_dir: str = None,
+        matrix_dir: str = None,
+        results_db: str = None,
+        prefilter: bool = False,
+        sketch_dir: str = None,
+        timeout: float = None,
+        retries: int = 0,
+        hedge: float = None,
+        processes: int = None,
+        report: str = None,
+):
+    from .batch import read_manifest, run_batch, write_report
+
+    abr = ABRiannotateBash(
+        abricate_path=abricate_path,
+        merge_annotations=merge_annotations,
+        skip_bad_hits=skip_bad_hits,
+        cache_dir=cache_dir,
+        cache_max_mb=cache_max_mb,
+        metadata_cache_dir=metadata_cache_dir,
+        metadata_ttl=metadata_ttl,
+        refresh_metadata=refresh_metadata,
+        combined_db_dir=combined_db_dir,
+        sketch_dir=sketch_dir,
+        timeout=timeout,
+        retries=retries,
+        hedge=hedge
+    )
+
+    results = run_batch(abr, read_manifest(manifest), processes=processes, verbose=verbose,
+                        dbs=dbs, max_workers=max_workers, cpus=cpus, single_pass=single_pass, hits_format=hits_format,
+                        n_shards=n_shards, incremental=incremental, abricate_dir=abricate_dir, matrix_dir=matrix_dir,
+                        results_db=results_db, prefilter=prefilter)
+
+    if report:
+        write_report(results, report)
+
+
+def serve_runner(
+        abricate_path: [str],
+        processes: int = 1,
+        max_queue: int = 100,
+        max_finished: int = 1000,
+        host: str = '127.0.0.1',
+        port: int = 8765,
+        socket: str = None,
+        verbose: bool = True,
+        **options,
+):
+    """:param options: options of ABRiannotate (e.g. cache_dir, timeout) and abriannotate_multidb (e.g. dbs, cpus)"""
+    from .server import serve
+
+    engine_options, multidb_options = split_options(options)
+    abr = ABRiannotateBash(abricate_path=abricate_path, **engine_options)
+
+    serve(abr, host=host, port=port, socket=socket, processes=processes, max_queue=max_queue,
+          max_finished=max_finished, verbose=verbose, **multidb_options)
+
+
+def worker_runner(
+        abricate_path: [str],
+        queue_dir: str,
+        heartbeat: float = 30,
+        stale_after: float = 300,
+        max_attempts: int = 3,
+        poll: float = 5,
+        wait: bool = False,
+        verbose: bool = True,
+        **options,
+):
+    """:param options: options of ABRiannotate (e.g. cache_dir, timeout) and abriannotate_multidb (e.g. dbs, cpus)"""
+    from .work_queue import run_worker
+
+    engine_options, multidb_options = split_options(options)
+    abr = ABRiannotateBash(abricate_path=abricate_path, **engine_options)
+
+    run_worker(abr, queue_dir=queue_dir, heartbeat=heartbeat, stale_after=stale_after, max_attempts=max_attempts,
+               poll=poll, wait=wait, verbose=verbose, **multidb_options)
+
+
 def main():
     from fire import Fire
 
     Fire(runner)
 
 
+def main_batch():
+    from fire import Fire
+
+    Fire(batch_runner)
+
+
+def main_serve():
+    from fire import Fire
+
+    Fire(serve_runner)
+
+
+def main_worker():
+    from fire import Fire
+
+    Fire(worker_runner)
+
+
 if __name__ == '__main__':
     main()
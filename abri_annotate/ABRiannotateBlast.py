@@ -0,0 +1,268 @@
+import shutil
+import time
+import threading
+from subprocess import CompletedProcess
+from tempfile import TemporaryDirectory
+
+from .ABRiannotate import ABRiannotate, os, logger, abricate_columns
+from .combined_db import COMBINED_DB
+from .metrics import run_measured
+
+COLUMNS = abricate_columns
+BLAST_FIELDS = ['qseqid', 'qstart', 'qend', 'qlen', 'sseqid', 'sstart', 'send', 'slen', 'sstrand', 'evalue', 'length',
+                'pident', 'gaps', 'gapopen', 'stitle', 'bitscore']
+
+
+def coverage_map(start: int, end: int, length: int, broken: bool, scale: int = 15) -> str:
+    """Like the COVERAGE_MAP of abricate, e.g. '===============' or '====/==.......'"""
+    x, y = int(start / length * scale), int(end / length * scale)
+    symbols = []
+    for i in range(scale):
+        symbols.append('=' if x <= i <= y else '.')
+        if broken and i == scale // 2:
+            symbols.append('/')
+    return ''.join(symbols)
+
+
+def cull_hits(hits: [dict], limit: int = 1) -> [dict]:
+    """
+    Like blastn -culling_limit, but separately for each source db of a combined database: drop hits whose query range
+    is enveloped by the ranges of at least limit higher-scoring hits of the same db on the same query sequence.
+
+    :param hits: blastn hits, dicts of BLAST_FIELDS
+    """
+    groups = {}
+    for hit in hits:
+        groups.setdefault((hit['qseqid'], hit['sseqid'].split('~~~', 1)[0]), []).append(hit)
+
+    kept = []
+    for group in groups.values():
+        survivors = []  # (qstart, qend, bitscore), highest bitscore first
+        for hit in sorted(group, key=lambda hit: -float(hit['bitscore'])):
+            qstart, qend, bitscore = int(hit['qstart']), int(hit['qend']), float(hit['bitscore'])
+            n_envelop = sum(s > bitscore and start <= qstart and end >= qend for start, end, s in survivors)
+            if n_envelop < limit:
+                survivors.append((qstart, qend, bitscore))
+                kept.append(hit)
+    return kept
+
+
+def blast_to_abricate(blast_output: str, file: str, mincov: float = 80, cull: bool = False) -> str:
+    """
+    Convert the tabular output of blastn (-outfmt '6 {BLAST_FIELDS}') into the output of abricate: drop hits that
+    cover less than mincov percent of the reference gene, describe the hits as abricate does and sort them by
+    sequence and start.
+
+    The reference sequences are named as in abricate databases: >{db}~~~{gene}~~~{accession}~~~{resistance} {product}
+
+    :param cull: apply cull_hits, for the output of a combined database that blastn did not cull
+    """
+    hits = [dict(zip(BLAST_FIELDS, line.split('\t'))) for line in blast_output.splitlines() if line]
+    if cull:
+        hits = cull_hits(hits)
+
+    rows = []
+    for hit in hits:
+        length, gaps, gapopen, slen = int(hit['length']), int(hit['gaps']), int(hit['gapopen']), int(hit['slen'])
+        coverage = 100 * (length - gaps) / slen
+        if coverage < mincov:
+            continue
+
+        sstart, send = int(hit['sstart']), int(hit['send'])
+        if sstart > send:
+            sstart, send = send, sstart
+        database, gene, accession, resistance = (hit['sseqid'].split('~~~') + [''] * 4)[:4]
+        title = hit['stitle'].split(maxsplit=1)
+        product = title[1] if len(title) > 1 else ''
+        rows.append([
+            file, hit['qseqid'], int(hit['qstart']), int(hit['qend']), '-' if hit['sstrand'] == 'minus' else '+',
+            gene, f'{sstart}-{send}/{slen}', coverage_map(sstart, send, slen, broken=gapopen > 0),
+            f'{gapopen}/{gaps}', f'{coverage:.2f}', f'{float(hit["pident"]):.2f}', database, accession, product,
+            resistance
+        ])
+
+    rows.sort(key=lambda row: (row[1], row[2]))
+    return '\n'.join('\t'.join(map(str, row)) for row in [COLUMNS] + rows) + '\n'
+
+
+class ABRiannotateBlast(ABRiannotate):
+    """
+    Runs blastn on the ABRicate databases directly, without the abricate wrapper (Perl, any2fasta, setup), and
+    applies the coverage and identity filters of abricate in Python. Produces the same columns as abricate.
+
+    :param datadir: directory of the ABRicate databases, i.e. the output of abricate --datadir
+    :param blastn: command of blastn, e.g. ['conda', 'run', '-n', 'abricate', 'blastn']
+    :param makeblastdb: command of makeblastdb, only needed to build combined databases
+    :param minid: minimum identity in percent (abricate --minid)
+    :param mincov: minimum coverage of the reference gene in percent (abricate --mincov)
+    """
+    culls_across_dbs = False
+
+    def __init__(self, *args, datadir: str, blastn: [str] = 'blastn', makeblastdb: [str] = 'makeblastdb',
+                 minid: float = 80, mincov: float = 80, **kwargs):
+        self.blastn = [blastn] if type(blastn) is str else blastn
+        self.makeblastdb = [makeblastdb] if type(makeblastdb) is str else makeblastdb
+        self.minid = minid
+        self.mincov = mincov
+        super().__init__(*args, **kwargs)
+        self.datadir = os.path.abspath(datadir)  # replaces the cached property, no need to ask abricate --help
+        assert os.path.isdir(self.datadir), f'datadir does not exist: {self.datadir}'
+
+    def _build_cmd(self, args: [str], file: str = None, datadir: str = None) -> [str]:
+        raise NotImplementedError('ABRiannotateBlast does not run abricate')
+
+    def _metadata_identity(self) -> str:
+        executable = shutil.which(self.blastn[0])
+        mtime = None if executable is None else os.stat(executable).st_mtime_ns
+        return f'{" ".join(self.blastn)} ({executable=}, {mtime=}, datadir={self.datadir}, minid={self.minid}, ' \
+               f'mincov={self.mincov})'
+
+    def _execute_metadata(self, args: [str]) -> (str, str):
+        """
+        Emulate the output of abricate --version and --list. The version includes minid and mincov, so that cached
+        results (see ResultCache) and stored results (see ResultManifest) of other thresholds are not reused.
+        """
+        if args == ['--version']:
+            subprocess = self._run_command([*self.blastn, '-version'])
+            # e.g. 'blastn: 2.14.0+'
+            return f'{subprocess.stdout.splitlines()[0].replace(":", "")} (abricate databases, minid={self.minid}, ' \
+                   f'mincov={self.mincov})\n', ''
+        if args == ['--list']:
+            lines = ['DATABASE\tSEQUENCES\tDBTYPE\tDATE']
+            for db in sorted(os.listdir(self.datadir)):
+                sequences = os.path.join(self.datadir, db, 'sequences')
+                if os.path.isfile(sequences):
+                    with open(sequences) as f:
+                        n_sequences = sum(line.startswith('>') for line in f)
+                    date = time.strftime('%Y-%b-%d', time.localtime(os.path.getmtime(sequences)))
+                    lines.append(f'{db}\t{n_sequences}\tnucl\t{date}')
+            return '\n'.join(lines) + '\n', ''
+        if args == ['--check']:
+            missing = [cmd[0] for cmd in [self.blastn, self.makeblastdb] if shutil.which(cmd[0]) is None]
+            return '', f'Missing: {", ".join(missing)}' if missing else 'OK.'
+        raise NotImplementedError(f'Unsupported arguments: {args}')
+
+    async def _run_metadata_async(self, args: [str], timeout: float = None) -> (str, str):
+        return self._run_metadata(args)
+
+    def _read_db_sequences(self, db: str) -> [str]:
+        with open(os.path.join(self.datadir, db, 'sequences')) as f:
+            yield from f
+
+    def _setupdb(self, datadir: str):
+        for db in os.listdir(datadir):
+            sequences = os.path.join(datadir, db, 'sequences')
+            if os.path.isfile(sequences):
+                command = [*self.makeblastdb, '-in', sequences, '-title', db, '-dbtype', 'nucl', '-hash_index',
+                           '-out', sequences]
+                self.retry.call(lambda cancel: self._run_command(command, cancel=cancel), description=' '.join(command))
+
+    def _blastn_cmd(self, query: str, db: str, datadir: str = None, threads: int = 1) -> [str]:
+        # the combined database is culled per source db afterwards (cull_hits), like separate runs of each db
+        culling = [] if db == COMBINED_DB else ['-culling_limit', '1']
+        return [
+            *self.blastn, '-task', 'blastn', '-dust', 'no', '-evalue', '1E-20', *culling, '-max_target_seqs', '10000', '-perc_identity', str(self.minid), '-num_threads', str(threads),
+            '-query', query, '-db', os.path.join(datadir or self.datadir, db, 'sequences'),
+            '-outfmt', f'6 {" ".join(BLAST_FIELDS)}'
+        ]
+
+    def _run_abricate(self, file: str, db: str, datadir: str = None, threads: int = 1, timeout: float = None,
+                      cancel: threading.Event = None) -> (CompletedProcess, dict):
+        from .inputs import write_fasta
+
+        with TemporaryDirectory(dir=self.tmpdir) as tempdir:
+            query = file
+            with open(file, 'rb') as f:
+                is_fasta = f.read(1) == b'>'
+            if not is_fasta:
+                query = os.path.join(tempdir, 'query.fasta')
+                write_fasta(file, query)
+
+            command = self._blastn_cmd(query, db=db, datadir=datadir, threads=threads)
+            logger.info(' '.join(command))
+            subprocess, usage = run_measured(command, timeout=timeout, cancel=cancel)
+
+        stdout = blast_to_abricate(subprocess.stdout, file=file, mincov=self.mincov, cull=db == COMBINED_DB) \
+            if subprocess.returncode == 0 else subprocess.stdout
+        return CompletedProcess(command, subprocess.returncode, stdout, subprocess.stderr), usage
+
+    async def abricate_async(self, file: str, db: str, outdir: str = None, datadir: str = None,
+                             semaphore=None, timeout: float = None, metrics=None):
+        """Runs abricate in a thread."""
+        import asyncio
+
+        async with semaphore or asyncio.BoundedSemaphore(1):
+            return await asyncio.to_thread(self.abricate, file=file, db=db, outdir=outdir, datadir=datadir,
+                                           metrics=metrics, timeout=timeout)
+
+
+def runner(
+        datadir: str,
+        gbk: str,
+        genome_identifier: str,
+        outdir: str,
+        blastn: [str] = 'blastn',
+        makeblastdb: [str] = 'makeblastdb',
+        minid: float = 80,
+        mincov: float = 80,
+        markdown_file: str = None,
+        dbs: [str] = None,
+        merge_annotations: bool = False,
+        verbose: bool = True,
+        skip_bad_hits: bool = False,
+        max_workers: int = 1,
+        cpus: int = None,
+        cache_dir: str = None,
+        cache_max_mb: float = 1024,
+        single_pass: bool = False,
+        combined_db_dir: str = None,
+        hits_format: str = None,
+        n_shards: int = 1,
+        incremental: bool = True,
+        abricate_dir: str = None,
+        matrix_dir: str = None,
+        results_db: str = None,
+        prefilter: bool = False,
+        sketch_dir: str = None,
+        timeout: float = None,
+        retries: int = 0,
+        hedge: float = None,
+        prometheus_file: str = None,
+):
+    abr = ABRiannotateBlast(
+        datadir=datadir,
+        blastn=blastn,
+        makeblastdb=makeblastdb,
+        minid=minid,
+        mincov=mincov,
+        merge_annotations=merge_annotations,
+        skip_bad_hits=skip_bad_hits,
+        cache_dir=cache_dir,
+        cache_max_mb=cache_max_mb,
+        combined_db_dir=combined_db_dir,
+        sketch_dir=sketch_dir,
+        timeout=timeout,
+        retries=retries,
+        hedge=hedge
+    )
+
+    abr.init_outdir_logging(outdir, genome_identifier, logfile=verbose)
+
+    gta, atd = abr.abriannotate_multidb(gbk=gbk, genome_identifier=genome_identifier, dbs=dbs, outdir=outdir,
+                                         markdown_file=markdown_file, max_workers=max_workers, cpus=cpus,
+                                         single_pass=single_pass, hits_format=hits_format, n_shards=n_shards,
+                                         prometheus_file=prometheus_file, incremental=incremental,
+                                         abricate_dir=abricate_dir, matrix_dir=matrix_dir, results_db=results_db,
+                                         prefilter=prefilter)
+
+    logger.info(f'Success! ABRicate found {len(atd)} annotations for {len(gta)} genes.')
+
+
+def main():
+    from fire import Fire
+
+    Fire(runner)
+
+
+if __name__ == '__main__':
+    main()
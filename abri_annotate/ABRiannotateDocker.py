@@ -1,33 +1,183 @@
-from .ABRiannotate import ABRiannotate, os, logger
+import atexit
+import shutil
+import uuid
+from threading import Lock
+from functools import cached_property
+from subprocess import run, PIPE
+from tempfile import TemporaryDirectory, mkdtemp
+
+from .ABRiannotate import ABRiannotate, os, logger, split_options
 
 
 class ABRiannotateDocker(ABRiannotate):
-    def __init__(self, *args, abricate_docker_image: str, docker_cmd: str = 'docker', uid_gid: str = None, **kwargs):
+    def __init__(self, *args, abricate_docker_image: str, docker_cmd: str = 'docker', uid_gid: str = None,
+                 session: bool = False, session_dir: str = None, **kwargs):
         self.abricate_docker_image = abricate_docker_image
         self.docker_cmd = docker_cmd
         self.uid_gid = uid_gid
+        self.session = session
+        self.session_dir = None if session_dir is None else os.path.abspath(session_dir)
+        self._container = None
+        self._session_lock = Lock()
         super().__init__(*args, **kwargs)
+        self._init_staging()
 
-    def _build_cmd(self, args: [str], file: str = None) -> [str]:
-        cmd = [self.docker_cmd, 'run', '--rm']
-        if self.uid_gid:
-            self.cmd.extend(['--user', self.uid_gid])
+    def _init_staging(self):
+        # in session mode, temporary workdirs (e.g. the FASTA of abriannotate_multidb) are created in a staging
+        # directory that is always mounted at /work, and other inputs are linked into it (see _stage). The container
+        # is never restarted for a new mount: other threads may be running abricate in it.
+        self._staging = TemporaryDirectory(prefix='abriannotate-session-') if self.session else None
+        self.tmpdir = self._staging.name if self.session else None
+        self._staged = {}  # (file, size, mtime): path in the staging directory
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getstate__(self):
+        # running containers belong to the process that started them
+        state = self.__dict__.copy()
+        state.update(_container=None, _session_lock=None, _staging=None, tmpdir=None, _staged=None)
+        return state
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._session_lock = Lock()
+        self._init_staging()
+
+    def _build_cmd(self, args: [str], file: str = None, datadir: str = None) -> [str]:
         if file is not None:
             file = os.path.abspath(file)
             assert os.path.isfile(file), f'File does not exist: {file}'
-            dirname = os.path.dirname(file)
-            cmd.extend(['-v', f'{dirname}:/data:z'])
 
-        cmd.append(self.abricate_docker_image)
+        if self.session:
+            if file is not None and not self._in_staging(file) and not self._in_session_dir(file):
+                file = self._stage(file)
+            cmd = [self.docker_cmd, 'exec', self._session_container()]
+        else:
+            # named, so that _on_kill can stop the container: killing the docker client does not
+            cmd = [self.docker_cmd, 'run', '--rm', '--name', f'abriannotate-{uuid.uuid4().hex}']
+            if self.uid_gid:
+                cmd.extend(['--user', self.uid_gid])
+            if file is not None:
+                cmd.extend(['-v', f'{os.path.dirname(file)}:/data:z'])
+            if datadir is not None:
+                cmd.extend(['-v', f'{self.combined_db_dir}:/combined:z'])
+            cmd.append(self.abricate_docker_image)
+
         cmd.append('abricate')
+        if datadir is not None:
+            # combined databases (see ABRiannotate.combined_db) live in combined_db_dir, mounted at /combined
+            datadir = os.path.abspath(datadir)
+            assert datadir.startswith(self.combined_db_dir + os.sep), f'datadir must be in {self.combined_db_dir}'
+            cmd.extend(['--datadir', f'/combined/{os.path.relpath(datadir, self.combined_db_dir)}'])
         cmd.extend(args)
         if file is not None:
-            basename = os.path.basename(file)
-            cmd.append(f'/data/{basename}')
+            if self._in_staging(file):
+                cmd.append(f'/work/{os.path.relpath(file, self.tmpdir)}')
+            elif self._in_session_dir(file):
+                cmd.append(f'/data/{os.path.relpath(file, self.session_dir)}')
+            else:
+                cmd.append(f'/data/{os.path.basename(file)}')
 
         return cmd
 
+    def _on_kill(self, command: [str]):
+        if command[:2] != [self.docker_cmd, 'run'] or '--name' not in command:
+            return
+        name = command[command.index('--name') + 1]
+        subprocess = run([self.docker_cmd, 'kill', name], stdout=PIPE, stderr=PIPE, encoding='ascii')
+        if subprocess.returncode != 0:
+            # e.g. the container had not been created yet or has exited in the meantime
+            logger.debug(f'Failed to kill container {name}: {subprocess.stderr}')
+        else:
+            logger.debug(f'Killed container {name}')
+
+    @cached_property
+    def image_id(self) -> str:
+        command = [self.docker_cmd, 'image', 'inspect', '--format', '{{.Id}}', self.abricate_docker_image]
+        subprocess = run(command, stdout=PIPE, stderr=PIPE, encoding='ascii')
+        if subprocess.returncode != 0:
+            # e.g. image not pulled yet
+            logger.debug(f'Could not determine image id of {self.abricate_docker_image}: {subprocess.stderr}')
+            return None
+        return subprocess.stdout.strip()
+
+    def _metadata_identity(self) -> str:
+        return f'{self.abricate_docker_image} (image_id={self.image_id})'
+
+    def _read_db_sequences(self, db: str) -> [str]:
+        path = f'{self.datadir}/{db}/sequences'
+        if self.session:
+            cmd = [self.docker_cmd, 'exec', self._session_container(), 'cat', path]
+        else:
+            cmd = [self.docker_cmd, 'run', '--rm', '--entrypoint', 'cat', self.abricate_docker_image, path]
+        subprocess = run(cmd, stdout=PIPE, stderr=PIPE, encoding='ascii')
+        assert subprocess.returncode == 0, F'command failed: {cmd},\n stderr: {subprocess.stderr}'
+        return subprocess.stdout.splitlines(keepends=True)
+
+    def _in_staging(self, file: str) -> bool:
+        return self.session and file.startswith(self.tmpdir + os.sep)
+
+    def _in_session_dir(self, file: str) -> bool:
+        return self.session and self.session_dir is not None and file.startswith(self.session_dir + os.sep)
+
+    def _stage(self, file: str) -> str:
+        """:return: the path of a hard link to file (or a copy, on another filesystem) in the staging directory"""
+        stat = os.stat(file)
+        key = (file, stat.st_size, stat.st_mtime_ns)
+        with self._session_lock:
+            if key not in self._staged:
+                staged = os.path.join(mkdtemp(dir=self.tmpdir, prefix='input-'), os.path.basename(file))
+                try:
+                    os.link(file, staged)
+                except OSError:
+                    shutil.copyfile(file, staged)
+                logger.debug(f'Staged {file} as {staged}')
+                self._staged[key] = staged
+            return self._staged[key]
+
+    def _session_container(self) -> str:
+        with self._session_lock:
+            if self._container is None:
+                self._start_container(self.session_dir)
+            return self._container
+
+    def _start_container(self, dirname: str = None):
+        cmd = [self.docker_cmd, 'run', '--rm', '--detach']
+        if self.uid_gid:
+            cmd.extend(['--user', self.uid_gid])
+        cmd.extend(['-v', f'{self.tmpdir}:/work:z'])
+        if self.combined_db_dir is not None:
+            os.makedirs(self.combined_db_dir, exist_ok=True)
+            cmd.extend(['-v', f'{self.combined_db_dir}:/combined:z'])
+        if dirname is not None:
+            cmd.extend(['-v', f'{dirname}:/data:z'])
+        cmd.extend([self.abricate_docker_image, 'sleep', 'infinity'])
+
+        logger.debug(' '.join(cmd))
+        subprocess = run(cmd, stdout=PIPE, stderr=PIPE, encoding='ascii')
+        assert subprocess.returncode == 0, F'command failed: {cmd},\n stdout: {subprocess.stdout},\n stderr: {subprocess.stderr}'
+
+        self._container = subprocess.stdout.strip()
+        atexit.register(self.close)
+        logger.debug(f'Started session container {self._container} ({dirname=})')
+
+    def close(self):
+        if self._container is None:
+            return
+        container, self._container = self._container, None
+        atexit.unregister(self.close)
+
+        # sleep ignores SIGTERM, so 'docker stop' would wait for the timeout
+        subprocess = run([self.docker_cmd, 'rm', '--force', container], stdout=PIPE, stderr=PIPE, encoding='ascii')
+        if subprocess.returncode != 0:
+            logger.warning(f'Failed to remove session container {container}: {subprocess.stderr}')
+        else:
+            logger.debug(f'Removed session container {container}')
+
 
 def runner(
         abricate_docker_image: str,
@@ -39,30 +189,195 @@ def runner(
         merge_annotations: bool = False,
         verbose: bool = True,
         skip_bad_hits: bool = False,
+        max_workers: int = 1,
+        cpus: int = None,
+        cache_dir: str = None,
+        cache_max_mb: float = 1024,
+        metadata_cache_dir: str = None,
+        metadata_ttl: float = 24 * 60 * 60,
+        refresh_metadata: bool = False,
+        single_pass: bool = False,
+        combined_db_dir: str = None,
+        hits_format: str = None,
+        n_shards: int = 1,
+        incremental: bool = True,
+        abricate_dir: str = None,
+        matrix_dir: str = None,
+        results_db: str = None,
+        prefilter: bool = False,
+        sketch_dir: str = None,
+        timeout: float = None,
+        retries: int = 0,
+        hedge: float = None,
+        prometheus_file: str = None,
         uid_gid: str = None,
-        docker_cmd: str = None,
+        docker_cmd: str = 'docker',
+        session: bool = False,
 ):
     abr = ABRiannotateDocker(
         abricate_docker_image=abricate_docker_image,
         merge_annotations=merge_annotations,
         skip_bad_hits=skip_bad_hits,
+        cache_dir=cache_dir,
+        cache_max_mb=cache_max_mb,
+        metadata_cache_dir=metadata_cache_dir,
+        metadata_ttl=metadata_ttl,
+        refresh_metadata=refresh_metadata,
+        combined_db_dir=combined_db_dir,
+        sketch_dir=sketch_dir,
+        timeout=timeout,
+        retries=retries,
+        hedge=hedge,
         docker_cmd=docker_cmd,
-        uid_gid=uid_gid
+        uid_gid=uid_gid,
+        session=session
     )
 
-    abr.init_outdir_logging(outdir, genome_identifier, logfile=verbose)
+    with abr:
+        abr.init_outdir_logging(outdir, genome_identifier, logfile=verbose)
 
-    gta, atd = abr.abriannotate_multidb(gbk=gbk, genome_identifier=genome_identifier, dbs=dbs, outdir=outdir,
-                                         markdown_file=markdown_file)
+        gta, atd = abr.abriannotate_multidb(gbk=gbk, genome_identifier=genome_identifier, dbs=dbs, outdir=outdir,
+                                             markdown_file=markdown_file, max_workers=max_workers, cpus=cpus,
+                                             single_pass=single_pass, hits_format=hits_format, n_shards=n_shards,
+                                             prometheus_file=prometheus_file, incremental=incremental,
+                                             abricate_dir=abricate_dir, matrix_dir=matrix_dir,
+                                             results_db=results_db, prefilter=prefilter)
 
     logger.info(f'Success! ABRicate found {len(atd)} annotations for {len(gta)} genes.')
 
 
+def batch_runner(
+        abricate_docker_image: str,
+        manifest: str,
+        dbs: [str] = None,
+        merge_annotations: bool = False,
+        verbose: bool = True,
+        skip_bad_hits: bool = False,
+        max_workers: int = 1,
+        cpus: int = None,
+        cache_dir: str = None,
+        cache_max_mb: float = 1024,
+        metadata_cache_dir: str = None,
+        metadata_ttl: float = 24 * 60 * 60,
+        refresh_metadata: bool = False,
+        single_pass: bool = False,
+        combined_db_dir: str = None,
+        hits_format: str = None,
+        n_shards: int = 1,
+        incremental: bool = True,
+        abricate_dir: str = None,
+        matrix_dir: str = None,
+        results_db: str = None,
+        prefilter: bool = False,
+        sketch_dir: str = None,
+        timeout: float = None,
+        retries: int = 0,
+        hedge: float = None,
+        processes: int = None,
+        report: str = None,
+        uid_gid: str = None,
+        docker_cmd: str = 'docker',
+):
+    from .batch import read_manifest, run_batch, write_report
+
+    abr = ABRiannotateDocker(
+        abricate_docker_image=abricate_docker_image,
+        merge_annotations=merge_annotations,
+        skip_bad_hits=skip_bad_hits,
+        cache_dir=cache_dir,
+        cache_max_mb=cache_max_mb,
+        metadata_cache_dir=metadata_cache_dir,
+        metadata_ttl=metadata_ttl,
+        refresh_metadata=refresh_metadata,
+        combined_db_dir=combined_db_dir,
+        sketch_dir=sketch_dir,
+        timeout=timeout,
+        retries=retries,
+        hedge=hedge,
+        docker_cmd=docker_cmd,
+        uid_gid=uid_gid
+    )
+
+    results = run_batch(abr, read_manifest(manifest), processes=processes, verbose=verbose,
+                        dbs=dbs, max_workers=max_workers, cpus=cpus, single_pass=single_pass, hits_format=hits_format,
+                        n_shards=n_shards, incremental=incremental, abricate_dir=abricate_dir, matrix_dir=matrix_dir,
+                        results_db=results_db, prefilter=prefilter)
+
+    if report:
+        write_report(results, report)
+
+
+def serve_runner(
+        abricate_docker_image: str,
+        processes: int = 1,
+        max_queue: int = 100,
+        max_finished: int = 1000,
+        host: str = '127.0.0.1',
+        port: int = 8765,
+        socket: str = None,
+        verbose: bool = True,
+        uid_gid: str = None,
+        docker_cmd: str = 'docker',
+        **options,
+):
+    """:param options: options of ABRiannotate (e.g. cache_dir, timeout) and abriannotate_multidb (e.g. dbs, cpus)"""
+    from .server import serve
+
+    engine_options, multidb_options = split_options(options)
+    abr = ABRiannotateDocker(abricate_docker_image=abricate_docker_image, docker_cmd=docker_cmd, uid_gid=uid_gid,
+                             **engine_options)
+
+    serve(abr, host=host, port=port, socket=socket, processes=processes, max_queue=max_queue,
+          max_finished=max_finished, verbose=verbose, **multidb_options)
+
+
+def worker_runner(
+        abricate_docker_image: str,
+        queue_dir: str,
+        heartbeat: float = 30,
+        stale_after: float = 300,
+        max_attempts: int = 3,
+        poll: float = 5,
+        wait: bool = False,
+        verbose: bool = True,
+        uid_gid: str = None,
+        docker_cmd: str = 'docker',
+        **options,
+):
+    """:param options: options of ABRiannotate (e.g. cache_dir, timeout) and abriannotate_multidb (e.g. dbs, cpus)"""
+    from .work_queue import run_worker
+
+    engine_options, multidb_options = split_options(options)
+    abr = ABRiannotateDocker(abricate_docker_image=abricate_docker_image, docker_cmd=docker_cmd, uid_gid=uid_gid,
+                             **engine_options)
+
+    run_worker(abr, queue_dir=queue_dir, heartbeat=heartbeat, stale_after=stale_after, max_attempts=max_attempts,
+               poll=poll, wait=wait, verbose=verbose, **multidb_options)
+
+
 def main():
     from fire import Fire
 
     Fire(runner)
 
 
+def main_batch():
+    from fire import Fire
+
+    Fire(batch_runner)
+
+
+def main_serve():
+    from fire import Fire
+
+    Fire(serve_runner)
+
+
+def main_worker():
+    from fire import Fire
+
+    Fire(worker_runner)
+
+
 if __name__ == '__main__':
     main()
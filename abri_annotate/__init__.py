@@ -1,2 +1,3 @@
-from .ABRiannotateDocker import ABRiannotateDocker, runner as docker_runner
-from .ABRiannotateBash import ABRiannotateBash, runner as bash_runner
+from .ABRiannotateDocker import ABRiannotateDocker, runner as docker_runner, batch_runner as docker_batch_runner
+from .ABRiannotateBash import ABRiannotateBash, runner as bash_runner, batch_runner as bash_batch_runner
+from .ABRiannotateBlast import ABRiannotateBlast, runner as blast_runner
@@ -0,0 +1,101 @@
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from .ABRiannotate import ABRiannotate
+from .errors import AbricateError
+from .scheduler import CpuBudget
+from .utils import logger
+
+_worker_abr: ABRiannotate = None
+_worker_cpu_budget: CpuBudget = None
+
+
+def read_manifest(manifest: str) -> [(str, str, str)]:
+    """
+    Read a tab-separated manifest with the columns gbk, genome_identifier and outdir.
+
+    Empty lines and lines starting with '#' are ignored.
+    """
+    genomes = []
+    with open(manifest) as f:
+        for i, line in enumerate(f, start=1):
+            line = line.rstrip('\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.split('\t')
+            assert len(fields) == 3, f'{manifest}:{i}: expected 3 tab-separated columns (gbk, genome_identifier, outdir): {line}'
+            genomes.append(tuple(fields))
+
+    identifiers = [genome_identifier for _, genome_identifier, _ in genomes]
+    assert len(identifiers) == len(set(identifiers)), f'{manifest}: genome_identifiers are not unique'
+    return genomes
+
+
+def _init_worker(abr: ABRiannotate, cpu_budget: CpuBudget = None):
+    global _worker_abr, _worker_cpu_budget
+    _worker_abr = abr
+    _worker_cpu_budget = cpu_budget
+
+
+def _annotate(gbk: str, genome_identifier: str, outdir: str, verbose: bool, abricate_dir: str,
+              multidb_kwargs: dict) -> dict:
+    result = {'genome_identifier': genome_identifier, 'gbk': gbk, 'outdir': outdir}
+    if _worker_cpu_budget is not None:
+        multidb_kwargs = {**multidb_kwargs, 'cpus': _worker_cpu_budget}
+    try:
+        _worker_abr.init_outdir_logging(outdir, genome_identifier, logfile=verbose)
+        gta, atd = _worker_abr.abriannotate_multidb(
+            gbk=gbk, genome_identifier=genome_identifier, outdir=outdir,
+            abricate_dir=os.path.join(abricate_dir, genome_identifier) if abricate_dir else None, **multidb_kwargs)
+        result.update(status='success', n_genes=len(gta), n_annotations=len(atd), error='')
+    except Exception as e:
+        logger.error(f'Failed to annotate {genome_identifier}:\n{traceback.format_exc()}')
+        result.update(status='failed', n_genes=0, n_annotations=0, error=f'{type(e).__name__}: {e}')
+        if isinstance(e, AbricateError):
+            result['abricate_error'] = e.to_dict()
+    return result
+
+
+def run_batch(abr: ABRiannotate, genomes: [(str, str, str)], processes: int = None, verbose: bool = True,
+              abricate_dir: str = None, cpus: int = None, **multidb_kwargs) -> [dict]:
+    """
+    Annotate many genomes in a process pool. Each worker receives a copy of abr, so version and db_versions
+    are determined only once. A failing genome does not stop the batch.
+
+    :param genomes: list of (gbk, genome_identifier, outdir)
+    :param abricate_dir: keep the raw output of ABRicate in {abricate_dir}/{genome_identifier}, so that reruns only
+                         execute the databases that changed
+    :param cpus: number of CPUs for all abricate calls of all genomes together, see abriannotate_multidb
+    :param multidb_kwargs: passed on to abriannotate_multidb
+    :return: one dict per genome with the keys genome_identifier, gbk, outdir, status, n_genes, n_annotations, error
+             and, if abricate failed, abricate_error (see AbricateError.to_dict)
+    """
+    # populate the cached properties before abr is copied into the workers
+    logger.info(f'Annotating {len(genomes)} genomes with {abr.version}...')
+    logger.info(f'Available databases: {abr.db_versions}...')
+
+    cpu_budget = None if cpus is None else CpuBudget(cpus)
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(abr, cpu_budget)) as executor:
+        futures = [
+            executor.submit(_annotate, gbk, genome_identifier, outdir, verbose, abricate_dir, multidb_kwargs)
+            for gbk, genome_identifier, outdir in genomes
+        ]
+        results = [future.result() for future in futures]
+
+    n_failed = sum(result['status'] != 'success' for result in results)
+    for result in results:
+        if result['status'] != 'success':
+            logger.error(f'Failed: {result["genome_identifier"]}: {result["error"]}')
+    logger.info(f'Batch done: {len(results) - n_failed} genomes succeeded, {n_failed} failed.')
+
+    return results
+
+
+def write_report(results: [dict], report: str):
+    columns = ['genome_identifier', 'gbk', 'outdir', 'status', 'n_genes', 'n_annotations', 'error']
+    os.makedirs(os.path.dirname(os.path.abspath(report)), exist_ok=True)
+    with open(report, 'w') as f:
+        f.write('\t'.join(columns) + '\n')
+        for result in results:
+            f.write('\t'.join(str(result[c]).replace('\t', ' ').replace('\n', ' ') for c in columns) + '\n')
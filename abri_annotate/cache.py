@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import fcntl
+import hashlib
+from contextlib import contextmanager
+from tempfile import NamedTemporaryFile
+
+from .utils import logger
+
+INDEX_FILE = 'index.json'
+LOCK_FILE = '.lock'
+
+
+def file_digest(file: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed on-disk cache of raw ABRicate output (TSV).
+
+    Entries are keyed by the hash of the sequence file, the database, the database version and the ABRicate
+    version. When the cache grows beyond max_bytes, the least recently used entries are removed until it is below
+    low_water * max_bytes, so that a full cache is not walked again on the next put.
+
+    The total size is kept in index.json and updated by every put (under flock), so the cache is only walked when it
+    exceeds max_bytes, or every resync_every puts to correct for entries that were added or removed by other means.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 1024 ** 3, low_water: float = 0.9,
+                 resync_every: int = 1000):
+        assert max_bytes > 0, f'max_bytes must be positive: {max_bytes=}'
+        assert 0 < low_water <= 1, f'low_water must be in (0, 1]: {low_water=}'
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.resync_every = resync_every
+        self._digests = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def digest(self, file: str) -> str:
+        # hashing is only repeated if the file changed
+        stat = os.stat(file)
+        memo_key = (os.path.abspath(file), stat.st_size, stat.st_mtime_ns)
+        if memo_key not in self._digests:
+            self._digests[memo_key] = file_digest(file)
+        return self._digests[memo_key]
+
+    def key(self, file: str, db: str, db_version: str, version: str) -> str:
+        content = '\t'.join([self.digest(file), db, db_version, version])
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f'{key}.tsv')
+
+    def get(self, key: str, file: str = None) -> str:
+        """
+        :param file: if given, the #FILE column is set to this path
+        :return: the cached TSV or None
+        """
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                content = f.read()
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            return None
+
+        if file is not None:
+            lines = content.split('\n')
+            for i in range(1, len(lines)):
+                if lines[i]:
+                    lines[i] = file + '\t' + lines[i].split('\t', 1)[1]
+            content = '\n'.join(lines)
+        return content
+
+    @contextmanager
+    def _lock(self):
+        with open(os.path.join(self.cache_dir, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_index(self) -> dict:
+        """:return: {'bytes': total size of the entries, 'puts': number of puts since the last walk} or None"""
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILE)) as f:
+                index = json.load(f)
+            return {'bytes': int(index['bytes']), 'puts': int(index['puts'])}
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_index(self, index: dict):
+        with NamedTemporaryFile('w', dir=self.cache_dir, suffix='.tmp', delete=False) as f:
+            json.dump(index, f)
+        os.replace(f.name, os.path.join(self.cache_dir, INDEX_FILE))
+
+    def put(self, key: str, content: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with NamedTemporaryFile('w', dir=os.path.dirname(path), suffix='.tmp', delete=False) as f:
+            f.write(content)
+        with self._lock():
+            try:
+                old_size = os.stat(path).st_size  # an entry that is replaced
+            except FileNotFoundError:
+                old_size = 0
+            os.replace(f.name, path)
+            index = self._read_index()
+            if index is not None:
+                index['bytes'] += os.stat(path).st_size - old_size
+                index['puts'] += 1
+            if index is None or index['bytes'] > self.max_bytes or index['puts'] >= self.resync_every:
+                index = {'bytes': self._evict(), 'puts': 0}
+            self._write_index(index)
+
+    def entries(self) -> [(str, int, float)]:
+        """:return: list of (path, size, mtime), least recently used first"""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if not filename.endswith('.tsv'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # evicted by another process
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """If the cache exceeds max_bytes, remove the least recently used entries until it fits into low_water."""
+        with self._lock():
+            self._write_index({'bytes': self._evict(), 'puts': 0})
+
+    def _evict(self) -> int:
+        """:return: the total size after the eviction"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return total
+        for path, size, _ in entries:
+            if total <= self.low_water * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                logger.debug(f'Evicted cache entry {path}')
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+
+class MetadataCache:
+    """
+    On-disk cache of the output of ABRicate metadata commands (--version, --list, --check).
+
+    Entries are keyed by an identity of the ABRicate installation (e.g. its path or the docker image id) and the
+    command line arguments, and expire after ttl seconds. With refresh=True, existing entries are ignored and
+    overwritten.
+    """
+
+    def __init__(self, cache_dir: str, ttl: float = 24 * 60 * 60, refresh: bool = False):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.ttl = ttl
+        self.refresh = refresh
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, identity: str, args: [str]) -> str:
+        key = hashlib.sha256('\t'.join([identity, *args]).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def get(self, identity: str, args: [str]) -> (str, str):
+        """:return: (stdout, stderr) or None if there is no valid entry"""
+        if self.refresh:
+            return None
+        try:
+            with open(self._path(identity, args)) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if time.time() - entry['created'] > self.ttl:
+            return None
+        return entry['stdout'], entry['stderr']
+
+    def put(self, identity: str, args: [str], stdout: str, stderr: str):
+        path = self._path(identity, args)
+        entry = {'identity': identity, 'args': args, 'created': time.time(), 'stdout': stdout, 'stderr': stderr}
+        with NamedTemporaryFile('w', dir=self.cache_dir, suffix='.tmp', delete=False) as f:
+            json.dump(entry, f)
+        os.replace(f.name, path)
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import os
+import hashlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+COMBINED_DB = 'combined'
+HEADER_SEPARATOR = '~~~'
+
+
+def combined_db_key(db_versions: {str: str}, version: str) -> str:
+    """
+    :param db_versions: maps the source databases to their version (see ABRiannotate.db_version)
+    :return: key that changes whenever one of the source databases or ABRicate changes
+    """
+    content = '\n'.join([version] + [f'{db}\t{db_versions[db]}' for db in sorted(db_versions)])
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+def tag_sequences(lines: [str], db: str) -> [str]:
+    """
+    Make sure the first field of every header (>DB~~~GENE~~~ACCESSION~~~RESISTANCE) is the source db. ABRicate
+    reports this field in the DATABASE column, which is how hits are split back into databases.
+    """
+    for line in lines:
+        if line.startswith('>'):
+            fields = line[1:].split(HEADER_SEPARATOR, 1)
+            assert len(fields) == 2, f'Unexpected header in db={db}: {line.strip()}'
+            line = f'>{db}{HEADER_SEPARATOR}{fields[1]}'
+        yield line
+
+
+def write_combined_sequences(sequences: {str: [str]}, datadir: str):
+    """
+    Write the sequences of multiple databases into {datadir}/combined/sequences.
+
+    :param sequences: maps the source databases to the lines of their sequences file
+    """
+    os.makedirs(os.path.join(datadir, COMBINED_DB))
+    with open(os.path.join(datadir, COMBINED_DB, 'sequences'), 'w') as f:
+        for db, lines in sequences.items():
+            for line in tag_sequences(lines, db):
+                f.write(line if line.endswith('\n') else line + '\n')
+
+
+def split_hits(abricate_df: pd.DataFrame, dbs: [str]) -> {str: pd.DataFrame}:
+    """Split the output of a single ABRicate pass over the combined database back into the source databases."""
+    unknown = set(abricate_df.DATABASE).difference(dbs)
+    assert not unknown, f'Hits of unexpected databases in combined output: {unknown}'
+    return {db: abricate_df[abricate_df.DATABASE == db].reset_index(drop=True) for db in dbs}
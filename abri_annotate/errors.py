@@ -0,0 +1,59 @@
+import re
+from subprocess import CompletedProcess
+
+# failures of the environment rather than of abricate or its input, e.g. of the container runtime or of a network
+# filesystem: running the same command again may succeed
+TRANSIENT_MESSAGES = re.compile('|'.join([
+    'Resource temporarily unavailable',
+    'Cannot allocate memory',
+    'Stale file handle',
+    'Input/output error',
+    'Connection (reset|refused|timed out)',
+    'Cannot connect to the Docker daemon',
+    'Error response from daemon',
+    'Temporary failure',
+    'Too many open files',
+]), re.IGNORECASE)
+# 125: docker/podman itself failed, 137/143: killed by SIGKILL (e.g. out of memory) or SIGTERM
+TRANSIENT_EXIT_CODES = {125, 137, 143}
+
+
+class AbricateError(Exception):
+    """
+    An abricate call failed.
+
+    :param transient: whether the failure may not happen again, i.e. whether retrying may help
+    :param attempts: number of times the call was made, set by RetryPolicy
+    """
+
+    def __init__(self, message: str, command: [str] = None, returncode: int = None, stdout: str = None,
+                 stderr: str = None, db: str = None, file: str = None, transient: bool = False):
+        super().__init__(message)
+        self.command = command
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.db = db
+        self.file = file
+        self.transient = transient
+        self.attempts = 1
+
+    @classmethod
+    def from_process(cls, subprocess: CompletedProcess, db: str = None, file: str = None) -> 'AbricateError':
+        returncode, stderr = subprocess.returncode, subprocess.stderr or ''
+        transient = returncode < 0 or returncode in TRANSIENT_EXIT_CODES or bool(TRANSIENT_MESSAGES.search(stderr))
+        return cls(f'command failed: {subprocess.args},\n stdout: {subprocess.stdout},\n stderr: {stderr}',
+                   command=subprocess.args, returncode=returncode, stdout=subprocess.stdout, stderr=stderr, db=db,
+                   file=file, transient=transient)
+
+    def to_dict(self) -> dict:
+        return {'type': type(self).__name__, 'db': self.db, 'file': self.file, 'returncode': self.returncode,
+                'transient': self.transient, 'attempts': self.attempts, 'stderr': self.stderr}
+
+
+class AbricateTimeout(AbricateError, TimeoutError):
+    """An abricate call was killed because it took longer than the timeout. Always transient."""
+
+    def __init__(self, message: str, command: [str] = None, db: str = None, file: str = None, timeout: float = None):
+        super().__init__(message, command=command, db=db, file=file, transient=True)
+        self.timeout = timeout
@@ -0,0 +1,139 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from .inputs import open_text
+
+FEATURE_INDENT = ' ' * 5
+QUALIFIER_INDENT = ' ' * 21
+COORDINATE_RE = re.compile(r'\d+')
+
+
+def parse_location(location: str) -> (int, int, str):
+    """
+    Convert a GenBank location string into Biopython-style coordinates.
+
+    :return: start (0-based), end (exclusive) and strand ('+' or '-')
+    """
+    # ignore references to other records, e.g. join(AB000001.1:1..100,1..50)
+    parts = [part for part in re.split(r'[(),]', location) if part and ':' not in part]
+    coordinates = [int(c) for part in parts for c in COORDINATE_RE.findall(part)]
+    assert coordinates, f'Could not parse location: {location}'
+
+    if location.startswith('complement('):
+        strand = '-'
+    elif 'complement(' in location and location.count('complement(') == location.count('..'):
+        strand = '-'  # join(complement(1..10),complement(20..30))
+    else:
+        strand = '+'
+
+    # single positions (e.g. '5') span one base
+    return min(coordinates) - 1, max(coordinates), strand
+
+
+def iter_features(gbk: str) -> (str, str, str):
+    """
+    Stream the features of a (possibly gzip compressed) GenBank file, skipping sequence blocks.
+
+    :return: iterator of (scaffold, feature location, locus_tag or None)
+    """
+    scf_id = None
+    in_features = False
+    location, locus_tag, qualifier = None, None, None
+
+    with open_text(gbk) as f:
+        for line in f:
+            if line.startswith('LOCUS'):
+                scf_id = line.split()[1]
+                continue
+
+            if line.startswith('FEATURES'):
+                in_features = True
+                continue
+
+            if not in_features:
+                continue
+
+            if line.startswith(QUALIFIER_INDENT):
+                content = line.strip()
+                if content.startswith('/'):
+                    qualifier = content
+                    if content.startswith('/locus_tag=') and locus_tag is None:
+                        locus_tag = content[len('/locus_tag='):].strip('"')
+                elif qualifier is None:
+                    location += content  # multi-line location
+                continue
+
+            if location is not None:
+                yield scf_id, location, locus_tag
+                location, locus_tag, qualifier = None, None, None
+
+            if line.startswith(FEATURE_INDENT) and line[5] != ' ':
+                location = line[21:].strip()
+                continue
+
+            # ORIGIN, CONTIG or //: no more features in this record, skip the sequence
+            in_features = False
+            if not line.startswith('//'):
+                for line in f:
+                    if line.startswith('//'):
+                        break
+
+
+def load_genes(gbk: str) -> pd.DataFrame:
+    """
+    Load all features with a locus_tag from a GenBank file.
+
+    If a locus_tag occurs multiple times (e.g. gene and CDS), the last feature wins.
+
+    :return: DataFrame with index locus_tag and columns scf_id, start (0-based), end (exclusive), strand
+    """
+    positions = {}
+    scf_ids, starts, ends, strands = [], [], [], []
+
+    for scf_id, location, locus_tag in iter_features(gbk):
+        if locus_tag is None:
+            continue
+        start, end, strand = parse_location(location)
+        if locus_tag in positions:
+            i = positions[locus_tag]
+            scf_ids[i], starts[i], ends[i], strands[i] = scf_id, start, end, strand
+        else:
+            positions[locus_tag] = len(scf_ids)
+            scf_ids.append(scf_id)
+            starts.append(start)
+            ends.append(end)
+            strands.append(strand)
+
+    return pd.DataFrame({
+        'scf_id': pd.Categorical(scf_ids),
+        'start': np.array(starts, dtype=np.int64),
+        'end': np.array(ends, dtype=np.int64),
+        'strand': pd.Categorical(strands, categories=['+', '-']),
+    }, index=pd.Index(list(positions), name='locus_tag'))
+
+
+def write_fasta(gbk: str, fasta: str) -> [str]:
+    """
+    Stream the sequences of a GenBank file into a nucleotide FASTA file.
+
+    Headers are the LOCUS names, i.e. the same as scf_id in load_genes.
+
+    :return: list of the scaffolds that were written
+    """
+    scaffolds = []
+    scf_id = None
+    with open_text(gbk) as f_in, open(fasta, 'w') as f_out:
+        for line in f_in:
+            if line.startswith('LOCUS'):
+                scf_id = line.split()[1]
+            elif line.startswith('ORIGIN'):
+                scaffolds.append(scf_id)
+                f_out.write(f'>{scf_id}\n')
+                for line in f_in:
+                    if line.startswith('//'):
+                        break
+                    # '       61 acgtacgtac gtacgtacgt ...' -> 'ACGTACGTACGTACGTACGT...'
+                    f_out.write(''.join(line.split()[1:]).upper() + '\n')
+    return scaffolds
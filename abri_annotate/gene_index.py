@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from .utils import logger
+
+
+class GeneIndex:
+    """
+    Sorted per-scaffold index of gene coordinates for mapping ABRicate hits onto genes.
+
+    The distance between a hit and a gene is the euclidean distance between the points (start, end). Genes are sorted by start so that
+    all candidates of a hit can be found with binary searches instead of a scan over the whole genome.
+    """
+
+    def __init__(self, genes_df: pd.DataFrame):
+        self.locus_tags = genes_df.index.to_numpy()
+        self.starts = genes_df.start.to_numpy(dtype=np.int64)
+        self.ends = genes_df.end.to_numpy(dtype=np.int64)
+
+        # positions into genes_df, sorted by gene start (stable: ties keep the order of genes_df)
+        self._all = np.argsort(self.starts, kind='stable')
+        self.scaffolds = {
+            scf_id: positions[np.argsort(self.starts[positions], kind='stable')]
+            for scf_id, positions in genes_df.groupby('scf_id', sort=False, observed=True).indices.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.locus_tags)
+
+    def assign(self, abricate_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Find the closest gene for every hit in abricate_df (columns SEQUENCE, START, END).
+
+        :return: DataFrame with the same index as abricate_df and columns gene, distance, overlap. Hits on scaffolds
+                 without genes get gene None.
+        """
+        n_hits = len(abricate_df)
+        if len(self) == 0:
+            return pd.DataFrame({'gene': None, 'distance': np.nan, 'overlap': np.nan}, index=abricate_df.index)
+
+        best = np.zeros(n_hits, dtype=np.int64)
+        distance = np.zeros(n_hits)
+        unknown = np.zeros(n_hits, dtype=bool)
+
+        sequences = abricate_df.SEQUENCE.to_numpy()
+        hit_starts = abricate_df.START.to_numpy(dtype=np.int64)
+        hit_ends = abricate_df.END.to_numpy(dtype=np.int64)
+
+        for sequence, hits in pd.Series(sequences).groupby(sequences, sort=False).indices.items():
+            if sequence not in self.scaffolds:
+                # never assign a hit to a gene on another scaffold
+                logger.warning(f'No genes on scaffold {sequence}, {len(hits)} hits are not assigned to a gene')
+                unknown[hits] = True
+                continue
+            best[hits], distance[hits] = self._closest(self.scaffolds[sequence], hit_starts[hits], hit_ends[hits])
+
+        gene_starts = self.starts[best]
+        gene_ends = self.ends[best]
+
+        # genes: 0-based start, exclusive end (Biopython); hits: 1-based, inclusive (ABRicate)
+        hit_length = hit_ends - hit_starts + 1
+        overlap = np.minimum(gene_ends, hit_ends) - np.maximum(gene_starts, hit_starts - 1)
+        overlap = np.clip(overlap, 0, None) / np.maximum(hit_length, 1)
+
+        genes = self.locus_tags[best].astype(object)
+        genes[unknown] = None
+        distance[unknown] = np.nan
+        overlap[unknown] = np.nan
+
+        return pd.DataFrame({
+            'gene': pd.Series(genes, dtype=object, index=abricate_df.index),  # keep None, not NaN
+            'distance': distance,
+            'overlap': overlap,
+        }, index=abricate_df.index)
+
+    def _closest(self, order: np.ndarray, hit_starts: np.ndarray, hit_ends: np.ndarray) -> (np.ndarray, np.ndarray):
+        gene_starts = self.starts[order]
+        gene_ends = self.ends[order]
+        n_genes = len(order)
+
+        def dist(hits, candidates):
+            return np.hypot(gene_starts[candidates] - hit_starts[hits], gene_ends[candidates] - hit_ends[hits])
+
+        # upper bound: distance to the genes whose start is adjacent to the hit start
+        hits = np.arange(len(hit_starts))
+        insert = np.searchsorted(gene_starts, hit_starts)
+        upper_bound = np.minimum(
+            dist(hits, np.clip(insert - 1, 0, n_genes - 1)),
+            dist(hits, np.clip(insert, 0, n_genes - 1))
+        )
+
+        # any closer gene must start within upper_bound of the hit start
+        lo = np.searchsorted(gene_starts, hit_starts - upper_bound, side='left')
+        hi = np.searchsorted(gene_starts, hit_starts + upper_bound, side='right')
+        counts = hi - lo
+
+        hit_of = np.repeat(hits, counts)
+        candidates = np.repeat(lo, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        distances = dist(hit_of, candidates)
+
+        # per hit: smallest distance, ties resolved by position in genes_df (like DataFrame.nsmallest)
+        ranking = np.lexsort((order[candidates], distances, hit_of))
+        first = ranking[np.r_[0, np.flatnonzero(np.diff(hit_of[ranking])) + 1]]
+        return order[candidates[first]], distances[first]
@@ -0,0 +1,86 @@
+from urllib.parse import unquote
+
+import numpy as np
+import pandas as pd
+
+from .inputs import open_text
+
+
+def parse_attributes(attributes: str) -> {str: str}:
+    """'ID=cds1;locus_tag=TEST_0001' -> {'ID': 'cds1', 'locus_tag': 'TEST_0001'}"""
+    result = {}
+    for attribute in attributes.strip().split(';'):
+        if '=' in attribute:
+            key, value = attribute.split('=', 1)
+            result[key.strip()] = unquote(value)
+    return result
+
+
+def iter_features(gff: str) -> (str, int, int, str, str, str):
+    """
+    Stream the features of a GFF3 file, stopping at the ##FASTA section.
+
+    :return: iterator of (scaffold, start (0-based), end (exclusive), strand, ID or None, locus_tag or None)
+    """
+    with open_text(gff) as f:
+        for line in f:
+            if line.startswith('##FASTA'):
+                break
+            if line.startswith('#') or not line.strip():
+                continue
+            fields = line.rstrip('\n').split('\t')
+            assert len(fields) == 9, f'{gff}: expected 9 tab-separated columns: {line}'
+            attributes = parse_attributes(fields[8])
+            strand = '-' if fields[6] == '-' else '+'
+            yield unquote(fields[0]), int(fields[3]) - 1, int(fields[4]), strand, attributes.get('ID'), \
+                attributes.get('locus_tag')
+
+
+def load_genes(gff: str) -> pd.DataFrame:
+    """
+    Load all features with a locus_tag attribute from a GFF3 file.
+
+    Lines with the same ID form one feature (e.g. the exons of a CDS), which spans all of them. If a locus_tag
+    occurs in multiple features (e.g. gene and CDS), the last feature wins, as in genbank.load_genes.
+
+    :return: DataFrame with index locus_tag and columns scf_id, start (0-based), end (exclusive), strand
+    """
+    features = {}
+    for scf_id, start, end, strand, feature_id, locus_tag in iter_features(gff):
+        if locus_tag is None:
+            continue
+        previous = features.get(locus_tag)
+        if previous is not None and feature_id is not None and previous[4] == feature_id:
+            start, end = min(start, previous[1]), max(end, previous[2])
+        features[locus_tag] = (scf_id, start, end, strand, feature_id)
+
+    scf_ids, starts, ends, strands, _ = zip(*features.values()) if features else ([], [], [], [], [])
+    return pd.DataFrame({
+        'scf_id': pd.Categorical(scf_ids),
+        'start': np.array(starts, dtype=np.int64),
+        'end': np.array(ends, dtype=np.int64),
+        'strand': pd.Categorical(strands, categories=['+', '-']),
+    }, index=pd.Index(list(features), name='locus_tag'))
+
+
+def write_fasta(gff: str, fasta: str) -> [str]:
+    """
+    Stream the sequences of the ##FASTA section of a GFF3 file into a FASTA file.
+
+    Headers are the sequence ids, i.e. the same as scf_id in load_genes.
+
+    :return: list of the scaffolds that were written
+    """
+    scaffolds = []
+    with open_text(gff) as f_in, open(fasta, 'w') as f_out:
+        for line in f_in:
+            if line.startswith('##FASTA'):
+                break
+        for line in f_in:
+            if line.startswith('>'):
+                scaffolds.append(line[1:].split()[0])
+                f_out.write(f'>{scaffolds[-1]}\n')
+            elif line.strip():
+                f_out.write(line.strip().upper() + '\n')
+    assert scaffolds, f'{gff}: no sequences found, GFF3 files need a ##FASTA section'
+    return scaffolds
@@ -0,0 +1,47 @@
+import gzip
+
+import pandas as pd
+
+GZIP_MAGIC = b'\x1f\x8b'
+INPUT_FORMATS = ['genbank', 'gff']
+
+
+def is_gzip(file: str) -> bool:
+    with open(file, 'rb') as f:
+        return f.read(2) == GZIP_MAGIC
+
+
+def open_text(file: str):
+    """Open a plain, gzip or bgzip compressed text file for reading. Compressed files are decompressed on the fly."""
+    return gzip.open(file, 'rt') if is_gzip(file) else open(file)
+
+
+def input_format(file: str) -> str:
+    """:return: 'gff' for GFF3 (with the sequences in a ##FASTA section), otherwise 'genbank'"""
+    with open_text(file) as f:
+        for line in f:
+            if line.strip():
+                return 'gff' if line.startswith('##gff-version') else 'genbank'
+    return 'genbank'
+
+
+def is_plain_genbank(file: str) -> bool:
+    return not is_gzip(file) and input_format(file) == 'genbank'
+
+
+def load_genes(file: str) -> pd.DataFrame:
+    """Load the genes of a GenBank or GFF3 file, see genbank.load_genes."""
+    if input_format(file) == 'gff':
+        from .gff import load_genes
+    else:
+        from .genbank import load_genes
+    return load_genes(file)
+
+
+def write_fasta(file: str, fasta: str) -> [str]:
+    """Stream the sequences of a GenBank or GFF3 file into a FASTA file, see genbank.write_fasta."""
+    if input_format(file) == 'gff':
+        from .gff import write_fasta
+    else:
+        from .genbank import write_fasta
+    return write_fasta(file, fasta)
@@ -0,0 +1,53 @@
+import os
+import json
+from tempfile import NamedTemporaryFile
+
+MANIFEST_FILE = 'abriannotate.manifest.json'
+
+
+class ResultManifest:
+    """
+    Records which input, database versions, engine and mode produced the per-db results (db_{db}.original.tsv) in a
+    directory, so that a rerun only needs to execute ABRicate for the databases that changed. Results of another
+    engine or mode are stale.
+
+    :param version: version of ABRicate
+    :param input_digest: hash of the sequences ABRicate runs on
+    :param engine: the class that ran ABRicate, e.g. ABRiannotateBlast
+    :param mode: 'single_pass' (see ABRiannotate.combined_db) or 'per_db'
+    """
+
+    def __init__(self, directory: str, version: str, input_digest: str, engine: str = None, mode: str = 'per_db'):
+        self.file = os.path.join(directory, MANIFEST_FILE)
+        self.version = version
+        self.input_digest = input_digest
+        self.engine = engine
+        self.mode = mode
+        try:
+            with open(self.file) as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    @staticmethod
+    def result_file(db: str) -> str:
+        return f'db_{db}.original.tsv'
+
+    def _entry(self, db: str, db_version: str) -> dict:
+        return {'db_version': db_version, 'version': self.version, 'input': self.input_digest, 'engine': self.engine,
+                'mode': self.mode, 'file': self.result_file(db)}
+
+    def is_current(self, db: str, db_version: str) -> bool:
+        return self.entries.get(db) == self._entry(db, db_version) and \
+               os.path.isfile(os.path.join(os.path.dirname(self.file), self.result_file(db)))
+
+    def update(self, db: str, db_version: str):
+        self.entries[db] = self._entry(db, db_version)
+
+    def invalidate(self, db: str):
+        self.entries.pop(db, None)
+
+    def save(self):
+        with NamedTemporaryFile('w', dir=os.path.dirname(self.file), suffix='.tmp', delete=False) as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(f.name, self.file)
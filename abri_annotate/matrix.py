@@ -0,0 +1,141 @@
+import os
+import fcntl
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+GENOMES_FILE = 'genomes.tsv'
+ANNOTATIONS_FILE = 'annotations.txt'
+INDICES_FILE = 'indices.u32'
+LOCK_FILE = '.lock'
+
+
+class PresenceMatrix:
+    """
+    Sparse genome × annotation presence/absence matrix in a directory, updated by appending one row per genome.
+
+    - annotations.txt: the column names, one per line, in the order in which they were first seen
+    - indices.u32: the column indices of all rows, concatenated (uint32)
+    - genomes.tsv: genome_identifier and number of indices per row
+
+    Reading and appending are safe across processes (flock). If a genome is appended again, its latest row replaces
+    the older one when the matrix is loaded; compact removes the older rows from the files.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, file: str) -> str:
+        return os.path.join(self.directory, file)
+
+    @contextmanager
+    def _lock(self, shared: bool = False):
+        with open(self._path(LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_annotations(self) -> [str]:
+        try:
+            with open(self._path(ANNOTATIONS_FILE)) as f:
+                return f.read().splitlines()
+        except FileNotFoundError:
+            return []
+
+    def _read_genomes(self) -> ([str], np.ndarray, int):
+        """:return: genomes, number of indices per genome and size of the complete lines in bytes"""
+        genomes, counts, size = [], [], 0
+        try:
+            with open(self._path(GENOMES_FILE), 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # incomplete last line of an interrupted append
+                    genome_identifier, count = line.decode().rstrip('\n').split('\t')
+                    genomes.append(genome_identifier)
+                    counts.append(int(count))
+                    size += len(line)
+        except FileNotFoundError:
+            pass
+        return genomes, np.array(counts, dtype='int64'), size
+
+    def append(self, genome_identifier: str, annotations: [str]):
+        """Add (or replace) the row of a genome: its annotations are present, all others absent."""
+        assert '\t' not in genome_identifier and '\n' not in genome_identifier, \
+            f'genome_identifier may not contain tabs or newlines: {genome_identifier!r}'
+        annotations = sorted(set(annotations))
+
+        with self._lock():
+            columns = self._read_annotations()
+            column_of = {annotation: i for i, annotation in enumerate(columns)}
+            new = [annotation for annotation in annotations if annotation not in column_of]
+            for annotation in new:
+                column_of[annotation] = len(column_of)
+
+            # the columns and indices are written before the row that refers to them, so that an interrupted append
+            # leaves at most unused columns and indices behind
+            if new:
+                with open(self._path(ANNOTATIONS_FILE), 'a') as f:
+                    f.write(''.join(f'{annotation}\n' for annotation in new))
+            # drop what an interrupted append left behind
+            genomes, counts, size = self._read_genomes()
+            with open(self._path(INDICES_FILE), 'ab') as f:
+                f.truncate(int(counts.sum()) * 4)
+                f.write(np.array([column_of[a] for a in annotations], dtype='uint32').tobytes())
+            with open(self._path(GENOMES_FILE), 'a') as f:
+                f.truncate(size)
+                f.write(f'{genome_identifier}\t{len(annotations)}\n')
+
+    def load(self) -> ([str], [str], np.ndarray, np.ndarray):
+        """
+        Read the matrix in CSR form. If a genome was appended several times, only its latest row is returned.
+
+        :return: genomes (rows), annotations (columns), indptr and indices
+        """
+        with self._lock(shared=True):
+            return self._load()
+
+    def _load(self) -> ([str], [str], np.ndarray, np.ndarray):
+        genomes, counts, _ = self._read_genomes()
+        columns = self._read_annotations()
+        indices = np.fromfile(self._path(INDICES_FILE), dtype='uint32', count=int(counts.sum())) \
+            if len(genomes) else np.empty(0, dtype='uint32')
+        indptr = np.concatenate([[0], np.cumsum(counts)])
+
+        latest = {genome_identifier: i for i, genome_identifier in enumerate(genomes)}
+        if len(latest) < len(genomes):
+            rows = sorted(latest.values())
+            indices = np.concatenate([indices[indptr[i]:indptr[i + 1]] for i in rows]).astype('uint32')
+            genomes = [genomes[i] for i in rows]
+            indptr = np.concatenate([[0], np.cumsum(counts[rows])])
+        return genomes, columns, indptr, indices
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """:return: boolean DataFrame with one row per genome and one column per annotation"""
+        genomes, columns, indptr, indices = self.load()
+        dense = np.zeros((len(genomes), len(columns)), dtype=bool)
+        dense[np.repeat(np.arange(len(genomes)), np.diff(indptr)), indices] = True
+        return pd.DataFrame(dense, index=pd.Index(genomes, name='genome_identifier'), columns=columns)
+
+    def to_scipy(self):
+        """:return: scipy.sparse.csr_matrix (requires scipy), rows and columns as in load"""
+        try:
+            from scipy.sparse import csr_matrix
+        except ImportError:
+            raise ImportError('Converting the matrix to a scipy matrix requires scipy: pip install scipy')
+        genomes, columns, indptr, indices = self.load()
+        return csr_matrix((np.ones(len(indices), dtype=bool), indices, indptr), shape=(len(genomes), len(columns)))
+
+    def compact(self):
+        """Rewrite the files without the replaced rows."""
+        with self._lock():
+            genomes, columns, indptr, indices = self._load()
+            with open(self._path(INDICES_FILE) + '.tmp', 'wb') as f:
+                f.write(indices.astype('uint32').tobytes())
+            with open(self._path(GENOMES_FILE) + '.tmp', 'w') as f:
+                f.write(''.join(f'{g}\t{n}\n' for g, n in zip(genomes, np.diff(indptr))))
+            os.replace(self._path(INDICES_FILE) + '.tmp', self._path(INDICES_FILE))
+            os.replace(self._path(GENOMES_FILE) + '.tmp', self._path(GENOMES_FILE))
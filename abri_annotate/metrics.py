@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import signal
+import threading
+from contextlib import contextmanager
+from subprocess import Popen, CompletedProcess
+from tempfile import TemporaryFile, NamedTemporaryFile
+
+
+class Metrics:
+    """
+    Per-genome timings and counters. Thread-safe, so concurrent abricate calls can record into the same instance.
+
+    - stages: accumulated wall time in seconds per stage (load_gbk, abricate, parse, mapping, ...)
+    - counters: e.g. genes, hits, bad_hits
+    - dbs: counters per database
+    - calls: one record per abricate call (db, file, wall time, CPU time and max RSS of the subprocess, hits)
+    """
+
+    def __init__(self, genome_identifier: str = None):
+        self.genome_identifier = genome_identifier
+        self.stages = {}
+        self.counters = {}
+        self.dbs = {}
+        self.calls = []
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.) + seconds
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def count_db(self, db: str, name: str, value: int = 1):
+        with self._lock:
+            counters = self.dbs.setdefault(db, {})
+            counters[name] = counters.get(name, 0) + value
+
+    def add_call(self, **call):
+        with self._lock:
+            self.calls.append(call)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'genome_identifier': self.genome_identifier,
+                'wall_s': time.perf_counter() - self._start,
+                'stages_s': dict(self.stages),
+                'counters': dict(self.counters),
+                'dbs': {db: dict(counters) for db, counters in self.dbs.items()},
+                'abricate_calls': list(self.calls),
+            }
+
+    def write_json(self, file: str):
+        with open(file, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def write_prometheus(self, file: str):
+        """
+        Write the metrics in the Prometheus text format, e.g. for the textfile collector of node_exporter.
+        The file is replaced atomically.
+        """
+        metrics = self.to_dict()
+        genome = metrics['genome_identifier'] or ''
+        lines = []
+
+        def add(name: str, help: str, samples: [(dict, float)]):
+            lines.append(f'# HELP abriannotate_{name} {help}')
+            lines.append(f'# TYPE abriannotate_{name} gauge')
+            for labels, value in samples:
+                labels = ','.join(f'{k}="{_escape(str(v))}"' for k, v in {'genome': genome, **labels}.items())
+                lines.append(f'abriannotate_{name}{{{labels}}} {value}')
+
+        add('wall_seconds', 'Wall time of the whole run.', [({}, metrics['wall_s'])])
+        add('stage_seconds', 'Wall time per stage.', [({'stage': s}, v) for s, v in metrics['stages_s'].items()])
+        add('count', 'Counters such as genes, hits and bad hits.',
+            [({'counter': c}, v) for c, v in metrics['counters'].items()])
+
+        add('db_count', 'Counters per database such as hits and bad hits.',
+            [({'db': db, 'counter': c}, v) for db, counters in metrics['dbs'].items() for c, v in counters.items()])
+
+        calls = [call for call in metrics['abricate_calls'] if not call['cached']]
+        add('abricate_seconds', 'Wall time of abricate per database.', _sum_by_db(calls, 'wall_s'))
+        add('abricate_cpu_seconds', 'CPU time (user + system) of abricate per database.',
+            _sum_by_db([c for c in calls if c['cpu_s'] is not None], 'cpu_s'))
+        add('abricate_max_rss_bytes', 'Peak memory of abricate per database.',
+            _max_by_db([c for c in calls if c['max_rss_kb'] is not None], 'max_rss_kb', factor=1024))
+
+        with NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(file)), suffix='.tmp', delete=False) as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(f.name, file)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _sum_by_db(calls: [dict], key: str) -> [(dict, float)]:
+    totals = {}
+    for call in calls:
+        totals[call['db']] = totals.get(call['db'], 0) + call[key]
+    return [({'db': db}, value) for db, value in totals.items()]
+
+
+def _max_by_db(calls: [dict], key: str, factor: int = 1) -> [(dict, float)]:
+    maxima = {}
+    for call in calls:
+        maxima[call['db']] = max(maxima.get(call['db'], 0), call[key] * factor)
+    return [({'db': db}, value) for db, value in maxima.items()]
+
+
+def run_measured(command: [str], timeout: float = None, cancel: threading.Event = None,
+                 on_kill=None) -> (CompletedProcess, dict):
+    """
+    Like subprocess.run(command, stdout=PIPE, stderr=PIPE, encoding='ascii'), but also measures the resource usage
+    of the child process.
+
+    :param timeout: seconds after which the process (and its children) is killed and TimeoutError is raised
+    :param cancel: kill the process (and its children) when this event is set, e.g. by a faster hedged call
+    :param on_kill: function() called after the process was killed, e.g. to stop the container of a docker client
+    :return: the completed process and {'cpu_s': user + system time, 'max_rss_kb': peak resident memory}
+    """
+    with TemporaryFile('w+', encoding='ascii') as stdout, TemporaryFile('w+', encoding='ascii') as stderr:
+        # a killable process gets its own session, so that its children (e.g. blastn of abricate) can be killed too
+        killable = timeout is not None or cancel is not None
+        process = Popen(command, stdout=stdout, stderr=stderr, start_new_session=killable)
+        watchdog = _Watchdog(process, timeout=timeout, cancel=cancel, on_kill=on_kill) if killable else None
+        if watchdog:
+            watchdog.start()
+        try:
+            # wait4 reaps the child itself, which is the only way to get the rusage of this particular child
+            _, status, rusage = os.wait4(process.pid, 0)
+        except BaseException:
+            # e.g. KeyboardInterrupt: do not leave the process behind
+            _kill(process, group=killable, on_kill=on_kill)
+            process.wait()
+            raise
+        finally:
+            if watchdog:
+                watchdog.finished.set()
+                watchdog.join()
+        if watchdog and watchdog.timed_out:
+            raise TimeoutError(f'command timed out after {timeout} seconds: {command}')
+        process.returncode = os.waitstatus_to_exitcode(status)
+        stdout.seek(0)
+        stderr.seek(0)
+        completed = CompletedProcess(command, process.returncode, stdout.read(), stderr.read())
+    return completed, {'cpu_s': rusage.ru_utime + rusage.ru_stime, 'max_rss_kb': rusage.ru_maxrss}
+
+
+def _kill(process: Popen, group: bool, on_kill=None):
+    """Kill process, or its process group if it has its own session (see run_measured), then call on_kill."""
+    try:
+        if group:
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass  # exited in the meantime
+    if on_kill is not None:
+        on_kill()
+
+
+class _Watchdog(threading.Thread):
+    """Kills the process group of process after timeout seconds or when cancel is set, whichever comes first."""
+
+    def __init__(self, process: Popen, timeout: float = None, cancel: threading.Event = None, on_kill=None,
+                 interval: float = 0.05):
+        super().__init__(name=f'watchdog-{process.pid}', daemon=True)
+        self.process = process
+        self.on_kill = on_kill
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.cancel = cancel
+        self.interval = interval
+        self.finished = threading.Event()
+        self.timed_out = False
+
+    def run(self):
+        while not self.finished.wait(self.interval):
+            self.timed_out = self.deadline is not None and time.monotonic() > self.deadline
+            if self.timed_out or (self.cancel is not None and self.cancel.is_set()):
+                _kill(self.process, group=True, on_kill=self.on_kill)
+                return
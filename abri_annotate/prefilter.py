@@ -0,0 +1,108 @@
+import os
+import hashlib
+from tempfile import mkstemp
+
+import numpy as np
+
+# blastn -task blastn (used by abricate) only extends seeds, i.e. exact matches of word_size=11 nucleotides. A genome
+# that shares no 11-mer with a database can therefore not have any hit in it, whatever --minid and --mincov are.
+K = 11
+
+# n bases of unrelated sequence share about n * d / (4**11 / 2) 11-mers by chance with a db of d distinct canonical
+# 11-mers. Already a db of a single gene (d ~ 1000) shares ~20 with an input of MAX_BASES, so larger inputs are not
+# screened at all: no db could be skipped. Real ABRicate dbs have thousands of genes, i.e. this limit is far too high
+# for them, but it keeps the screen for small custom dbs.
+MAX_BASES = 40_000
+
+_CODES = np.full(256, 4, dtype=np.uint8)
+for _i, _base in enumerate('ACGT'):
+    _CODES[ord(_base)] = _CODES[ord(_base.lower())] = _i
+
+
+def concat_sequences(lines: [str]) -> bytes:
+    """:return: the sequences of FASTA lines, separated by N, so that no k-mer spans two sequences"""
+    chunks = []
+    for line in lines:
+        chunks.append('N' if line.startswith('>') else line.strip())
+    return ''.join(chunks).encode('ascii', errors='replace')
+
+
+def kmer_codes(sequence: bytes, k: int = K) -> np.ndarray:
+    """
+    :return: the canonical k-mers (the smaller of the k-mer and its reverse complement, 2 bits per base) of the
+             sequence, k-mers with other characters than ACGT are skipped
+    """
+    assert 1 <= k <= 16, f'k must be between 1 and 16: {k=}'
+    bases = _CODES[np.frombuffer(sequence, dtype=np.uint8)]
+    n = len(bases) - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint32)
+
+    forward = np.zeros(n, dtype=np.uint32)
+    reverse = np.zeros(n, dtype=np.uint32)
+    for j in range(k):
+        window = bases[j:j + n].astype(np.uint32)
+        forward = (forward << 2) | (window & 3)
+        reverse |= (3 - (window & 3)) << (2 * j)
+
+    invalid = np.concatenate([[0], np.cumsum(bases == 4)])
+    valid = invalid[k:] == invalid[:n]
+    return np.minimum(forward, reverse)[valid]
+
+
+def build_sketch(lines: [str], k: int = K) -> np.ndarray:
+    """:return: bit array of all 4**k k-mers, set for the canonical k-mers of the sequences (FASTA lines)"""
+    bits = np.zeros(4 ** k, dtype=bool)
+    bits[kmer_codes(concat_sequences(lines), k=k)] = True
+    return np.packbits(bits)
+
+
+def shares_kmers(sketch: np.ndarray, codes: np.ndarray) -> bool:
+    """:param codes: output of kmer_codes"""
+    return bool(np.any(sketch[codes >> 3] & (np.uint8(128) >> (codes & 7).astype(np.uint8))))
+
+
+class DbSketches:
+    """
+    The k-mer sketches of ABRicate databases (build_sketch, 4**11 bits = 512 KiB per db), kept in memory and, if
+    directory is given, stored in {directory}/{db}.{key}.npy. The key changes with the version of the db.
+    """
+
+    def __init__(self, directory: str = None, k: int = K):
+        self.directory = None if directory is None else os.path.abspath(directory)
+        self.k = k
+        self.sketches = {}
+
+    def _path(self, db: str, db_version: str) -> str:
+        key = hashlib.sha256(f'{db}\t{db_version}\tk={self.k}'.encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f'{db}.{key}.npy')
+
+    def get(self, db: str, db_version: str, read_sequences) -> np.ndarray:
+        """:param read_sequences: function that returns the lines of the sequences file of db"""
+        if (db, db_version) in self.sketches:
+            return self.sketches[(db, db_version)]
+
+        path = None if self.directory is None else self._path(db, db_version)
+        if path is not None and os.path.isfile(path):
+            sketch = np.load(path)
+        else:
+            sketch = build_sketch(read_sequences(db), k=self.k)
+            if path is not None:
+                os.makedirs(self.directory, exist_ok=True)
+                # write next to the final location, then rename: concurrent readers never see a partial file
+                fd, tmp = mkstemp(dir=self.directory, prefix=f'.{db}-', suffix='.npy')
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, sketch)
+                os.replace(tmp, path)
+        self.sketches[(db, db_version)] = sketch
+        return sketch
+
+    def screen(self, fasta: str, dbs: {str: str}, read_sequences) -> {str: bool}:
+        """
+        :param dbs: maps the dbs to their version (see ABRiannotate.db_version)
+        :return: maps the dbs to whether fasta shares at least one k-mer with them, i.e. whether abricate may find hits
+        """
+        with open(fasta) as f:
+            codes = kmer_codes(concat_sequences(f), k=self.k)
+        return {db: shares_kmers(self.get(db, db_version, read_sequences), codes) for db, db_version in dbs.items()}
+
@@ -0,0 +1,67 @@
+import pandas as pd
+
+HIT_FORMATS = ['parquet', 'arrow']
+
+CATEGORICAL_COLUMNS = ['genome_identifier', 'db', 'gene', 'annotation', 'locus_tag', 'scaffold']
+
+
+def hits_table(abricate_df: pd.DataFrame, assignments: pd.DataFrame, db: str, annotations: [str],
+               bad_hits: [bool]) -> pd.DataFrame:
+    """
+    Combine the output of ABRicate with the gene assignments into one row per hit.
+
+    :param assignments: output of GeneIndex.assign
+    :param annotations: annotation name per hit, None if the hit was not used
+    :param bad_hits: per hit, whether the distance to the closest gene was large
+    """
+    return pd.DataFrame({
+        'db': db,
+        'gene': abricate_df.GENE.to_numpy(),
+        'annotation': annotations,
+        'locus_tag': assignments.gene.to_numpy(),
+        'scaffold': abricate_df.SEQUENCE.to_numpy(),
+        'start': abricate_df.START.to_numpy(dtype='int64'),
+        'end': abricate_df.END.to_numpy(dtype='int64'),
+        'strand': abricate_df.STRAND.to_numpy(),
+        'coverage': abricate_df['%COVERAGE'].to_numpy(dtype='float64'),
+        'identity': abricate_df['%IDENTITY'].to_numpy(dtype='float64'),
+        'accession': abricate_df.ACCESSION.to_numpy(),
+        'product': abricate_df.PRODUCT.to_numpy(),
+        'resistance': abricate_df.RESISTANCE.to_numpy(),
+        'distance': assignments.distance.to_numpy(dtype='float64'),
+        'overlap': assignments.overlap.to_numpy(dtype='float64'),
+        'bad_hit': pd.array(bad_hits, dtype='bool'),
+        'used': pd.array([annotation is not None for annotation in annotations], dtype='bool'),
+    })
+
+
+def concat_hits(hits_dfs: [pd.DataFrame], genome_identifier: str) -> pd.DataFrame:
+    """Concatenate the hit tables of multiple databases and convert the repetitive columns to categoricals."""
+    hits_df = pd.concat(hits_dfs, ignore_index=True)
+    hits_df.insert(0, 'genome_identifier', genome_identifier)
+    for column in CATEGORICAL_COLUMNS:
+        hits_df[column] = hits_df[column].astype('category')
+    return hits_df
+
+
+def write_hits(hits_df: pd.DataFrame, file: str, format: str):
+    """Write the hit table as Parquet or Arrow IPC (requires pyarrow)."""
+    assert format in HIT_FORMATS, f'Unknown format: {format}! Choose one of {HIT_FORMATS}'
+    try:
+        import pyarrow
+        import pyarrow.feather
+    except ImportError:
+        raise ImportError(f'Writing hits as {format} requires pyarrow: pip install pyarrow')
+
+    if format == 'parquet':
+        hits_df.to_parquet(file, index=False)
+    else:
+        pyarrow.feather.write_feather(pyarrow.Table.from_pandas(hits_df, preserve_index=False), file)
+
+
+def read_hits(file: str) -> pd.DataFrame:
+    """Read a hit table written by write_hits."""
+    import pyarrow.feather
+    if file.endswith('.parquet'):
+        return pd.read_parquet(file)
+    return pyarrow.feather.read_feather(file)
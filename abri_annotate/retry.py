@@ -0,0 +1,168 @@
+import time
+import random
+import threading
+from statistics import median
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .errors import AbricateError
+from .utils import logger
+
+
+class RetryPolicy:
+    """
+    How abricate calls deal with hanging and failing processes.
+
+    :param timeout: seconds after which a call is killed (AbricateTimeout), None: no limit
+    :param retries: how often a call that failed transiently (AbricateError.transient, e.g. a timeout) is retried
+    :param backoff: seconds before the first retry, doubled for every further retry up to max_backoff. The actual
+                    delay is randomized between half and the full value, so that parallel workers do not retry in sync.
+    :param hedge: start a second, identical call when a call takes hedge times longer than usual for its db; the
+                  first to succeed wins and the other one is killed. None: never. Usual is the median time per byte
+                  of input of the last history successful calls of the db, so hedging starts after min_history calls.
+    :param hedge_min_s: never hedge before this many seconds
+    """
+
+    def __init__(self, timeout: float = None, retries: int = 0, backoff: float = 1, max_backoff: float = 60,
+                 hedge: float = None, hedge_min_s: float = 10, history: int = 50, min_history: int = 5):
+        assert timeout is None or timeout > 0, f'timeout must be positive: {timeout=}'
+        assert retries >= 0, f'retries must not be negative: {retries=}'
+        assert hedge is None or hedge > 1, f'hedge must be larger than 1: {hedge=}'
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge
+        self.hedge_min_s = hedge_min_s
+        self.history = history
+        self.min_history = min_history
+        self.runtimes = {}  # db: deque of seconds per byte of input
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # e.g. copied into the workers of run_batch
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def delay(self, attempt: int) -> float:
+        """:return: seconds to wait before retry number attempt + 1"""
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1)
+
+    def record(self, db: str, size: int, seconds: float):
+        """Record the runtime of a successful call of db on an input of size bytes."""
+        with self._lock:
+            self.runtimes.setdefault(db, deque(maxlen=self.history)).append(seconds / max(size, 1))
+
+    def hedge_after(self, db: str, size: int) -> float:
+        """:return: seconds after which a call of db on an input of size bytes is hedged, None: never"""
+        if self.hedge is None:
+            return None
+        with self._lock:
+            runtimes = list(self.runtimes.get(db, []))
+        if len(runtimes) < self.min_history:
+            return None
+        return max(self.hedge_min_s, self.hedge * median(runtimes) * max(size, 1))
+
+    def _should_retry(self, error: AbricateError, attempt: int, description: str) -> float:
+        """:return: seconds to wait before retrying, None: give up"""
+        error.attempts = attempt + 1
+        if not error.transient or attempt >= self.retries:
+            return None
+        delay = self.delay(attempt)
+        logger.warning(f'{description} failed ({type(error).__name__}, returncode={error.returncode}), '
+                       f'retry {attempt + 1}/{self.retries} in {delay:.1f}s')
+        return delay
+
+    def call(self, run, description: str, db: str = None, size: int = None):
+        """
+        :param run: function(cancel: threading.Event), must stop early when cancel is set, raises AbricateError. cancel
+                    is None if the call is not hedged.
+        :param db: hedge based on the runtimes of this db, for an input of size bytes. None: do not hedge
+        :return: result of run, number of attempts and whether the successful attempt was hedged
+        """
+        hedge_after = None if db is None else self.hedge_after(db, size)
+        for attempt in range(self.retries + 1):
+            try:
+                result, hedged = run_hedged(run, hedge_after=hedge_after)
+                return result, attempt + 1, hedged
+            except AbricateError as e:
+                delay = self._should_retry(e, attempt, description)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    async def call_async(self, run, description: str, db: str = None, size: int = None):
+        """Like call, but run is a coroutine function without arguments, cancelling it must stop it."""
+        import asyncio
+
+        hedge_after = None if db is None else self.hedge_after(db, size)
+        for attempt in range(self.retries + 1):
+            try:
+                result, hedged = await run_hedged_async(run, hedge_after=hedge_after)
+                return result, attempt + 1, hedged
+            except AbricateError as e:
+                delay = self._should_retry(e, attempt, description)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+
+def run_hedged(run, hedge_after: float = None):
+    """
+    :param run: function(cancel: threading.Event), must stop early when cancel is set
+    :param hedge_after: seconds after which a second run is started if the first one is still running, None: never
+                        (run gets cancel=None, there is nothing to cancel)
+    :return: the result of the first run that succeeded and whether a second run was started
+    """
+    if hedge_after is None:
+        return run(None), False
+
+    cancel = threading.Event()  # stops the slower run once one has succeeded
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(run, cancel)]
+        if not wait(futures, timeout=hedge_after).done:
+            logger.warning(f'Call is still running after {hedge_after:.1f}s, starting a hedged call')
+            futures.append(executor.submit(run, cancel))
+
+        pending, errors = set(futures), []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    cancel.set()
+                    return future.result(), len(futures) > 1
+                errors.append(future.exception())
+        raise errors[0]
+
+
+async def run_hedged_async(run, hedge_after: float = None):
+    """Like run_hedged, but run is a coroutine function without arguments. The slower run is cancelled."""
+    import asyncio
+
+    if hedge_after is None:
+        return await run(), False
+
+    tasks = [asyncio.ensure_future(run())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done:
+            logger.warning(f'Call is still running after {hedge_after:.1f}s, starting a hedged call')
+            tasks.append(asyncio.ensure_future(run()))
+
+        pending, errors = set(tasks), []
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), len(tasks) > 1
+                errors.append(task.exception())
+        raise errors[0]
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import multiprocessing
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class CpuBudget:
+    """
+    A fixed number of CPUs shared by concurrent abricate calls, possibly of several genomes.
+
+    Tasks announce their weight (e.g. the size of the database) with add_pending before they start. When a task
+    starts, it waits for a free CPU and gets a share of the free CPUs that corresponds to its share of the pending
+    weight, i.e. while there are more tasks than CPUs, each call runs single-threaded; towards the end of a run, the
+    remaining calls get more threads, the larger their database, the more.
+
+    Based on multiprocessing primitives, so a budget can be shared by the threads of one process as well as by
+    worker processes (pass it to them when they are created, e.g. via the initializer of a ProcessPoolExecutor).
+
+    :param context: multiprocessing context of the worker processes that will share the budget
+    """
+
+    def __init__(self, cpus: int, context=None):
+        assert cpus >= 1, f'cpus must be at least 1: {cpus=}'
+        context = context or multiprocessing.get_context()
+        self.cpus = cpus
+        self._condition = context.Condition()
+        self._free = context.Value('i', cpus, lock=False)
+        self._pending = context.Value('d', 0., lock=False)
+
+    @property
+    def free(self) -> int:
+        with self._condition:
+            return self._free.value
+
+    def add_pending(self, weight: float):
+        assert weight > 0, f'weight must be positive: {weight=}'
+        with self._condition:
+            self._pending.value += weight
+
+    def acquire(self, weight: float) -> int:
+        """Wait for a free CPU and take a task of this weight out of the pending tasks. :return: number of threads"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._free.value > 0)
+            pending = max(self._pending.value, weight)
+            threads = max(1, min(self._free.value, round(self._free.value * weight / pending)))
+            self._pending.value = max(0., self._pending.value - weight)
+            self._free.value -= threads
+            return threads
+
+    def release(self, threads: int):
+        with self._condition:
+            self._free.value += threads
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, weight: float):
+        threads = self.acquire(weight)
+        try:
+            yield threads
+        finally:
+            self.release(threads)
+
+
+def db_weights(db_versions: pd.DataFrame, dbs: [str]) -> {str: float}:
+    """:return: relative cost of running abricate on each db, its number of sequences (SEQUENCES of abricate --list)"""
+    return {db: max(1., float(db_versions.loc[db, 'SEQUENCES'])) for db in dbs}
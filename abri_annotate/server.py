@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import uuid
+import queue
+import socketserver
+import threading
+import multiprocessing
+from functools import partial
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ProcessPoolExecutor
+
+from .ABRiannotate import ABRiannotate
+from .batch import _init_worker, _annotate
+from .scheduler import CpuBudget
+from .utils import logger, init_console_logging
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobServer:
+    """
+    Runs annotation jobs on warm worker processes. Each worker receives a copy of abr, so version and db_versions
+    are determined only once, when the server starts.
+
+    Jobs wait in a bounded queue until a worker is free; when the queue is full, submit raises QueueFull.
+
+    :param max_finished: number of finished jobs whose status is kept, older ones are forgotten (unknown job)
+    :param cpus: number of CPUs for all abricate calls of all running jobs together, see abriannotate_multidb
+    :param multidb_kwargs: passed on to abriannotate_multidb for every job
+    """
+
+    def __init__(self, abr: ABRiannotate, processes: int = 1, max_queue: int = 100, max_finished: int = 1000,
+                 verbose: bool = True, abricate_dir: str = None, cpus: int = None, **multidb_kwargs):
+        assert processes >= 1, f'processes must be at least 1: {processes=}'
+        assert max_finished >= 0, f'max_finished must not be negative: {max_finished=}'
+        # populate the cached properties before abr is copied into the workers
+        logger.info(f'Starting server with {abr.version}...')
+        logger.info(f'Available databases: {abr.db_versions}...')
+
+        self.abr = abr
+        self.verbose = verbose
+        self.abricate_dir = abricate_dir
+        self.multidb_kwargs = multidb_kwargs
+        self.jobs = {}
+        self.max_finished = max_finished
+        self._finished = deque()  # ids of the finished jobs in self.jobs, oldest first
+        self._forgotten = Counter()  # status: number of finished jobs removed from self.jobs
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._slots = threading.BoundedSemaphore(processes)
+        # the server is multi-threaded, so do not fork workers from it
+        context = multiprocessing.get_context('spawn')
+        cpu_budget = None if cpus is None else CpuBudget(cpus, context=context)
+        self._executor = ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                             initargs=(abr, cpu_budget), mp_context=context)
+        self._dispatcher = threading.Thread(target=self._dispatch, name='dispatcher', daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, gbk: str, genome_identifier: str, outdir: str, dbs: [str] = None) -> dict:
+        """:return: the new job, see status"""
+        assert os.path.isfile(gbk), f'gbk does not exist: {gbk}'
+        for db in dbs or []:
+            assert db in self.abr.db_versions.index, f'db={db} does not exist. ABRicate has these dbs: {self.abr.db_versions.index.to_list()}'
+
+        job = {
+            'id': uuid.uuid4().hex, 'status': 'queued', 'gbk': os.path.abspath(gbk),
+            'genome_identifier': genome_identifier, 'outdir': os.path.abspath(outdir), 'dbs': dbs,
+            'submitted': time.time(), 'started': None, 'finished': None,
+            'n_genes': None, 'n_annotations': None, 'error': None,
+        }
+        with self._lock:
+            try:
+                self._queue.put_nowait(job['id'])
+            except queue.Full:
+                raise QueueFull(f'The queue is full ({self._queue.maxsize} jobs), try again later.')
+            self.jobs[job['id']] = job
+        logger.info(f'Queued job {job["id"]}: {genome_identifier} ({gbk})')
+        return dict(job)
+
+    def status(self, job_id: str) -> dict:
+        """:return: copy of the job or None if it does not exist"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return None if job is None else dict(job)
+
+    def summary(self) -> dict:
+        with self._lock:
+            statuses = Counter(job['status'] for job in self.jobs.values()) + self._forgotten
+        return {
+            'version': self.abr.version,
+            **{status: statuses[status] for status in ['queued', 'running', 'success', 'failed']}
+        }
+
+    def _dispatch(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                break
+            self._slots.acquire()  # wait for a free worker, so that the status 'running' is accurate
+            with self._lock:
+                job = self.jobs[job_id]
+                job.update(status='running', started=time.time())
+            kwargs = self.multidb_kwargs if job['dbs'] is None else {**self.multidb_kwargs, 'dbs': job['dbs']}
+            future = self._executor.submit(_annotate, job['gbk'], job['genome_identifier'], job['outdir'],
+                                           self.verbose, self.abricate_dir, kwargs)
+            future.add_done_callback(partial(self._done, job_id))
+
+    def _done(self, job_id: str, future):
+        self._slots.release()
+        try:
+            result = future.result()
+            update = {k: result[k] for k in ['status', 'n_genes', 'n_annotations', 'error']}
+        except Exception as e:  # e.g. a crashed worker process
+            update = {'status': 'failed', 'error': f'{type(e).__name__}: {e}'}
+        with self._lock:
+            self.jobs[job_id].update(finished=time.time(), **update)
+            self._finished.append(job_id)
+            while len(self._finished) > self.max_finished:
+                self._forgotten[self.jobs.pop(self._finished.popleft())['status']] += 1
+        logger.info(f'Finished job {job_id}: {update["status"]}')
+
+    def close(self, wait: bool = True):
+        self._queue.put(None)
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API:
+
+    - POST /jobs with {"gbk": ..., "genome_identifier": ..., "outdir": ..., "dbs": [...] (optional)}: submit a job
+    - GET /jobs/<id>: status of a job
+    - GET /jobs: status of all jobs
+    - GET /health: ABRicate version and number of jobs per status
+    """
+    job_server: JobServer = None
+
+    def _send(self, code: int, content):
+        body = json.dumps(content).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, self.job_server.summary())
+        elif self.path == '/jobs':
+            with self.job_server._lock:
+                jobs = [dict(job) for job in self.job_server.jobs.values()]
+            self._send(200, jobs)
+        elif self.path.startswith('/jobs/'):
+            job = self.job_server.status(self.path[len('/jobs/'):])
+            self._send(404, {'error': 'unknown job'}) if job is None else self._send(200, job)
+        else:
+            self._send(404, {'error': f'unknown path: {self.path}'})
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            return self._send(404, {'error': f'unknown path: {self.path}'})
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            job = self.job_server.submit(
+                gbk=request['gbk'], genome_identifier=request['genome_identifier'], outdir=request['outdir'],
+                dbs=request.get('dbs'))
+        except QueueFull as e:
+            return self._send(503, {'error': str(e)})
+        except (ValueError, KeyError, TypeError, AssertionError) as e:
+            return self._send(400, {'error': f'{type(e).__name__}: {e}'})
+        self._send(202, job)
+
+    def address_string(self) -> str:
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format: str, *args):
+        logger.debug(f'{self.address_string()} - {format % args}')
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_http_server(job_server: JobServer, host: str = '127.0.0.1', port: int = 8765, socket: str = None):
+    """:param socket: listen on this Unix socket instead of host:port"""
+    handler = type('JobRequestHandler', (RequestHandler,), {'job_server': job_server})
+    if socket:
+        if os.path.exists(socket):
+            os.remove(socket)
+        return UnixHTTPServer(socket, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(abr: ABRiannotate, host: str = '127.0.0.1', port: int = 8765, socket: str = None, processes: int = 1,
+          max_queue: int = 100, max_finished: int = 1000, verbose: bool = True, **multidb_kwargs):
+    init_console_logging()
+    job_server = JobServer(abr, processes=processes, max_queue=max_queue, max_finished=max_finished, verbose=verbose,
+                           **multidb_kwargs)
+    http_server = create_http_server(job_server, host=host, port=port, socket=socket)
+    logger.info(f'Listening on {socket or f"http://{host}:{http_server.server_address[1]}"}')
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
+        job_server.close(wait=False)
+        if socket and os.path.exists(socket):
+            os.remove(socket)
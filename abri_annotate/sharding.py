@@ -0,0 +1,69 @@
+import os
+import heapq
+
+import pandas as pd
+
+
+def fasta_lengths(fasta: str) -> {str: int}:
+    """:return: maps the sequence names to their lengths, in the order of the file"""
+    lengths = {}
+    name = None
+    with open(fasta) as f:
+        for line in f:
+            if line.startswith('>'):
+                name = line[1:].split()[0]
+                lengths[name] = 0
+            else:
+                lengths[name] += len(line.strip())
+    return lengths
+
+
+def balance(lengths: {str: int}, n_shards: int) -> [[str]]:
+    """
+    Distribute sequences into at most n_shards groups of similar total length (longest sequence first into the
+    currently shortest group). Empty groups are dropped.
+    """
+    assert n_shards >= 1, f'n_shards must be at least 1: {n_shards=}'
+    heap = [(0, i) for i in range(n_shards)]
+    shards = [[] for _ in range(n_shards)]
+    for name in sorted(lengths, key=lambda name: -lengths[name]):
+        total, i = heapq.heappop(heap)
+        shards[i].append(name)
+        heapq.heappush(heap, (total + lengths[name], i))
+    return [shard for shard in shards if shard]
+
+
+def write_shards(fasta: str, n_shards: int) -> [str]:
+    """
+    Split a FASTA file into up to n_shards files ({fasta}.shard{i}.fasta) of similar total sequence length.
+
+    :return: list of the shard files
+    """
+    shards = balance(fasta_lengths(fasta), n_shards)
+    base = os.path.splitext(fasta)[0]
+    files = [f'{base}.shard{i}.fasta' for i in range(len(shards))]
+    shard_of = {name: i for i, shard in enumerate(shards) for name in shard}
+
+    handles = [open(file, 'w') for file in files]
+    try:
+        with open(fasta) as f:
+            out = None
+            for line in f:
+                if line.startswith('>'):
+                    out = handles[shard_of[line[1:].split()[0]]]
+                out.write(line)
+    finally:
+        for handle in handles:
+            handle.close()
+    return files
+
+
+def merge_shard_hits(abricate_dfs: [pd.DataFrame], file: str) -> pd.DataFrame:
+    """
+    Concatenate the output of ABRicate on multiple shards as if ABRicate had been run on file.
+
+    Hits are sorted by sequence and start like ABRicate does.
+    """
+    abricate_df = pd.concat(abricate_dfs, ignore_index=True)
+    abricate_df['#FILE'] = file
+    return abricate_df.sort_values(['SEQUENCE', 'START'], kind='stable', ignore_index=True)
@@ -0,0 +1,122 @@
+import time
+import sqlite3
+
+import pandas as pd
+
+HIT_COLUMNS = ['genome_identifier', 'db', 'gene', 'annotation', 'locus_tag', 'scaffold', 'start', 'end', 'strand',
+               'coverage', 'identity', 'accession', 'product', 'resistance', 'distance', 'overlap', 'bad_hit', 'used']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS genomes (
+    genome_identifier TEXT PRIMARY KEY,
+    gbk TEXT,
+    abricate_version TEXT,
+    n_genes INTEGER,
+    n_annotations INTEGER,
+    created REAL
+);
+CREATE TABLE IF NOT EXISTS db_versions (
+    genome_identifier TEXT,
+    db TEXT,
+    db_version TEXT,
+    PRIMARY KEY (genome_identifier, db)
+);
+CREATE TABLE IF NOT EXISTS hits (
+    genome_identifier TEXT NOT NULL,
+    db TEXT NOT NULL,
+    gene TEXT,
+    annotation TEXT,
+    locus_tag TEXT,
+    scaffold TEXT,
+    start INTEGER,
+    "end" INTEGER,
+    strand TEXT,
+    coverage REAL,
+    identity REAL,
+    accession TEXT,
+    product TEXT,
+    resistance TEXT,
+    distance REAL,
+    overlap REAL,
+    bad_hit INTEGER,
+    used INTEGER
+);
+CREATE INDEX IF NOT EXISTS hits_genome ON hits (genome_identifier);
+CREATE INDEX IF NOT EXISTS hits_db ON hits (db);
+CREATE INDEX IF NOT EXISTS hits_gene ON hits (gene);
+CREATE INDEX IF NOT EXISTS hits_locus_tag ON hits (locus_tag);
+'''
+
+
+class ResultStore:
+    """
+    SQLite file with the results of many genomes:
+
+    - genomes: one row per genome (input file, ABRicate version, number of annotated genes and annotations)
+    - db_versions: the version of each db a genome was annotated with
+    - hits: the hit table (see results.hits_table), i.e. the raw hits of ABRicate and the genes they were assigned to
+
+    Writing a genome replaces its previous results in one transaction. Several processes on the same host may write
+    concurrently. Do not share the file between nodes: SQLite locking is not reliable on network filesystems.
+
+    :param wal: use write-ahead logging, so that readers do not block the writer and vice versa. WAL needs shared
+                memory, i.e. all processes that use the file must run on the same host, and the file must be on a
+                local filesystem. Once enabled, the file stays in WAL mode.
+    """
+
+    def __init__(self, file: str, timeout: float = 60, wal: bool = False):
+        self.file = file
+        self.timeout = timeout
+        with self._connect() as connection:
+            if wal:
+                connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.file, timeout=self.timeout)
+
+    def write(self, genome_identifier: str, hits_df: pd.DataFrame, version: str, db_versions: {str: str},
+              gbk: str = None, n_genes: int = None, n_annotations: int = None):
+        """
+        :param hits_df: output of results.concat_hits
+        :param db_versions: maps the dbs to their version (ABRiannotate.db_version)
+        """
+        hits = hits_df[HIT_COLUMNS].astype(object).where(hits_df[HIT_COLUMNS].notna(), None)
+        hits['bad_hit'] = hits['bad_hit'].map(lambda value: None if value is None else int(value))
+        hits['used'] = hits['used'].map(lambda value: None if value is None else int(value))
+
+        connection = self._connect()
+        try:
+            with connection:  # one transaction, rolled back on errors
+                connection.execute('BEGIN IMMEDIATE')
+                for table in ['genomes', 'db_versions', 'hits']:
+                    connection.execute(f'DELETE FROM {table} WHERE genome_identifier = ?', (genome_identifier,))
+                connection.execute('INSERT INTO genomes VALUES (?, ?, ?, ?, ?, ?)',
+                                   (genome_identifier, gbk, version, n_genes, n_annotations, time.time()))
+                connection.executemany('INSERT INTO db_versions VALUES (?, ?, ?)',
+                                       [(genome_identifier, db, v) for db, v in db_versions.items()])
+                connection.executemany(f'INSERT INTO hits VALUES ({", ".join("?" * len(HIT_COLUMNS))})',
+                                       hits.itertuples(index=False, name=None))
+        finally:
+            connection.close()
+
+    def query(self, sql: str, params: tuple = ()) -> pd.DataFrame:
+        connection = self._connect()
+        try:
+            return pd.read_sql_query(sql, connection, params=params)
+        finally:
+            connection.close()
+
+    def hits(self, genome_identifier: str = None, db: str = None, gene: str = None, locus_tag: str = None,
+             used_only: bool = False) -> pd.DataFrame:
+        """:return: the hits that match all given criteria"""
+        criteria = {'genome_identifier': genome_identifier, 'db': db, 'gene': gene, 'locus_tag': locus_tag}
+        conditions = [f'{column} = ?' for column, value in criteria.items() if value is not None]
+        if used_only:
+            conditions.append('used = 1')
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        return self.query(f'SELECT * FROM hits{where}', tuple(v for v in criteria.values() if v is not None))
+
+    def genomes_with(self, gene: str, db: str = None) -> [str]:
+        """:return: the genomes with at least one used hit of this gene"""
+        return self.hits(gene=gene, db=db, used_only=True).genome_identifier.drop_duplicates().tolist()
@@ -3,6 +3,16 @@ import logging
 logger = logging.getLogger("ABRicate")
 
 
+def init_console_logging():
+    # remove pre-existing handlers
+    logger.handlers.clear()
+
+    logger.setLevel(logging.INFO)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter('%(asctime)s | %(name)s |  %(levelname)s: %(message)s'))
+    logger.addHandler(stream_handler)
+
+
 def init_logfile(genome_identifier, logfile):
     assert genome_identifier is not None, f'Could not set up logging: genome_identifier is undefined!'
 
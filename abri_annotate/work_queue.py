@@ -0,0 +1,264 @@
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+
+from .ABRiannotate import ABRiannotate
+from .utils import logger
+
+STATES = ['pending', 'running', 'done', 'failed']
+
+
+class WorkQueue:
+    """
+    Queue of annotation tasks (one per genome) in a directory on a shared filesystem, e.g. NFS. No broker is needed:
+
+    - pending/{task}.json: submitted tasks
+    - running/{task}.json: claimed by a worker, by renaming the pending file (atomic, so each task has one owner).
+      The worker then writes its claim token into the file and touches it regularly (heartbeat).
+    - done/{task}.json, failed/{task}.json: the results
+
+    Running tasks whose heartbeat stopped (e.g. the node died) are put back into pending by the next worker that
+    notices, or moved to failed after max_attempts claims. If the old worker was merely slow, its heartbeat and
+    complete see that the claim token in the running file is no longer its own and leave the task to the new owner.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+        for state in STATES + ['tmp']:
+            os.makedirs(os.path.join(self.directory, state), exist_ok=True)
+
+    def _path(self, state: str, task_id: str) -> str:
+        return os.path.join(self.directory, state, f'{task_id}.json')
+
+    def _write(self, file: str, content: dict):
+        # write to tmp first, so that a task never appears incomplete
+        tmp = os.path.join(self.directory, 'tmp', f'{uuid.uuid4().hex}.json')
+        with open(tmp, 'w') as f:
+            json.dump(content, f, indent=2)
+        os.replace(tmp, file)
+
+    @staticmethod
+    def _read(file: str) -> dict:
+        with open(file) as f:
+            return json.load(f)
+
+    def tasks(self, state: str) -> [str]:
+        return sorted(file[:-len('.json')] for file in os.listdir(os.path.join(self.directory, state))
+                      if file.endswith('.json'))
+
+    def state(self, task_id: str) -> str:
+        """:return: the state of a task or None if it does not exist"""
+        for state in STATES:
+            if os.path.isfile(self._path(state, task_id)):
+                return state
+        return None
+
+    def submit(self, gbk: str, genome_identifier: str, outdir: str, dbs: [str] = None) -> str:
+        """:return: the task id, i.e. the genome_identifier"""
+        assert os.path.isfile(gbk), f'gbk does not exist: {gbk}'
+        assert genome_identifier and '/' not in genome_identifier and not genome_identifier.startswith('.'), \
+            f'genome_identifier cannot be used as a file name: {genome_identifier!r}'
+        state = self.state(genome_identifier)
+        assert state in [None, 'done', 'failed'], f'{genome_identifier} is already {state}'
+        for previous in ['done', 'failed']:
+            if os.path.isfile(self._path(previous, genome_identifier)):
+                os.remove(self._path(previous, genome_identifier))
+
+        self._write(self._path('pending', genome_identifier), {
+            'gbk': os.path.abspath(gbk), 'genome_identifier': genome_identifier, 'outdir': os.path.abspath(outdir),
+            'dbs': dbs, 'attempts': 0, 'submitted': time.time()
+        })
+        return genome_identifier
+
+    def _claim(self, task_id: str) -> str:
+        """:return: the claim token in the running file or None if the task is not running"""
+        try:
+            return self._read(self._path('running', task_id)).get('claim')
+        except FileNotFoundError:
+            return None
+
+    def claim(self, worker: str = None) -> (str, dict):
+        """
+        :param worker: name of the worker, part of the claim token
+        :return: task id and task of a pending task that now belongs to the caller, or (None, None). task['claim'] is
+                 the token to pass to heartbeat and complete.
+        """
+        for task_id in self.tasks('pending'):
+            try:
+                # the mtime is kept by rename, refresh it so that the task is not immediately considered stale
+                os.utime(self._path('pending', task_id))
+                os.rename(self._path('pending', task_id), self._path('running', task_id))
+            except FileNotFoundError:
+                continue  # another worker was faster
+            task = self._read(self._path('running', task_id))
+            task['claim'] = f'{worker or f"{socket.gethostname()}:{os.getpid()}"}:{uuid.uuid4().hex}'
+            self._write(self._path('running', task_id), task)
+            return task_id, task
+        return None, None
+
+    def heartbeat(self, task_id: str, claim: str = None) -> bool:
+        """
+        :param claim: the token returned by claim, None: do not check the owner
+        :return: False if the task was taken away, i.e. reclaimed as stale
+        """
+        if claim is not None and self._claim(task_id) != claim:
+            return False
+        try:
+            os.utime(self._path('running', task_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def complete(self, task_id: str, result: dict, claim: str = None) -> bool:
+        """
+        :param result: must have the key status ('success' or 'failed')
+        :param claim: the token returned by claim. If the task was reclaimed and is pending or running again, the
+                      result is discarded and the task is left to its new owner. None: do not check the owner.
+        :return: whether the result was stored
+        """
+        running = self._path('running', task_id)
+        task = self._read(running) if os.path.isfile(running) else {}
+        if claim is not None and (task.get('claim', claim) != claim or (not task and self.state(task_id) == 'pending')):
+            logger.warning(f'Task {task_id} was reclaimed by another worker before it finished, discarding the result.')
+            return False
+
+        state, other = ('done', 'failed') if result['status'] == 'success' else ('failed', 'done')
+        self._write(self._path(state, task_id), {**task, **result, 'finished': time.time()})
+        if os.path.isfile(self._path(other, task_id)):
+            os.remove(self._path(other, task_id))  # e.g. given up on after the heartbeat stopped, then finished
+        try:
+            os.remove(running)
+        except FileNotFoundError:
+            logger.warning(f'Task {task_id} was reclaimed by another worker before it finished.')
+        return True
+
+    def reclaim_stale(self, stale_after: float, max_attempts: int = 3) -> [str]:
+        """
+        Put running tasks without a heartbeat for stale_after seconds back into pending.
+
+        :param max_attempts: tasks that were claimed this often are moved to failed instead
+        :return: the reclaimed tasks
+        """
+        reclaimed = []
+        for task_id in self.tasks('running'):
+            running = self._path('running', task_id)
+            try:
+                if time.time() - os.path.getmtime(running) < stale_after:
+                    continue
+                # take the task out of running first, so that only one worker reclaims it
+                reclaiming = os.path.join(self.directory, 'tmp', f'{task_id}.{uuid.uuid4().hex}.reclaim')
+                os.rename(running, reclaiming)
+            except FileNotFoundError:
+                continue
+
+            task = self._read(reclaiming)
+            task['attempts'] = task.get('attempts', 0) + 1
+            if task['attempts'] >= max_attempts:
+                logger.error(f'Task {task_id} failed: no heartbeat in {task["attempts"]} attempts')
+                self._write(self._path('failed', task_id), {
+                    **task, 'status': 'failed', 'error': f'no heartbeat for {stale_after}s in {task["attempts"]} '
+                                                         f'attempts', 'finished': time.time()})
+            else:
+                logger.warning(f'Task {task_id} has had no heartbeat for {stale_after}s, putting it back')
+                self._write(self._path('pending', task_id), task)
+            os.remove(reclaiming)
+            reclaimed.append(task_id)
+        return reclaimed
+
+    def status(self) -> {str: int}:
+        return {state: len(self.tasks(state)) for state in STATES}
+
+    def results(self) -> [dict]:
+        return [self._read(self._path(state, task_id)) for state in ['done', 'failed'] for task_id in self.tasks(state)]
+
+
+class _Heartbeat(threading.Thread):
+    def __init__(self, queue: WorkQueue, task_id: str, claim: str, interval: float):
+        super().__init__(name=f'heartbeat-{task_id}', daemon=True)
+        self.queue = queue
+        self.task_id = task_id
+        self.claim = claim
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if not self.queue.heartbeat(self.task_id, claim=self.claim):
+                logger.warning(f'Lost task {self.task_id}: it was reclaimed by another worker')
+                break
+
+
+def run_worker(abr: ABRiannotate, queue_dir: str, heartbeat: float = 30, stale_after: float = 300,
+               max_attempts: int = 3, poll: float = 5, wait: bool = False, verbose: bool = True,
+               abricate_dir: str = None, **multidb_kwargs) -> int:
+    """
+    Claim and annotate tasks from a WorkQueue until it is empty. Start any number of workers on any node.
+
+    :param heartbeat: seconds between heartbeats
+    :param stale_after: seconds without heartbeat after which a task is considered abandoned
+    :param wait: keep polling for new tasks instead of exiting when the queue is empty
+    :param multidb_kwargs: passed on to abriannotate_multidb
+    :return: number of tasks this worker processed
+    """
+    from .batch import _init_worker, _annotate
+
+    assert stale_after > heartbeat, f'stale_after must be longer than heartbeat: {stale_after=}, {heartbeat=}'
+    queue = WorkQueue(queue_dir)
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    _init_worker(abr)
+    logger.info(f'Worker {worker} started on {queue.directory} with {abr.version}')
+
+    n_tasks = 0
+    while True:
+        queue.reclaim_stale(stale_after=stale_after, max_attempts=max_attempts)
+        task_id, task = queue.claim(worker=worker)
+        if task_id is None:
+            if not wait and not queue.tasks('running'):
+                break
+            time.sleep(poll)  # running tasks of other workers might come back if their worker died
+            continue
+
+        logger.info(f'Worker {worker} claimed {task_id}')
+        beat = _Heartbeat(queue, task_id, claim=task['claim'], interval=heartbeat)
+        beat.start()
+        try:
+            kwargs = multidb_kwargs if task.get('dbs') is None else {**multidb_kwargs, 'dbs': task['dbs']}
+            result = _annotate(task['gbk'], task['genome_identifier'], task['outdir'], verbose, abricate_dir, kwargs)
+        finally:
+            beat.stopped.set()
+            beat.join()
+        if queue.complete(task_id, {**result, 'worker': worker}, claim=task['claim']):
+            n_tasks += 1
+
+    logger.info(f'Worker {worker} done: the queue is empty ({n_tasks} tasks processed)')
+    return n_tasks
+
+
+def submit(queue_dir: str, manifest: str) -> int:
+    """Submit the genomes of a batch manifest (gbk, genome_identifier, outdir). :return: number of tasks"""
+    from .batch import read_manifest
+
+    queue = WorkQueue(queue_dir)
+    genomes = read_manifest(manifest)
+    for gbk, genome_identifier, outdir in genomes:
+        queue.submit(gbk, genome_identifier, outdir)
+    return len(genomes)
+
+
+def status(queue_dir: str, failed: bool = False):
+    """:param failed: list the failed tasks and their errors"""
+    queue = WorkQueue(queue_dir)
+    counts = queue.status()
+    print('\t'.join(f'{state}={n}' for state, n in counts.items()))
+    if failed:
+        for task_id in queue.tasks('failed'):
+            print(f'{task_id}\t{queue._read(queue._path("failed", task_id)).get("error")}')
+
+
+def main():
+    from fire import Fire
+
+    Fire({'submit': submit, 'status': status})
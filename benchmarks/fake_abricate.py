@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Stand-in for ABRicate that produces valid v1 output without running blastn.
+
+Usage: ABRiannotateBash(abricate_path=[sys.executable, 'benchmarks/fake_abricate.py'])
+
+Configuration (environment variables):
+    FAKE_ABRICATE_DATADIR       database folder, created on first use (default: $TMPDIR/fake_abricate_db)
+    FAKE_ABRICATE_DBS           comma-separated databases to create (default: card,ncbi,vfdb,plasmidfinder)
+    FAKE_ABRICATE_GENES         reference genes per database (default: 100)
+    FAKE_ABRICATE_HITS_PER_MB   average number of hits per database and megabase of input (default: 20)
+    FAKE_ABRICATE_LATENCY       seconds to sleep per --db call, to simulate blastn (default: 0)
+    FAKE_ABRICATE_FAULTS        file with one action per line, each --db call consumes the first line: 'ok', 'fail'
+                                (transient error), 'error' (permanent error), 'sleep SECONDS' (straggler),
+                                'truncate' (output cut off in the middle of a line) or 'quote' (an unbalanced quote)
+
+Hits are deterministic per database and scaffold, so running on a subset of the scaffolds (e.g. a shard) reports
+the same hits for these scaffolds.
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import zlib
+import fcntl
+
+VERSION = 'abricate 1.0.1'
+COLUMNS = ['#FILE', 'SEQUENCE', 'START', 'END', 'STRAND', 'GENE', 'COVERAGE', 'COVERAGE_MAP', 'GAPS', '%COVERAGE',
+           '%IDENTITY', 'DATABASE', 'ACCESSION', 'PRODUCT', 'RESISTANCE']
+DEFAULT_DATADIR = os.environ.get('FAKE_ABRICATE_DATADIR', os.path.join(tempfile.gettempdir(), 'fake_abricate_db'))
+
+
+def create_datadir(datadir: str):
+    """
+    Build the databases in a temporary directory next to datadir, then rename it: concurrent calls (e.g. parallel
+    workers on a fresh datadir) never see a half-written datadir. Does nothing if datadir exists.
+    """
+    dbs = os.environ.get('FAKE_ABRICATE_DBS', 'card,ncbi,vfdb,plasmidfinder').split(',')
+    n_genes = int(os.environ.get('FAKE_ABRICATE_GENES', 100))
+    datadir = os.path.abspath(datadir)
+    if os.path.isdir(datadir):
+        return
+    os.makedirs(os.path.dirname(datadir), exist_ok=True)
+    builddir = tempfile.mkdtemp(dir=os.path.dirname(datadir), prefix=f'.{os.path.basename(datadir)}-')
+    try:
+        for db in dbs:
+            os.makedirs(os.path.join(builddir, db))
+            with open(os.path.join(builddir, db, 'sequences'), 'w') as f:
+                for i in range(n_genes):
+                    rng = random.Random(f'{db}{i}')
+                    f.write(f'>{db}~~~{db}_gene{i}~~~ACC{i:05d}~~~resistance{i % 7} product of {db}_gene{i}\n')
+                    f.write(''.join(rng.choice('ACGT') for _ in range(rng.randrange(300, 1500))) + '\n')
+        try:
+            os.rename(builddir, datadir)
+        except OSError:
+            # built concurrently by another process
+            assert os.path.isdir(datadir), f'Failed to move datadir to {datadir}'
+    finally:
+        shutil.rmtree(builddir, ignore_errors=True)  # no-op after a successful rename
+
+
+def list_dbs(datadir: str) -> [str]:
+    return sorted(db for db in os.listdir(datadir) if os.path.isfile(os.path.join(datadir, db, 'sequences')))
+
+
+def read_genes(datadir: str, db: str) -> [(str, str, str, str, int)]:
+    """:return: list of (database, gene, accession, resistance, length)"""
+    genes = []
+    with open(os.path.join(datadir, db, 'sequences')) as f:
+        for line in f:
+            if line.startswith('>'):
+                fields = line[1:].strip().split('~~~')
+                genes.append((*fields[:3], fields[3].split(' ')[0] if len(fields) > 3 else '', 0))
+            else:
+                genes[-1] = (*genes[-1][:4], genes[-1][4] + len(line.strip()))
+    return genes
+
+
+def scaffold_lengths(file: str) -> {str: int}:
+    """Read the scaffold lengths of a FASTA or GenBank file."""
+    lengths = {}
+    name = None
+    with open(file) as f:
+        for line in f:
+            if line.startswith('>'):
+                name = line[1:].split()[0]
+                lengths[name] = 0
+            elif line.startswith('LOCUS'):
+                fields = line.split()
+                lengths[fields[1]] = int(fields[2])
+                name = None
+            elif name is not None:
+                lengths[name] += len(line.strip())
+    return lengths
+
+
+def score(row: list) -> float:
+    """:return: stand-in for the bitscore of a hit: length times identity"""
+    return (row[3] - row[2] + 1) * float(row[10])
+
+
+def cull(rows: [list]) -> [list]:
+    """Like blastn -culling_limit 1: drop hits enveloped by a higher-scoring hit on the same scaffold, of any db."""
+    kept = []
+    for row in sorted(rows, key=score, reverse=True):
+        if not any(score(other) > score(row) and other[1] == row[1] and other[2] <= row[2] and other[3] >= row[3]
+                   for other in kept):
+            kept.append(row)
+    return kept
+
+
+def hits(file: str, datadir: str, db: str, hits_per_mb: float, culling: bool = True) -> [list]:
+    """
+    :param culling: cull the hits of all source dbs together, as abricate does (blastn -culling_limit 1)
+    """
+    genes_by_database = {}
+    for gene in read_genes(datadir, db):
+        genes_by_database.setdefault(gene[0], []).append(gene)
+
+    # a combined database reports the same hits as its source databases, but culls them together
+    rows = []
+    for source_db, genes in genes_by_database.items():
+        rows.extend(_hits(file, source_db, genes, hits_per_mb))
+    if culling:
+        rows = cull(rows)
+    return sorted(rows, key=lambda row: (row[1], row[2]))
+
+
+def _hits(file: str, source_db: str, genes: [tuple], hits_per_mb: float) -> [list]:
+    rows = []
+    for scaffold, length in scaffold_lengths(file).items():
+        rng = random.Random(zlib.crc32(f'{source_db}\t{scaffold}'.encode()))
+        n_hits = int(hits_per_mb * length / 1e6 + rng.random())
+        for _ in range(n_hits):
+            database, gene, accession, resistance, gene_length = rng.choice(genes)
+            hit_length = min(gene_length, length)
+            if hit_length < 1:
+                continue
+            start = rng.randrange(1, length - hit_length + 2)
+            coverage = round(rng.uniform(80, 100), 2)
+            identity = round(rng.uniform(80, 100), 2)
+            rows.append([
+                file, scaffold, start, start + hit_length - 1, rng.choice('+-'), gene,
+                f'1-{hit_length}/{gene_length}', '=' * 15, '0/0', f'{coverage:.2f}', f'{identity:.2f}',
+                database, accession, f'product of {gene}', resistance
+            ])
+    return rows
+
+
+def next_fault(file: str) -> str:
+    """:return: the first line of file, which is removed, or 'ok' if there is none"""
+    with open(file, 'r+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        lines = f.read().splitlines()
+        f.seek(0)
+        f.truncate()
+        f.write(''.join(f'{line}\n' for line in lines[1:]))
+    return lines[0] if lines else 'ok'
+
+
+def main(args: [str]):
+    datadir = DEFAULT_DATADIR
+    if '--datadir' in args:
+        datadir = args[args.index('--datadir') + 1]
+    elif not os.path.isdir(datadir):
+        create_datadir(datadir)
+
+    if '--help' in args:
+        print(f"  --datadir [X]      Databases folder (default '{DEFAULT_DATADIR}')")
+    elif '--version' in args:
+        print(VERSION)
+    elif '--check' in args:
+        sys.stderr.write('Checking dependencies are installed:\nLooking for \'blastn\' - found (fake)\nOK.\n')
+    elif '--setupdb' in args:
+        for db in list_dbs(datadir):
+            print(f'Formatting {db}', file=sys.stderr)
+    elif '--list' in args:
+        print('DATABASE\tSEQUENCES\tDBTYPE\tDATE')
+        for db in list_dbs(datadir):
+            print(f'{db}\t{len(read_genes(datadir, db))}\tnucl\t2023-Jan-1')
+    elif '--db' in args:
+        db = args[args.index('--db') + 1]
+        assert db in list_dbs(datadir), f'Unknown database: {db}'
+        time.sleep(float(os.environ.get('FAKE_ABRICATE_LATENCY', 0)))
+        fault = next_fault(os.environ['FAKE_ABRICATE_FAULTS']) if 'FAKE_ABRICATE_FAULTS' in os.environ else 'ok'
+        if fault == 'fail':
+            sys.exit('blastn: Resource temporarily unavailable')
+        if fault == 'error':
+            sys.exit('ERROR: fake permanent error')
+        if fault.startswith('sleep'):
+            time.sleep(float(fault.split()[1]))
+        hits_per_mb = float(os.environ.get('FAKE_ABRICATE_HITS_PER_MB', 20))
+        output = '\t'.join(COLUMNS) + '\n' + ''.join(
+            '\t'.join(str(value) for value in row) + '\n'
+            for row in hits(file=args[-1], datadir=datadir, db=db, hits_per_mb=hits_per_mb))
+        if fault == 'quote':
+            output = output.replace('\n', '\n"', 1)
+        sys.stdout.write(output[:len(output) // 2].rstrip('\n') if fault == 'truncate' else output)
+    else:
+        sys.exit(f'Unsupported arguments: {args}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
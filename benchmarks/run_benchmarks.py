@@ -0,0 +1,117 @@
+"""
+Time the stages of abri-annotate on synthetic genomes, using fake_abricate.py instead of ABRicate.
+
+    python benchmarks/run_benchmarks.py --sizes_mb='[1, 5, 20]' --hits='[100, 1000, 10000]' --output=bench.json
+"""
+import os
+import sys
+import json
+import time
+import logging
+import statistics
+from io import StringIO
+from contextlib import redirect_stderr
+from tempfile import TemporaryDirectory
+
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from synthetic import write_genbank
+import fake_abricate
+from abri_annotate import ABRiannotateBash, bash_runner
+from abri_annotate.gene_index import GeneIndex
+from abri_annotate.genbank import write_fasta
+from abri_annotate.utils import logger
+
+FAKE_ABRICATE = [sys.executable, os.path.join(HERE, 'fake_abricate.py')]
+SCAFFOLD_LENGTH = 500_000
+
+
+def timeit(function, repeat: int) -> [float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def fake_hits(fasta: str, datadir: str, db: str, n_hits: int, genome_mb: float) -> pd.DataFrame:
+    """Output of fake_abricate.py as a DataFrame, with about n_hits hits."""
+    rows = fake_abricate.hits(file=fasta, datadir=datadir, db=db, hits_per_mb=n_hits / genome_mb)
+    return pd.read_csv(StringIO('\n'.join('\t'.join(map(str, row)) for row in [fake_abricate.COLUMNS] + rows)), sep='\t')
+
+
+def run_benchmarks(sizes_mb: [float] = (1, 5, 20), hits: [int] = (100, 1000, 10000), n_dbs: [int] = (1, 4),
+                   latency: float = 0.0, repeat: int = 3, output: str = None):
+    """
+    :param sizes_mb: genome sizes in megabases
+    :param hits: number of hits per database for the mapping and merge benchmarks
+    :param n_dbs: number of databases for the merge and runner benchmarks
+    :param latency: simulated runtime of each abricate call in seconds
+    :param repeat: number of repetitions per benchmark; the median is reported
+    :param output: write all timings to this JSON file
+    """
+    logger.setLevel(logging.ERROR)
+    dbs = ['card', 'ncbi', 'vfdb', 'plasmidfinder']
+    results = []
+
+    def report(benchmark: str, timings: [float], **params):
+        result = {'benchmark': benchmark, **params, 'median_s': statistics.median(timings), 'timings_s': timings}
+        results.append(result)
+        print('\t'.join([benchmark, *(f'{k}={v}' for k, v in params.items()), f'{result["median_s"]:.4f}s']))
+
+    with TemporaryDirectory() as tmp:
+        datadir = os.path.join(tmp, 'fake_abricate_db')
+        fake_abricate.create_datadir(datadir)
+        os.environ['FAKE_ABRICATE_DATADIR'] = datadir
+        os.environ['FAKE_ABRICATE_LATENCY'] = str(latency)
+        abr = ABRiannotateBash(abricate_path=FAKE_ABRICATE)
+
+        for size_mb in sizes_mb:
+            gbk = os.path.join(tmp, f'genome_{size_mb}mb.gbk')
+            n_scaffolds = max(1, round(size_mb * 1e6 / SCAFFOLD_LENGTH))
+            n_genes = write_genbank(gbk, n_scaffolds=n_scaffolds, scaffold_length=round(size_mb * 1e6 / n_scaffolds))
+            fasta = os.path.join(tmp, f'genome_{size_mb}mb.fasta')
+            genes_df = abr.load_gbk(gbk)
+            write_fasta(gbk, fasta)
+
+            report('load_gbk', timeit(lambda: abr.load_gbk(gbk), repeat), size_mb=size_mb, n_genes=n_genes)
+
+            for n_hits in hits:
+                abricate_dfs = {db: fake_hits(fasta, datadir, db, n_hits, size_mb) for db in dbs}
+                gene_index = GeneIndex(genes_df)
+
+                report('mapping', timeit(lambda: abr.abriannotate(
+                    gbk=gbk, db='card', gene_index=gene_index, abricate_df=abricate_dfs['card'], save_output=False),
+                    repeat), size_mb=size_mb, n_hits=len(abricate_dfs['card']))
+
+                for n in n_dbs:
+                    with TemporaryDirectory(dir=tmp) as outdir:
+                        report('merge', timeit(lambda: abr._finish_multidb(
+                            gbk=gbk, genome_identifier='bench', outdir=outdir, dbs=dbs[:n], workdir=outdir,
+                            gene_index=gene_index, abricate_dfs=abricate_dfs, anno_prefix='AR:',
+                            markdown_file=None, hits_format=None, return_hits=False), repeat),
+                               size_mb=size_mb, n_hits=n_hits, n_dbs=n)
+
+            for n in n_dbs:
+                def run():
+                    with TemporaryDirectory(dir=tmp) as outdir, redirect_stderr(StringIO()):
+                        bash_runner(abricate_path=FAKE_ABRICATE, gbk=gbk, genome_identifier='bench', outdir=outdir,
+                                    dbs=dbs[:n], verbose=False, max_workers=n)
+                    logger.handlers.clear()
+                    logger.setLevel(logging.ERROR)
+
+                report('runner', timeit(run, repeat), size_mb=size_mb, n_dbs=n, latency=latency)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    from fire import Fire
+
+    Fire(run_benchmarks)
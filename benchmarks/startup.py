@@ -0,0 +1,62 @@
+"""
+Measure the startup time of abri-annotate, i.e. what every per-genome job invocation pays before any work is done.
+
+    python benchmarks/startup.py --repeat=10 --max_import_ms=150
+"""
+import sys
+import time
+import statistics
+from subprocess import run, PIPE
+
+HEAVY_MODULES = ['pandas', 'numpy', 'asyncio', 'fire', 'Bio']
+
+COMMANDS = {
+    'python': [sys.executable, '-c', 'pass'],
+    'import abri_annotate': [sys.executable, '-c', 'import abri_annotate'],
+    'abriannotate-bash --help': [sys.executable, '-m', 'abri_annotate.ABRiannotateBash', '--help'],
+    'abriannotate-docker --help': [sys.executable, '-m', 'abri_annotate.ABRiannotateDocker', '--help'],
+}
+
+
+def heavy_imports(module: str = 'abri_annotate') -> [str]:
+    """:return: the heavy modules that are loaded by importing module"""
+    code = f'import sys, {module}; print(" ".join(m for m in {HEAVY_MODULES} if m in sys.modules))'
+    return run([sys.executable, '-c', code], stdout=PIPE, encoding='utf-8', check=True).stdout.split()
+
+
+def measure(command: [str], repeat: int) -> [float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(command, stdout=PIPE, stderr=PIPE)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main(repeat: int = 10, max_import_ms: float = None):
+    """
+    :param repeat: number of runs per command; the median is reported
+    :param max_import_ms: fail if importing abri_annotate takes longer than this (on top of the interpreter startup)
+    """
+    medians = {}
+    for name, command in COMMANDS.items():
+        medians[name] = statistics.median(measure(command, repeat)) * 1000
+        print(f'{name}\t{medians[name]:.1f} ms')
+
+    heavy = heavy_imports()
+    print(f'heavy modules loaded by import abri_annotate: {heavy or "none"}')
+
+    import_ms = medians['import abri_annotate'] - medians['python']
+    if max_import_ms is not None and import_ms > max_import_ms:
+        sys.exit(f'import abri_annotate takes {import_ms:.1f} ms > {max_import_ms} ms')
+    if heavy:
+        sys.exit(f'import abri_annotate loads heavy modules: {heavy}')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--max_import_ms', type=float, default=None)
+    main(**vars(parser.parse_args()))
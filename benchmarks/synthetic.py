@@ -0,0 +1,56 @@
+"""Generators for synthetic GenBank files of arbitrary size."""
+import random
+
+LINE_LENGTH = 60
+
+
+def _sequence_lines(sequence: str) -> [str]:
+    for i in range(0, len(sequence), LINE_LENGTH):
+        chunk = sequence[i:i + LINE_LENGTH]
+        blocks = ' '.join(chunk[j:j + 10] for j in range(0, len(chunk), 10))
+        yield f'{i + 1:>9} {blocks}\n'
+
+
+def write_genbank(file: str, n_scaffolds: int = 10, scaffold_length: int = 100_000, gene_length: int = 900,
+                  intergenic: int = 150, locus_prefix: str = 'SYN', seed: int = 0) -> int:
+    """
+    Write a GenBank file with n_scaffolds scaffolds (scf_1, scf_2, ...) densely covered with CDS features.
+
+    Genes alternate between strands and their lengths vary by +/- 30%.
+
+    :return: number of genes
+    """
+    rng = random.Random(seed)
+    n_genes = 0
+    with open(file, 'w') as f:
+        for scf in range(1, n_scaffolds + 1):
+            name = f'scf_{scf}'
+            f.write(f'LOCUS       {name:<16} {scaffold_length:>11} bp    DNA     linear   UNK 01-JAN-1980\n')
+            f.write(f'DEFINITION  synthetic scaffold {scf}.\n')
+            f.write(f'ACCESSION   {name}\nVERSION     {name}\n')
+            f.write('FEATURES             Location/Qualifiers\n')
+            f.write(f'     source          1..{scaffold_length}\n')
+            f.write('                     /organism="Synthetic organism"\n')
+
+            position = rng.randrange(1, intergenic + 1)
+            while True:
+                length = int(gene_length * rng.uniform(0.7, 1.3)) // 3 * 3
+                end = position + length - 1
+                if end > scaffold_length:
+                    break
+                n_genes += 1
+                location = f'{position}..{end}'
+                if n_genes % 2 == 0:
+                    location = f'complement({location})'
+                locus_tag = f'{locus_prefix}_{n_genes:06d}'
+                f.write(f'     gene            {location}\n')
+                f.write(f'                     /locus_tag="{locus_tag}"\n')
+                f.write(f'     CDS             {location}\n')
+                f.write(f'                     /locus_tag="{locus_tag}"\n')
+                f.write(f'                     /product="hypothetical protein"\n')
+                position = end + 1 + rng.randrange(1, 2 * intergenic)
+
+            f.write('ORIGIN\n')
+            f.writelines(_sequence_lines(''.join(rng.choices('acgt', k=scaffold_length))))
+            f.write('//\n')
+    return n_genes
@@ -27,11 +27,20 @@ setup(
     ],
     packages=['abri_annotate'],
     include_package_data=True,  # see MANIFEST.in
-    install_requires=['fire', 'pandas', 'biopython'],
+    install_requires=['fire', 'numpy', 'pandas'],
+    extras_require={'arrow': ['pyarrow']},
     entry_points={
         'console_scripts': [
             'abriannotate-bash=abri_annotate.ABRiannotateBash:main',
             'abriannotate-docker=abri_annotate.ABRiannotateDocker:main',
+            'abriannotate-blast=abri_annotate.ABRiannotateBlast:main',
+            'abriannotate-bash-batch=abri_annotate.ABRiannotateBash:main_batch',
+            'abriannotate-docker-batch=abri_annotate.ABRiannotateDocker:main_batch',
+            'abriannotate-bash-serve=abri_annotate.ABRiannotateBash:main_serve',
+            'abriannotate-docker-serve=abri_annotate.ABRiannotateDocker:main_serve',
+            'abriannotate-bash-worker=abri_annotate.ABRiannotateBash:main_worker',
+            'abriannotate-docker-worker=abri_annotate.ABRiannotateDocker:main_worker',
+            'abriannotate-queue=abri_annotate.work_queue:main',
         ]
     },
 )
@@ -0,0 +1,34 @@
+import os
+import sys
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks')
+sys.path.insert(0, BENCHMARKS)  # fake_abricate and synthetic
+
+FAKE_ABRICATE = [sys.executable, os.path.join(BENCHMARKS, 'fake_abricate.py')]
+
+
+class FakeAbricateTestCase(TestCase):
+    """
+    Runs against benchmarks/fake_abricate.py, so no ABRicate installation is needed. Each test class gets its own
+    cls.tempdir, and its fake databases in cls.datadir (created on first use).
+    """
+
+    @classmethod
+    def fake_environ(cls) -> dict:
+        """:return: further FAKE_ABRICATE_* variables for the test class, e.g. FAKE_ABRICATE_HITS_PER_MB"""
+        return {}
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.tempdir = TemporaryDirectory()
+        cls.datadir = os.path.join(cls.tempdir.name, 'db')
+        cls.environ = patch.dict(os.environ, {'FAKE_ABRICATE_DATADIR': cls.datadir, **cls.fake_environ()})
+        cls.environ.start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.environ.stop()
+        cls.tempdir.cleanup()
@@ -0,0 +1,168 @@
+import os
+import sys
+import asyncio
+import shutil
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+import pandas as pd
+
+from helpers import BENCHMARKS, FAKE_ABRICATE, FakeAbricateTestCase
+import fake_abricate
+from synthetic import write_genbank
+from abri_annotate import ABRiannotateBlast, ABRiannotateBash
+from abri_annotate.ABRiannotate import expected_columns
+from abri_annotate.ABRiannotateBlast import blast_to_abricate, coverage_map
+from abri_annotate.combined_db import COMBINED_DB
+
+# qseqid qstart qend qlen sseqid sstart send slen sstrand evalue length pident gaps gapopen stitle bitscore
+BLAST_OUTPUT = '''\
+scf_2\t501\t1400\t5000\tcard~~~tetM~~~A1~~~tetracycline\t1\t900\t900\tplus\t0.0\t900\t99.889\t0\t0\tcard~~~tetM~~~A1~~~tetracycline Tet(M) protein\t1657
+scf_1\t1001\t1900\t5000\tcard~~~ErmB~~~A2~~~macrolide\t900\t1\t910\tminus\t0.0\t902\t98.000\t4\t1\tcard~~~ErmB~~~A2~~~macrolide ErmB\t1589
+scf_1\t3001\t3200\t5000\tcard~~~blaZ~~~A3~~~beta-lactam\t1\t200\t800\tplus\t1e-50\t200\t100.000\t0\t0\tcard~~~blaZ~~~A3~~~beta-lactam BlaZ\t370
+'''
+# a combined database: ncbi and card both have tet(M), card has a second, worse hit in the same region
+COMBINED_OUTPUT = BLAST_OUTPUT + '''\
+scf_2\t501\t1400\t5000\tncbi~~~tet(M)~~~B1~~~TETRACYCLINE\t1\t900\t900\tplus\t0.0\t900\t99.000\t0\t0\tncbi~~~tet(M)~~~B1~~~TETRACYCLINE tet(M)\t1600
+scf_2\t601\t1400\t5000\tcard~~~tetO~~~A4~~~tetracycline\t1\t800\t800\tplus\t0.0\t800\t90.000\t0\t0\tcard~~~tetO~~~A4~~~tetracycline Tet(O)\t1100
+'''
+
+
+class TestBlastToAbricate(TestCase):
+    def test_convert(self):
+        df = pd.read_csv(StringIO(blast_to_abricate(BLAST_OUTPUT, file='genome.fasta')), sep='\t')
+        self.assertEqual(expected_columns, set(df.columns))
+        # blaZ covers only 25% of the gene, hits are sorted by sequence and start
+        self.assertEqual(['ErmB', 'tetM'], df.GENE.tolist())
+        self.assertEqual(['scf_1', 'scf_2'], df.SEQUENCE.tolist())
+        self.assertEqual(['-', '+'], df.STRAND.tolist())
+        self.assertEqual(['1-900/910', '1-900/900'], df.COVERAGE.tolist())
+        self.assertEqual(['1/4', '0/0'], df.GAPS.tolist())
+        self.assertEqual([98.68, 100.], df['%COVERAGE'].tolist())
+        self.assertEqual([98., 99.89], df['%IDENTITY'].tolist())
+        self.assertEqual(['ErmB', 'Tet(M) protein'], df.PRODUCT.tolist())
+        self.assertEqual(['macrolide', 'tetracycline'], df.RESISTANCE.tolist())
+        self.assertEqual(['card', 'card'], df.DATABASE.tolist())
+
+    def test_no_hits(self):
+        df = pd.read_csv(StringIO(blast_to_abricate('', file='genome.fasta')), sep='\t')
+        self.assertEqual(0, len(df))
+        self.assertEqual(expected_columns, set(df.columns))
+
+    def test_cull(self):
+        df = pd.read_csv(StringIO(blast_to_abricate(COMBINED_OUTPUT, file='genome.fasta')), sep='\t')
+        self.assertEqual(['ErmB', 'tetM', 'tet(M)', 'tetO'], df.GENE.tolist())
+
+        # as if each db had been searched separately: the hit of ncbi is not enveloped by a hit of the same db
+        df = pd.read_csv(StringIO(blast_to_abricate(COMBINED_OUTPUT, file='genome.fasta', cull=True)), sep='\t')
+        self.assertEqual(['ErmB', 'tetM', 'tet(M)'], df.GENE.tolist())
+        self.assertEqual(['card', 'card', 'ncbi'], df.DATABASE.tolist())
+
+    def test_coverage_map(self):
+        self.assertEqual('=' * 15, coverage_map(1, 900, 900, broken=False))
+        self.assertEqual('=' * 8 + '/' + '=' * 7, coverage_map(1, 900, 900, broken=True))
+        self.assertEqual('=' * 8 + '.' * 7, coverage_map(1, 450, 900, broken=False))
+
+
+# blastn that reports the hits of fake_abricate.py
+FAKE_BLASTN = f'''
+import os, sys
+sys.path.insert(0, {BENCHMARKS!r})
+import fake_abricate
+
+args = sys.argv[1:]
+if args == ['-version']:
+    sys.exit(print('blastn: 2.14.0+'))
+query, db = args[args.index('-query') + 1], args[args.index('-db') + 1]
+datadir, db = os.path.dirname(os.path.dirname(db)), os.path.basename(os.path.dirname(db))
+culling = '-culling_limit' in args
+for row in fake_abricate.hits(query, datadir=datadir, db=db, hits_per_mb=100, culling=culling):
+    hit_length, gene_length = map(int, row[6].split('-')[1].split('/'))
+    sseqid = '~~~'.join([row[11], row[5], row[12], row[14]])
+    print(*[row[1], row[2], row[3], 0, sseqid, 1, hit_length, gene_length, 'plus' if row[4] == '+' else 'minus', 0,
+            hit_length, row[10], 0, 0, f'{{sseqid}} {{row[13]}}', fake_abricate.score(row)], sep='\\t')
+'''
+
+
+class TestABRiannotateBlast(FakeAbricateTestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        fake_abricate.create_datadir(cls.datadir)
+
+    def test_db_versions(self):
+        abr = ABRiannotateBlast(datadir=self.datadir)
+        self.assertEqual(['card', 'ncbi', 'plasmidfinder', 'vfdb'], abr.db_versions.index.tolist())
+        self.assertEqual(100, abr.db_versions.loc['card', 'SEQUENCES'])
+
+    def test_culling(self):
+        abr = ABRiannotateBlast(datadir=self.datadir)
+        self.assertIn('-culling_limit', abr._blastn_cmd('genome.fasta', db='card'))
+        self.assertNotIn('-culling_limit', abr._blastn_cmd('genome.fasta', db=COMBINED_DB, datadir=self.datadir))
+
+    def test_single_pass(self):
+        gbk = os.path.join(self.tempdir.name, 'single_pass.gbk')
+        write_genbank(gbk, n_scaffolds=5, scaffold_length=100_000)
+        dbs = ['card', 'ncbi', 'vfdb']
+        abr = ABRiannotateBlast(datadir=self.datadir, blastn=[sys.executable, '-c', FAKE_BLASTN],
+                                makeblastdb=[sys.executable, '-c', 'pass'],
+                                combined_db_dir=os.path.join(self.tempdir.name, 'comb'))
+        results = []
+        for kwargs in [{}, {'single_pass': True, 'cpus': 4}]:
+            with TemporaryDirectory() as outdir:
+                results.append(abr.abriannotate_multidb(gbk=gbk, genome_identifier='test', outdir=outdir, dbs=dbs,
+                                                        return_hits=True, **kwargs))
+        (gta, atd, hits_df), (single_gta, single_atd, single_hits_df) = results
+        self.assertEqual({g: set(a) for g, a in gta.items()}, {g: set(a) for g, a in single_gta.items()})
+        self.assertEqual(atd, single_atd)
+        for column in ['db', 'gene', 'scaffold', 'start', 'end', 'locus_tag']:
+            self.assertEqual(hits_df[column].tolist(), single_hits_df[column].tolist(), column)
+
+        # culled together, as abricate does, the combined database would lose hits
+        combined = fake_abricate.hits(gbk, datadir=abr.combined_db(dbs), db=COMBINED_DB, hits_per_mb=100)
+        self.assertLess(len(combined), len(hits_df))
+
+    def test_thresholds(self):
+        # cached and stored results must not be reused for other thresholds
+        with TemporaryDirectory() as metadata_dir:
+            abrs = [ABRiannotateBlast(datadir=self.datadir, blastn=[sys.executable, '-c', FAKE_BLASTN], mincov=mincov,
+                                      metadata_cache_dir=metadata_dir) for mincov in [80, 95]]
+            self.assertEqual('blastn 2.14.0+ (abricate databases, minid=80, mincov=80)', abrs[0].version)
+            self.assertEqual('blastn 2.14.0+ (abricate databases, minid=80, mincov=95)', abrs[1].version)
+
+    def test_async_timeout(self):
+        abr = ABRiannotateBlast(datadir=self.datadir)
+        with patch.object(abr, 'abricate') as abricate:
+            asyncio.run(abr.abricate_async(file='genome.fasta', db='card', timeout=5))
+        self.assertEqual(5, abricate.call_args.kwargs['timeout'])
+
+    def test_same_as_abricate(self):
+        gbk = os.path.join(self.tempdir.name, 'genome.gbk')
+        write_genbank(gbk, n_scaffolds=2, scaffold_length=100_000)
+        results = []
+        with patch.dict(os.environ, {'FAKE_ABRICATE_HITS_PER_MB': '100'}):
+            for abr in [ABRiannotateBlast(datadir=self.datadir, blastn=[sys.executable, '-c', FAKE_BLASTN]),
+                        ABRiannotateBash(abricate_path=FAKE_ABRICATE)]:
+                with TemporaryDirectory() as outdir:
+                    results.append(abr.abriannotate_multidb(gbk=gbk, genome_identifier='test', outdir=outdir,
+                                                            dbs=['card', 'vfdb'], return_hits=True))
+
+        (gta, atd, hits_df), (expected_gta, expected_atd, expected_hits_df) = results
+        self.assertGreater(len(gta), 0)
+        self.assertEqual({g: set(a) for g, a in expected_gta.items()}, {g: set(a) for g, a in gta.items()})
+        self.assertEqual(expected_atd, atd)
+        for column in ['gene', 'scaffold', 'start', 'end', 'strand', 'identity', 'locus_tag']:
+            self.assertEqual(expected_hits_df[column].tolist(), hits_df[column].tolist(), column)
+
+    def test_blastn(self):
+        if shutil.which('blastn') is None or shutil.which('makeblastdb') is None:
+            self.skipTest('BLAST+ is not installed')
+        abr = ABRiannotateBlast(datadir=self.datadir)
+        abr._setupdb(self.datadir)
+        gbk = os.path.join(self.tempdir.name, 'genome.gbk')
+        write_genbank(gbk, n_scaffolds=2, scaffold_length=50_000)
+        with TemporaryDirectory() as outdir:
+            gta, atd = abr.abriannotate_multidb(gbk=gbk, genome_identifier='test', outdir=outdir, dbs=['card'])
+        self.assertIn('blastn', abr.version)
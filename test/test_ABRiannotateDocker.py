@@ -1,4 +1,7 @@
+import os
+import sys
 import logging
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 from abri_annotate import ABRiannotateDocker as ABRiannotate, docker_runner as runner
 
@@ -58,3 +61,81 @@ class TestABRiannotate(TestCase):
             merge_annotations=False,
             docker_cmd=self.docker_cmd
         )
+
+    def test_session(self):
+        with ABRiannotate(abricate_docker_image=CURRENT_IMAGE, docker_cmd=self.docker_cmd, session=True) as abr:
+            print(abr.version)
+            print(abr.db_versions)
+            self.assertIsNotNone(abr._container)
+        self.assertIsNone(abr._container)
+
+    def test_runner_session(self):
+        # --gbk='test/FAM23220-i1-1.1.gbk' --verbose --outdir=test/out/session --merge_annotations=True --session=True
+        runner(
+            abricate_docker_image=CURRENT_IMAGE,
+            gbk='FAM23220-i1-1.1.gbk',
+            genome_identifier='FAM23220-i1-1.1',
+            verbose=True,
+            outdir='out/session',
+            merge_annotations=True,
+            docker_cmd=self.docker_cmd,
+            session=True
+        )
+
+
+class TestSessionStaging(TestCase):
+    """Does not need docker: the session container is never started."""
+
+    def setUp(self) -> None:
+        self.tempdir = TemporaryDirectory()
+        self.abr = ABRiannotate(abricate_docker_image=CURRENT_IMAGE, session=True)
+        self.abr._container = 'session'
+
+    def tearDown(self) -> None:
+        self.abr._container = None
+        self.tempdir.cleanup()
+
+    def write(self, name: str) -> str:
+        file = os.path.join(self.tempdir.name, name)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        with open(file, 'w') as f:
+            f.write('>scf_1\nACGT\n')
+        return file
+
+    def test_inputs_are_staged(self):
+        a, b = self.write('a/genome.fasta'), self.write('b/genome.fasta')
+        commands = [self.abr._build_cmd(['--db', 'card'], file=file) for file in [a, b, a]]
+        # the same container for inputs in different directories
+        self.assertEqual([['docker', 'exec', 'session', 'abricate', '--db', 'card']] * 3,
+                         [command[:-1] for command in commands])
+        staged = [os.path.join(self.abr.tmpdir, os.path.relpath(command[-1], '/work')) for command in commands]
+        self.assertTrue(all(command[-1].startswith('/work/') for command in commands))
+        self.assertNotEqual(staged[0], staged[1])
+        self.assertEqual(staged[0], staged[2])
+        with open(staged[1]) as f:
+            self.assertEqual('>scf_1\nACGT\n', f.read())
+
+
+class TestKill(TestCase):
+    """Does not need docker: a fake docker_cmd records its arguments."""
+
+    def setUp(self) -> None:
+        self.tempdir = TemporaryDirectory()
+        self.docker_cmd = os.path.join(self.tempdir.name, 'docker')
+        self.calls = os.path.join(self.tempdir.name, 'calls')
+        with open(self.docker_cmd, 'w') as f:
+            f.write(f'#!{sys.executable}\nimport sys\nprint(*sys.argv[1:], file=open({self.calls!r}, "a"))\n')
+        os.chmod(self.docker_cmd, 0o755)
+        self.abr = ABRiannotate(abricate_docker_image=CURRENT_IMAGE, docker_cmd=self.docker_cmd)
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_container_is_killed(self):
+        # killing the docker client does not stop the container
+        command = self.abr._build_cmd(['--version'])
+        name = command[command.index('--name') + 1]
+        self.assertNotEqual(command, self.abr._build_cmd(['--version']))
+        self.abr._on_kill(command)
+        with open(self.calls) as f:
+            self.assertEqual(f'kill {name}\n', f.read())
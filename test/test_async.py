@@ -0,0 +1,24 @@
+import sys
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+from abri_annotate.ABRiannotate import ABRiannotate
+
+SLEEP = [sys.executable, '-c', 'import time; time.sleep(30)']
+
+
+class TestRunAsync(IsolatedAsyncioTestCase):
+    async def test_run(self):
+        subprocess = await ABRiannotate._run_async([sys.executable, '-c', 'print("hello")'])
+        self.assertEqual(0, subprocess.returncode)
+        self.assertEqual('hello\n', subprocess.stdout)
+
+    async def test_timeout(self):
+        with self.assertRaises(TimeoutError):
+            await ABRiannotate._run_async(SLEEP, timeout=0.5)
+
+    async def test_cancel(self):
+        task = asyncio.ensure_future(ABRiannotate._run_async(SLEEP))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
@@ -0,0 +1,39 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from abri_annotate.batch import read_manifest, write_report
+
+
+class TestManifest(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = TemporaryDirectory()
+        self.manifest = os.path.join(self.tempdir.name, 'manifest.tsv')
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def write(self, text: str) -> str:
+        with open(self.manifest, 'w') as f:
+            f.write(text)
+        return self.manifest
+
+    def test_read_manifest(self):
+        manifest = self.write('# gbk\tgenome_identifier\toutdir\na.gbk\tA\tout/A\n\nb.gbk\tB\tout/B\n')
+        self.assertEqual([('a.gbk', 'A', 'out/A'), ('b.gbk', 'B', 'out/B')], read_manifest(manifest))
+
+    def test_read_manifest_bad_columns(self):
+        with self.assertRaises(AssertionError):
+            read_manifest(self.write('a.gbk\tA\n'))
+
+    def test_read_manifest_duplicates(self):
+        with self.assertRaises(AssertionError):
+            read_manifest(self.write('a.gbk\tA\tout/A\nb.gbk\tA\tout/B\n'))
+
+    def test_write_report(self):
+        report = os.path.join(self.tempdir.name, 'report.tsv')
+        write_report([{'genome_identifier': 'A', 'gbk': 'a.gbk', 'outdir': 'out/A', 'status': 'failed',
+                       'n_genes': 0, 'n_annotations': 0, 'error': 'AssertionError: multi\nline'}], report)
+        with open(report) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertEqual('A\ta.gbk\tout/A\tfailed\t0\t0\tAssertionError: multi line', lines[1])
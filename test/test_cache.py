@@ -0,0 +1,99 @@
+import os
+import time
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+from abri_annotate.cache import ResultCache, MetadataCache
+
+TSV = '#FILE\tSEQUENCE\tSTART\n/old/path.fasta\tscf_1\t1\n/old/path.fasta\tscf_2\t5\n'
+
+
+class TestResultCache(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = TemporaryDirectory()
+        self.fasta = os.path.join(self.tempdir.name, 'genome.fasta')
+        with open(self.fasta, 'w') as f:
+            f.write('>scf_1\nACGT\n')
+        self.cache = ResultCache(os.path.join(self.tempdir.name, 'cache'))
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_key(self):
+        key = self.cache.key(self.fasta, db='card', db_version='v1', version='abricate 1.0.1')
+        self.assertEqual(key, self.cache.key(self.fasta, db='card', db_version='v1', version='abricate 1.0.1'))
+        self.assertNotEqual(key, self.cache.key(self.fasta, db='ncbi', db_version='v1', version='abricate 1.0.1'))
+        self.assertNotEqual(key, self.cache.key(self.fasta, db='card', db_version='v2', version='abricate 1.0.1'))
+
+        # same content at another path: same key
+        other = os.path.join(self.tempdir.name, 'other.fasta')
+        with open(other, 'w') as f:
+            f.write('>scf_1\nACGT\n')
+        self.assertEqual(key, self.cache.key(other, db='card', db_version='v1', version='abricate 1.0.1'))
+
+    def test_get_put(self):
+        key = self.cache.key(self.fasta, db='card', db_version='v1', version='abricate 1.0.1')
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, TSV)
+        self.assertEqual(TSV, self.cache.get(key))
+        self.assertEqual(TSV.replace('/old/path.fasta', '/new.fasta'), self.cache.get(key, file='/new.fasta'))
+
+    def test_lru_eviction(self):
+        self.cache.max_bytes, self.cache.low_water = 2 * len(TSV), 1
+        for key in ['a' * 64, 'b' * 64]:
+            self.cache.put(key, TSV)
+            time.sleep(0.01)
+        self.cache.get('a' * 64)  # 'a' is now more recently used than 'b'
+        time.sleep(0.01)
+        self.cache.put('c' * 64, TSV)
+
+        self.assertIsNotNone(self.cache.get('a' * 64))
+        self.assertIsNone(self.cache.get('b' * 64))
+        self.assertIsNotNone(self.cache.get('c' * 64))
+        self.assertLessEqual(self.cache.size(), self.cache.max_bytes)
+
+    def test_low_water(self):
+        self.cache.max_bytes, self.cache.low_water = 4 * len(TSV), 0.5
+        for key in ['a' * 64, 'b' * 64, 'c' * 64, 'd' * 64]:
+            self.cache.put(key, TSV)
+            time.sleep(0.01)
+        self.assertEqual(4 * len(TSV), self.cache.size())  # not over the limit yet
+        self.cache.put('e' * 64, TSV)
+        self.assertEqual(2 * len(TSV), self.cache.size())
+        self.assertIsNone(self.cache.get('c' * 64))
+        self.assertIsNotNone(self.cache.get('d' * 64))
+
+    def test_size_index(self):
+        self.cache.resync_every = 3
+        with patch.object(ResultCache, 'entries', wraps=self.cache.entries) as entries:
+            for key in ['a' * 64, 'b' * 64, 'a' * 64]:
+                self.cache.put(key, TSV)
+            self.assertEqual(1, entries.call_count)  # no index yet
+            self.assertEqual({'bytes': 2 * len(TSV), 'puts': 2}, self.cache._read_index())
+            self.cache.put('c' * 64, TSV)
+            self.assertEqual(2, entries.call_count)  # resync_every
+            self.assertEqual({'bytes': 3 * len(TSV), 'puts': 0}, self.cache._read_index())
+
+
+class TestMetadataCache(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_get_put(self):
+        cache = MetadataCache(self.tempdir.name)
+        self.assertIsNone(cache.get('abricate', ['--version']))
+        cache.put('abricate', ['--version'], stdout='abricate 1.0.1\n', stderr='')
+        self.assertEqual(('abricate 1.0.1\n', ''), cache.get('abricate', ['--version']))
+        self.assertIsNone(cache.get('abricate', ['--list']))
+        self.assertIsNone(cache.get('other-abricate', ['--version']))
+
+    def test_ttl(self):
+        MetadataCache(self.tempdir.name).put('abricate', ['--version'], stdout='abricate 1.0.1', stderr='')
+        self.assertIsNone(MetadataCache(self.tempdir.name, ttl=-1).get('abricate', ['--version']))
+
+    def test_refresh(self):
+        MetadataCache(self.tempdir.name).put('abricate', ['--version'], stdout='abricate 1.0.1', stderr='')
+        self.assertIsNone(MetadataCache(self.tempdir.name, refresh=True).get('abricate', ['--version']))
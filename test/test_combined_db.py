@@ -0,0 +1,41 @@
+import os
+import pandas as pd
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from abri_annotate.combined_db import combined_db_key, tag_sequences, write_combined_sequences, split_hits
+
+
+class TestCombinedDb(TestCase):
+    def test_key(self):
+        key = combined_db_key({'card': 'v1', 'ncbi': 'v1'}, version='abricate 1.0.1')
+        self.assertEqual(key, combined_db_key({'ncbi': 'v1', 'card': 'v1'}, version='abricate 1.0.1'))
+        self.assertNotEqual(key, combined_db_key({'card': 'v2', 'ncbi': 'v1'}, version='abricate 1.0.1'))
+        self.assertNotEqual(key, combined_db_key({'card': 'v1'}, version='abricate 1.0.1'))
+
+    def test_tag_sequences(self):
+        lines = ['>bla~~~tetM~~~AM990992.1~~~tetracycline tetM product\n', 'ACGT\n']
+        self.assertEqual(['>card~~~tetM~~~AM990992.1~~~tetracycline tetM product\n', 'ACGT\n'],
+                         list(tag_sequences(lines, db='card')))
+
+    def test_tag_sequences_bad_header(self):
+        with self.assertRaises(AssertionError):
+            list(tag_sequences(['>tetM\n', 'ACGT\n'], db='card'))
+
+    def test_write_combined_sequences(self):
+        with TemporaryDirectory() as tempdir:
+            write_combined_sequences({
+                'card': ['>card~~~tetM~~~A~~~tetracycline\n', 'ACGT\n'],
+                'ncbi': ['>ncbi~~~tet(M)~~~B~~~TETRACYCLINE\n', 'ACGT'],
+            }, datadir=tempdir)
+            with open(os.path.join(tempdir, 'combined', 'sequences')) as f:
+                self.assertEqual(4, len(f.read().splitlines()))
+
+    def test_split_hits(self):
+        abricate_df = pd.DataFrame({'DATABASE': ['card', 'ncbi', 'card'], 'GENE': ['tetM', 'tet(M)', 'ErmB']})
+        dfs = split_hits(abricate_df, dbs=['card', 'ncbi', 'vfdb'])
+        self.assertEqual(['tetM', 'ErmB'], dfs['card'].GENE.tolist())
+        self.assertEqual(['tet(M)'], dfs['ncbi'].GENE.tolist())
+        self.assertEqual(0, len(dfs['vfdb']))
+
+        with self.assertRaises(AssertionError):
+            split_hits(abricate_df, dbs=['card'])
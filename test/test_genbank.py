@@ -0,0 +1,92 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from abri_annotate.genbank import load_genes, parse_location, write_fasta
+
+GBK = '''LOCUS       scf_1                    120 bp    DNA     linear   UNK 01-JAN-1980
+DEFINITION  test scaffold 1.
+ACCESSION   scf_1
+VERSION     scf_1
+FEATURES             Location/Qualifiers
+     source          1..120
+                     /organism="Test"
+     gene            1..30
+                     /locus_tag="TEST_0001"
+     CDS             1..30
+                     /locus_tag="TEST_0001"
+                     /product="hypothetical
+                     /locus_tag=protein"
+     CDS             complement(<41..>90)
+                     /locus_tag="TEST_0002"
+     CDS             join(complement(91..100),
+                     complement(105..120))
+                     /locus_tag="TEST_0003"
+ORIGIN
+        1 acgtacgtac gtacgtacgt acgtacgtac gtacgtacgt acgtacgtac gtacgtacgt
+       61 acgtacgtac gtacgtacgt acgtacgtac gtacgtacgt acgtacgtac gtacgtacgt
+//
+LOCUS       scf_2                     60 bp    DNA     linear   UNK 01-JAN-1980
+DEFINITION  test scaffold 2.
+FEATURES             Location/Qualifiers
+     CDS             join(11..20,31..50)
+                     /locus_tag="TEST_0004"
+ORIGIN
+        1 acgtacgtac gtacgtacgt acgtacgtac gtacgtacgt acgtacgtac gtacgtacgt
+//
+'''
+
+
+class TestParseLocation(TestCase):
+    def test_simple(self):
+        self.assertEqual((0, 30, '+'), parse_location('1..30'))
+
+    def test_complement_fuzzy(self):
+        self.assertEqual((40, 90, '-'), parse_location('complement(<41..>90)'))
+
+    def test_join(self):
+        self.assertEqual((10, 50, '+'), parse_location('join(11..20,31..50)'))
+        self.assertEqual((10, 50, '-'), parse_location('complement(join(11..20,31..50))'))
+
+    def test_remote(self):
+        self.assertEqual((10, 20, '+'), parse_location('join(AB000001.1:1..1000,11..20)'))
+
+
+class TestLoadGenes(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = TemporaryDirectory()
+        self.gbk = os.path.join(self.tempdir.name, 'test.gbk')
+        with open(self.gbk, 'w') as f:
+            f.write(GBK)
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_load_genes(self):
+        genes_df = load_genes(self.gbk)
+        self.assertEqual(['TEST_0001', 'TEST_0002', 'TEST_0003', 'TEST_0004'], genes_df.index.tolist())
+        self.assertEqual(['scf_1', 'scf_1', 'scf_1', 'scf_2'], genes_df.scf_id.tolist())
+        self.assertEqual([0, 40, 90, 10], genes_df.start.tolist())
+        self.assertEqual([30, 90, 120, 50], genes_df.end.tolist())
+        self.assertEqual(['+', '-', '-', '+'], genes_df.strand.tolist())
+
+    def test_write_fasta(self):
+        fasta = os.path.join(self.tempdir.name, 'test.fasta')
+        self.assertEqual(['scf_1', 'scf_2'], write_fasta(self.gbk, fasta))
+        with open(fasta) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(['>scf_1', 'ACGT' * 15, 'ACGT' * 15, '>scf_2', 'ACGT' * 15], lines)
+        self.assertEqual(set(load_genes(self.gbk).scf_id), {l[1:] for l in lines if l.startswith('>')})
+
+    def test_matches_biopython(self):
+        try:
+            from Bio import SeqIO
+        except ImportError:
+            self.skipTest('Biopython is not installed')
+
+        genes_df = load_genes(self.gbk)
+        for scf in SeqIO.parse(self.gbk, 'genbank'):
+            for f in scf.features:
+                if 'locus_tag' in f.qualifiers:
+                    gene = genes_df.loc[f.qualifiers['locus_tag'][0]]
+                    self.assertEqual((int(f.location.start), int(f.location.end), scf.name),
+                                     (gene.start, gene.end, gene.scf_id))
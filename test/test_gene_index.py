@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+from unittest import TestCase
+from abri_annotate.gene_index import GeneIndex
+
+
+def make_genes_df(rng, n_genes: int, scaffolds: [str]) -> pd.DataFrame:
+    starts = rng.integers(0, 100_000, size=n_genes)
+    ends = starts + rng.integers(100, 3_000, size=n_genes)
+    return pd.DataFrame({
+        'start': starts,
+        'end': ends,
+        'scf_id': rng.choice(scaffolds, size=n_genes),
+        'strand': '+'
+    }, index=[f'GENE_{i:05d}' for i in range(n_genes)])
+
+
+def make_abricate_df(rng, n_hits: int, scaffolds: [str]) -> pd.DataFrame:
+    starts = rng.integers(1, 100_000, size=n_hits)
+    return pd.DataFrame({
+        'SEQUENCE': rng.choice(scaffolds, size=n_hits),
+        'START': starts,
+        'END': starts + rng.integers(100, 3_000, size=n_hits),
+    })
+
+
+def brute_force(genes_df: pd.DataFrame, abricate_df: pd.DataFrame) -> [str]:
+    # the original algorithm, restricted to the scaffold of the hit
+    result = []
+    for _, hit in abricate_df.iterrows():
+        candidates = genes_df[genes_df.scf_id == hit.SEQUENCE].copy()
+        candidates['distance'] = ((candidates.start - hit.START) ** 2 + (candidates.end - hit.END) ** 2) ** .5
+        result.append(candidates.nsmallest(1, 'distance').iloc[0].name)
+    return result
+
+
+class TestGeneIndex(TestCase):
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(42)
+        scaffolds = ['scf_1', 'scf_2', 'scf_3']
+        genes_df = make_genes_df(rng, n_genes=500, scaffolds=scaffolds)
+        abricate_df = make_abricate_df(rng, n_hits=200, scaffolds=scaffolds)
+
+        assignments = GeneIndex(genes_df).assign(abricate_df)
+
+        self.assertEqual(brute_force(genes_df, abricate_df), assignments.gene.tolist())
+
+    def test_exact_hit(self):
+        genes_df = pd.DataFrame({
+            'start': [0, 999, 2999],
+            'end': [900, 2100, 4000],
+            'scf_id': ['scf_1', 'scf_1', 'scf_2'],
+            'strand': '+'
+        }, index=['A', 'B', 'C'])
+        abricate_df = pd.DataFrame({'SEQUENCE': ['scf_1', 'scf_2'], 'START': [1000, 1000], 'END': [2100, 2100]})
+
+        assignments = GeneIndex(genes_df).assign(abricate_df)
+
+        self.assertEqual(['B', 'C'], assignments.gene.tolist())
+        self.assertEqual(1., assignments.distance[0])  # same metric as before: 0-based gene start vs 1-based hit start
+        self.assertEqual(1., assignments.overlap[0])
+        self.assertEqual(0., assignments.overlap[1])
+
+    def test_unknown_scaffold(self):
+        genes_df = pd.DataFrame({'start': [0, 999], 'end': [900, 2100], 'scf_id': 'scf_1', 'strand': '+'},
+                                index=['A', 'B'])
+        abricate_df = pd.DataFrame({'SEQUENCE': ['unknown', 'scf_1'], 'START': [1, 1], 'END': [900, 900]})
+
+        assignments = GeneIndex(genes_df).assign(abricate_df)
+        self.assertEqual([None, 'A'], assignments.gene.tolist())
+        self.assertTrue(np.isnan(assignments.distance[0]))
+
+    def test_no_genes(self):
+        genes_df = pd.DataFrame(columns=['scf_id', 'start', 'end', 'strand'])
+        abricate_df = pd.DataFrame({'SEQUENCE': ['scf_1'], 'START': [1], 'END': [900]})
+
+        self.assertIsNone(GeneIndex(genes_df).assign(abricate_df).gene[0])
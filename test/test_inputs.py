@@ -0,0 +1,76 @@
+import os
+import sys
+import gzip
+import subprocess
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from test_genbank import GBK
+from abri_annotate.genbank import load_genes as load_genbank_genes
+from abri_annotate.inputs import input_format, is_gzip, load_genes, write_fasta
+
+GFF = '''##gff-version 3
+##sequence-region scf_1 1 120
+scf_1\tTest\tregion\t1\t120\t.\t+\t.\tID=scf_1
+scf_1\tTest\tgene\t1\t30\t.\t+\t.\tID=gene1;locus_tag=TEST_0001
+scf_1\tTest\tCDS\t1\t30\t.\t+\t0\tID=cds1;Parent=gene1;locus_tag=TEST_0001;product=hypothetical%3B protein
+scf_1\tTest\tCDS\t41\t90\t.\t-\t0\tID=cds2;locus_tag=TEST_0002
+scf_1\tTest\tCDS\t105\t120\t.\t-\t0\tID=cds3;locus_tag=TEST_0003
+scf_1\tTest\tCDS\t91\t100\t.\t-\t0\tID=cds3;locus_tag=TEST_0003
+scf_2\tTest\tCDS\t11\t20\t.\t+\t0\tID=cds4;locus_tag=TEST_0004
+scf_2\tTest\tCDS\t31\t50\t.\t+\t0\tID=cds4;locus_tag=TEST_0004
+scf_2\tTest\tmisc_feature\t51\t60\t.\t.\t.\tID=misc1
+##FASTA
+>scf_1 test scaffold 1
+ACGTACGTACGTACGTACGTACGTACGTACGTACGTACGTACGTACGTACGTACGTACGT
+acgtacgtacgtacgtacgtacgtacgtacgtacgtacgtacgtacgtacgtacgtacgt
+>scf_2
+ACGTACGTACGTACGTACGTACGTACGTACGTACGTACGTACGTACGTACGTACGTACGT
+'''
+
+
+class TestInputs(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = TemporaryDirectory()
+        self.files = {}
+        for name, content in [('test.gbk', GBK), ('test.gff', GFF)]:
+            self.files[name] = os.path.join(self.tempdir.name, name)
+            with open(self.files[name], 'w') as f:
+                f.write(content)
+            self.files[f'{name}.gz'] = os.path.join(self.tempdir.name, f'{name}.gz')
+            with gzip.open(self.files[f'{name}.gz'], 'wt') as f:
+                f.write(content)
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_format(self):
+        self.assertEqual(['genbank', 'gff', 'genbank', 'gff'],
+                         [input_format(self.files[n]) for n in ['test.gbk', 'test.gff', 'test.gbk.gz', 'test.gff.gz']])
+        self.assertEqual([False, True], [is_gzip(self.files[n]) for n in ['test.gbk', 'test.gbk.gz']])
+
+    def test_load_genes(self):
+        expected = load_genbank_genes(self.files['test.gbk'])
+        for name, file in self.files.items():
+            genes_df = load_genes(file)
+            self.assertEqual(expected.index.tolist(), genes_df.index.tolist(), name)
+            for column in ['scf_id', 'start', 'end', 'strand']:
+                self.assertEqual(expected[column].tolist(), genes_df[column].tolist(), f'{name}: {column}')
+
+    def test_write_fasta(self):
+        expected = None
+        for name, file in self.files.items():
+            fasta = os.path.join(self.tempdir.name, f'{name}.fasta')
+            self.assertEqual(['scf_1', 'scf_2'], write_fasta(file, fasta), name)
+            with open(fasta) as f:
+                content = f.read()
+            expected = expected or content
+            self.assertEqual(expected, content, name)
+
+    def test_bgzip(self):
+        try:
+            subprocess.run(['bgzip', '--version'], capture_output=True, check=True)
+        except (FileNotFoundError, subprocess.CalledProcessError):
+            self.skipTest('bgzip is not installed')
+        subprocess.run(['bgzip', '-k', self.files['test.gff']], check=True)
+        self.assertEqual(['scf_1', 'scf_2'], load_genes(self.files['test.gff'] + '.gz').scf_id.unique().tolist())
@@ -0,0 +1,60 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from abri_annotate.matrix import PresenceMatrix, GENOMES_FILE, INDICES_FILE
+
+
+class TestPresenceMatrix(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = TemporaryDirectory()
+        self.matrix = PresenceMatrix(self.tempdir.name)
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_empty(self):
+        genomes, columns, indptr, indices = self.matrix.load()
+        self.assertEqual(([], []), (genomes, columns))
+        self.assertEqual([0], indptr.tolist())
+        self.assertEqual((0, 0), self.matrix.to_dataframe().shape)
+
+    def test_append(self):
+        self.matrix.append('g1', ['AR:b', 'AR:a'])
+        self.matrix.append('g2', ['AR:c', 'AR:a'])
+        self.matrix.append('g3', [])
+
+        genomes, columns, indptr, indices = PresenceMatrix(self.tempdir.name).load()
+        self.assertEqual(['g1', 'g2', 'g3'], genomes)
+        self.assertEqual(['AR:a', 'AR:b', 'AR:c'], columns)
+        self.assertEqual([0, 2, 4, 4], indptr.tolist())
+        self.assertEqual([0, 1, 0, 2], indices.tolist())
+
+        df = self.matrix.to_dataframe()
+        self.assertEqual([[True, True, False], [True, False, True], [False, False, False]], df.values.tolist())
+        self.assertEqual(['g1', 'g2', 'g3'], df.index.tolist())
+
+    def test_replace(self):
+        self.matrix.append('g1', ['AR:a'])
+        self.matrix.append('g2', ['AR:b'])
+        self.matrix.append('g1', ['AR:c'])
+
+        df = self.matrix.to_dataframe()
+        self.assertEqual(['g2', 'g1'], df.index.tolist())
+        self.assertEqual([[False, True, False], [False, False, True]], df.values.tolist())
+
+        size = os.path.getsize(os.path.join(self.tempdir.name, INDICES_FILE))
+        self.matrix.compact()
+        self.assertLess(os.path.getsize(os.path.join(self.tempdir.name, INDICES_FILE)), size)
+        self.assertTrue(df.equals(self.matrix.to_dataframe()))
+
+    def test_interrupted_append(self):
+        self.matrix.append('g1', ['AR:a'])
+        # indices and an incomplete row of an append that did not finish
+        with open(os.path.join(self.tempdir.name, INDICES_FILE), 'ab') as f:
+            f.write(b'\x00' * 8)
+        with open(os.path.join(self.tempdir.name, GENOMES_FILE), 'a') as f:
+            f.write('g2\t')
+        self.assertEqual(['g1'], self.matrix.to_dataframe().index.tolist())
+
+        self.matrix.append('g3', ['AR:b'])
+        self.assertEqual([[True, False], [False, True]], self.matrix.to_dataframe().values.tolist())
@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import signal
+import time
+import threading
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from abri_annotate.metrics import Metrics, run_measured
+
+
+class TestMetrics(TestCase):
+    def test_stages_and_counters(self):
+        metrics = Metrics('genome')
+        with metrics.stage('load_gbk'):
+            pass
+        with metrics.stage('load_gbk'):
+            pass
+        metrics.count('genes', 10)
+        metrics.count_db('card', 'hits', 3)
+        metrics.add_call(db='card', file='x', cached=False, wall_s=1.5, cpu_s=1.0, max_rss_kb=100, n_hits=3)
+
+        result = metrics.to_dict()
+        self.assertEqual(['load_gbk'], list(result['stages_s']))
+        self.assertEqual({'genes': 10}, result['counters'])
+        self.assertEqual({'card': {'hits': 3}}, result['dbs'])
+        self.assertEqual(1, len(result['abricate_calls']))
+
+    def test_prometheus(self):
+        metrics = Metrics('genome "1"')
+        metrics.count('genes', 10)
+        metrics.add_call(db='card', file='x', cached=False, wall_s=1.5, cpu_s=1.0, max_rss_kb=100, n_hits=3)
+        with TemporaryDirectory() as tempdir:
+            file = os.path.join(tempdir, 'abriannotate.prom')
+            metrics.write_prometheus(file)
+            with open(file) as f:
+                lines = f.read().splitlines()
+        self.assertIn('abriannotate_count{genome="genome \\"1\\"",counter="genes"} 10', lines)
+        self.assertIn('abriannotate_abricate_max_rss_bytes{genome="genome \\"1\\"",db="card"} 102400', lines)
+        self.assertIn('# TYPE abriannotate_abricate_seconds gauge', lines)
+
+    def test_run_measured(self):
+        subprocess, usage = run_measured([sys.executable, '-c', 'import sys; print("out"); print("err", file=sys.stderr)'])
+        self.assertEqual((0, 'out\n', 'err\n'), (subprocess.returncode, subprocess.stdout, subprocess.stderr))
+        self.assertGreater(usage['max_rss_kb'], 0)
+        self.assertGreaterEqual(usage['cpu_s'], 0)
+
+        subprocess, usage = run_measured([sys.executable, '-c', 'import sys; sys.exit(3)'])
+        self.assertEqual(3, subprocess.returncode)
+
+    def test_run_measured_timeout(self):
+        # the grandchild must be killed too
+        sleep = [sys.executable, '-c', 'import subprocess, sys; subprocess.run([sys.executable, "-c", '
+                                       '"import time; time.sleep(30)"])']
+        start = time.perf_counter()
+        with self.assertRaises(TimeoutError):
+            run_measured(sleep, timeout=0.5)
+        self.assertLess(time.perf_counter() - start, 10)
+
+        cancel = threading.Event()
+        threading.Timer(0.5, cancel.set).start()
+        subprocess, usage = run_measured(sleep, cancel=cancel)
+        self.assertEqual(-9, subprocess.returncode)
+        self.assertLess(time.perf_counter() - start, 20)
+
+        subprocess, usage = run_measured([sys.executable, '-c', 'print("fast")'], timeout=30)
+        self.assertEqual('fast\n', subprocess.stdout)
+
+    def test_run_measured_on_kill(self):
+        sleep = [sys.executable, '-c', 'import time; time.sleep(30)']
+        killed = []
+        with self.assertRaises(TimeoutError):
+            run_measured(sleep, timeout=0.5, on_kill=lambda: killed.append('timeout'))
+        run_measured([sys.executable, '-c', 'pass'], timeout=30, on_kill=lambda: killed.append('fast'))
+
+        # e.g. KeyboardInterrupt while waiting: the process is killed, not left behind
+        def interrupt(signum, frame):
+            raise KeyboardInterrupt()
+
+        previous = signal.signal(signal.SIGALRM, interrupt)
+        try:
+            signal.setitimer(signal.ITIMER_REAL, 0.5)
+            start = time.perf_counter()
+            with self.assertRaises(KeyboardInterrupt):
+                run_measured(sleep, on_kill=lambda: killed.append('interrupt'))
+            self.assertLess(time.perf_counter() - start, 10)
+        finally:
+            signal.signal(signal.SIGALRM, previous)
+        self.assertEqual(['timeout', 'interrupt'], killed)
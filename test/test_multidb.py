@@ -0,0 +1,180 @@
+import os
+import gzip
+import json
+import asyncio
+from tempfile import TemporaryDirectory
+
+from helpers import FAKE_ABRICATE, FakeAbricateTestCase
+from synthetic import write_genbank
+from abri_annotate import ABRiannotateBash, bash_runner
+from abri_annotate.matrix import PresenceMatrix
+from abri_annotate.store import ResultStore
+
+DBS = ['card', 'ncbi', 'vfdb']
+
+
+class TestMultidb(FakeAbricateTestCase):
+    @classmethod
+    def fake_environ(cls) -> dict:
+        return {'FAKE_ABRICATE_HITS_PER_MB': '100'}
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.gbk = os.path.join(cls.tempdir.name, 'genome.gbk')
+        write_genbank(cls.gbk, n_scaffolds=5, scaffold_length=100_000)
+
+    def multidb(self, dbs=DBS, **kwargs):
+        abr = ABRiannotateBash(abricate_path=FAKE_ABRICATE, combined_db_dir=os.path.join(self.tempdir.name, 'comb'))
+        with TemporaryDirectory() as outdir:
+            return abr.abriannotate_multidb(gbk=self.gbk, genome_identifier='test', outdir=outdir, dbs=dbs,
+                                            return_hits=True, **kwargs)
+
+    def assert_same(self, expected, actual):
+        self.assertEqual({g: set(a) for g, a in expected[0].items()}, {g: set(a) for g, a in actual[0].items()})
+        self.assertEqual(expected[1], actual[1])
+        self.assertTrue(expected[2].equals(actual[2]))
+
+    def test_hits(self):
+        gene_to_annotations, annotation_to_description, hits_df = self.multidb()
+        self.assertGreater(len(hits_df), 0)
+        self.assertEqual(set(DBS), set(hits_df.db))
+        self.assertGreater(len(gene_to_annotations), 0)
+
+    def test_max_workers(self):
+        self.assert_same(self.multidb(), self.multidb(max_workers=3))
+
+    def test_shards(self):
+        self.assert_same(self.multidb(), self.multidb(n_shards=3, max_workers=2))
+
+    def test_single_pass(self):
+        # abricate (and the fake) culls hits across the dbs of a combined database, so several dbs are refused. See
+        # test_ABRiannotateBlast for single_pass over several dbs.
+        with self.assertRaises(AssertionError):
+            self.multidb(single_pass=True)
+        self.assert_same(self.multidb(dbs=['card']), self.multidb(dbs=['card'], single_pass=True))
+
+    def test_cpus(self):
+        self.assert_same(self.multidb(), self.multidb(cpus=4))
+        self.assert_same(self.multidb(), self.multidb(cpus=2, n_shards=3))
+        self.assert_same(self.multidb(dbs=['card']), self.multidb(dbs=['card'], cpus=4, single_pass=True))
+
+        with TemporaryDirectory() as outdir:
+            bash_runner(abricate_path=FAKE_ABRICATE, gbk=self.gbk, genome_identifier='test', outdir=outdir, dbs=DBS,
+                        cpus=8, verbose=False)
+            with open(os.path.join(outdir, 'test.abricate.metrics.json')) as f:
+                calls = json.load(f)['abricate_calls']
+        self.assertEqual(len(DBS), len(calls))
+        self.assertTrue(any(call['threads'] > 1 for call in calls))
+
+    def test_prefilter(self):
+        # the synthetic genome shares k-mers with every db, nothing may be skipped
+        self.assert_same(self.multidb(), self.multidb(prefilter=True))
+        self.assert_same(self.multidb(dbs=['card']), self.multidb(dbs=['card'], prefilter=True, single_pass=True,
+                                                                  n_shards=2))
+
+    def test_gzip(self):
+        gbk_gz = os.path.join(self.tempdir.name, 'genome.gbk.gz')
+        with open(self.gbk, 'rb') as f_in, gzip.open(gbk_gz, 'wb') as f_out:
+            f_out.write(f_in.read())
+        abr = ABRiannotateBash(abricate_path=FAKE_ABRICATE)
+        with TemporaryDirectory() as outdir:
+            result = abr.abriannotate_multidb(gbk=gbk_gz, genome_identifier='test', outdir=outdir, dbs=DBS,
+                                              return_hits=True)
+        self.assert_same(self.multidb(), result)
+
+    def test_async(self):
+        abr = ABRiannotateBash(abricate_path=FAKE_ABRICATE)
+        with TemporaryDirectory() as outdir:
+            result = asyncio.run(abr.abriannotate_multidb_async(
+                gbk=self.gbk, genome_identifier='test', outdir=outdir, dbs=DBS, return_hits=True, max_workers=2,
+                timeout=60))
+        self.assert_same(self.multidb(), result)
+
+        with TemporaryDirectory() as outdir:
+            result = asyncio.run(abr.abriannotate_multidb_async(
+                gbk=self.gbk, genome_identifier='test', outdir=outdir, dbs=DBS, return_hits=True, prefilter=True))
+        self.assert_same(self.multidb(), result)
+
+    def test_runner(self):
+        with TemporaryDirectory() as outdir:
+            bash_runner(abricate_path=FAKE_ABRICATE, gbk=self.gbk, genome_identifier='test', outdir=outdir, dbs=DBS)
+            for file in ['test.abricate.annotations.AR', 'test.abricate.descriptions.AR',
+                         'test.abricate.summary.md', 'test.abricate.log']:
+                self.assertTrue(os.path.isfile(os.path.join(outdir, file)), file)
+
+    def test_metrics(self):
+        with TemporaryDirectory() as outdir:
+            prometheus_file = os.path.join(outdir, 'abriannotate.prom')
+            bash_runner(abricate_path=FAKE_ABRICATE, gbk=self.gbk, genome_identifier='test', outdir=outdir, dbs=DBS,
+                        n_shards=2, prometheus_file=prometheus_file)
+            with open(os.path.join(outdir, 'test.abricate.metrics.json')) as f:
+                metrics = json.load(f)
+            self.assertTrue(os.path.isfile(prometheus_file))
+
+        self.assertEqual(len(DBS) * 2, len(metrics['abricate_calls']))
+        self.assertTrue(all(call['cpu_s'] is not None for call in metrics['abricate_calls']))
+        self.assertEqual(set(DBS), set(metrics['dbs']))
+        self.assertEqual(sum(db['hits'] for db in metrics['dbs'].values()), metrics['counters']['hits'])
+        for stage in ['load_gbk', 'write_fasta', 'abricate', 'parse', 'mapping', 'merge', 'dump']:
+            self.assertIn(stage, metrics['stages_s'])
+
+    def test_matrix(self):
+        with TemporaryDirectory() as matrix_dir:
+            _, atd_1 = ABRiannotateBash(abricate_path=FAKE_ABRICATE).abriannotate_multidb(
+                gbk=self.gbk, genome_identifier='g1', outdir=matrix_dir, dbs=DBS, matrix_dir=matrix_dir)
+            with TemporaryDirectory() as outdir:
+                bash_runner(abricate_path=FAKE_ABRICATE, gbk=self.gbk, genome_identifier='g2', outdir=outdir,
+                            dbs=['card'], matrix_dir=matrix_dir, verbose=False)
+            df = PresenceMatrix(matrix_dir).to_dataframe()
+
+        self.assertEqual(['g1', 'g2'], df.index.tolist())
+        self.assertEqual(set(atd_1), set(df.columns[df.loc['g1']]))
+        self.assertTrue(all(annotation.startswith('AR:card') for annotation in df.columns[df.loc['g2']]))
+
+    def test_results_db(self):
+        with TemporaryDirectory() as outdir:
+            results_db = os.path.join(outdir, 'results.sqlite')
+            _, _, hits_df = ABRiannotateBash(abricate_path=FAKE_ABRICATE).abriannotate_multidb(
+                gbk=self.gbk, genome_identifier='test', outdir=outdir, dbs=DBS, return_hits=True,
+                results_db=results_db)
+            store = ResultStore(results_db)
+            hits = store.hits(genome_identifier='test')
+            db_versions = store.query('SELECT * FROM db_versions')
+            self.assertTrue(os.path.isfile(os.path.join(outdir, 'test.abricate.annotations.AR')))
+
+        self.assertEqual(len(hits_df), len(hits))
+        self.assertEqual(hits_df.locus_tag.tolist(), hits.locus_tag.tolist())
+        self.assertEqual(set(DBS), set(db_versions.db))
+
+    def test_incremental(self):
+        abr = ABRiannotateBash(abricate_path=FAKE_ABRICATE, combined_db_dir=os.path.join(self.tempdir.name, 'comb'))
+        with TemporaryDirectory() as outdir, TemporaryDirectory() as abricate_dir:
+            def run(dbs=DBS, **kwargs):
+                return abr.abriannotate_multidb(gbk=self.gbk, genome_identifier='test', outdir=outdir, dbs=dbs,
+                                                abricate_dir=abricate_dir, return_hits=True, **kwargs)
+
+            def reused_dbs():
+                with open(os.path.join(outdir, 'test.abricate.metrics.json')) as f:
+                    return json.load(f)['counters']['reused_dbs']
+
+            expected = run()
+            self.assertEqual(0, reused_dbs())
+            self.assert_same(expected, run())
+            self.assertEqual(3, reused_dbs())
+
+            # a new version of one db
+            abr.db_versions.loc['ncbi', 'SEQUENCES'] += 1
+            self.assert_same(expected, run())
+            self.assertEqual(2, reused_dbs())
+
+            run(incremental=False)
+            self.assertEqual(0, reused_dbs())
+
+            # results of the other mode are stale
+            run(dbs=['card'], single_pass=True)
+            self.assertEqual(0, reused_dbs())
+            run(dbs=['card'], single_pass=True)
+            self.assertEqual(1, reused_dbs())
+            run(dbs=['card'])
+            self.assertEqual(0, reused_dbs())
@@ -0,0 +1,146 @@
+import os
+import json
+import random
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+
+from helpers import FAKE_ABRICATE, FakeAbricateTestCase
+from fake_abricate import create_datadir
+from abri_annotate import ABRiannotateBash
+from abri_annotate.prefilter import kmer_codes, build_sketch, shares_kmers, DbSketches, MAX_BASES
+
+COMPLEMENT = str.maketrans('ACGT', 'TGCA')
+
+
+def random_sequence(length: int, seed: str) -> str:
+    rng = random.Random(seed)
+    return ''.join(rng.choice('ACGT') for _ in range(length))
+
+
+def reverse_complement(sequence: str) -> str:
+    return sequence.translate(COMPLEMENT)[::-1]
+
+
+def write_gbk(file: str, sequence: str):
+    with open(file, 'w') as f:
+        f.write(f'LOCUS       scf_1 {len(sequence):>11} bp    DNA     linear   UNK 01-JAN-1980\n')
+        f.write('FEATURES             Location/Qualifiers\n')
+        f.write(f'     source          1..{len(sequence)}\n')
+        f.write(f'     CDS             1..{len(sequence)}\n')
+        f.write('                     /locus_tag="GENE_1"\n')
+        f.write('ORIGIN\n')
+        for i in range(0, len(sequence), 60):
+            f.write(f'{i + 1:>9} {sequence[i:i + 60].lower()}\n')
+        f.write('//\n')
+
+
+class TestKmers(TestCase):
+    def test_kmer_codes(self):
+        self.assertEqual([0b000110], kmer_codes(b'ACG', k=3).tolist())
+        self.assertEqual(kmer_codes(b'ACG', k=3).tolist(), kmer_codes(b'CGT', k=3).tolist())  # reverse complement
+        self.assertEqual(2, len(kmer_codes(b'acgtNacgt', k=4)))
+        self.assertEqual(0, len(kmer_codes(b'ACG', k=4)))
+
+    def test_canonical(self):
+        sequence = 'ATGGCGTTAACCGATCGATTTACGGCATGCA'
+        forward, reverse = kmer_codes(sequence.encode()), kmer_codes(reverse_complement(sequence).encode())
+        self.assertEqual(sorted(forward.tolist()), sorted(reverse.tolist()))
+
+    def test_shares_kmers(self):
+        gene = 'ATGGCGTTAACCGATCGATTTACGGCATGCA'
+        sketch = build_sketch(['>gene\n', gene[:20] + '\n', gene[20:] + '\n'])
+        self.assertEqual(4 ** 11 // 8, len(sketch))
+        self.assertTrue(shares_kmers(sketch, kmer_codes(('AC' * 50 + reverse_complement(gene)[3:14]).encode())))
+        self.assertFalse(shares_kmers(sketch, kmer_codes(('AC' * 50 + gene[3:13]).encode())))
+        self.assertFalse(shares_kmers(sketch, np.empty(0, dtype=np.uint32)))
+
+
+class TestPrefilter(FakeAbricateTestCase):
+    @classmethod
+    def fake_environ(cls) -> dict:
+        # small dbs, so that the genome does not share k-mers with them by chance
+        return {'FAKE_ABRICATE_GENES': '10'}
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        create_datadir(cls.datadir)
+        with open(os.path.join(cls.datadir, 'card', 'sequences')) as f:
+            card_gene = f.read().splitlines()[1]
+        # low complexity, except for (the reverse complement of) a part of one card gene
+        cls.gbk = os.path.join(cls.tempdir.name, 'genome.gbk')
+        write_gbk(cls.gbk, 'AC' * 1000 + reverse_complement(card_gene[200:300]) + 'AC' * 1000)
+
+    def test_sketches(self):
+        sketch_dir = os.path.join(self.tempdir.name, 'sketches')
+        abr = ABRiannotateBash(abricate_path=FAKE_ABRICATE)
+        dbs = {db: abr.db_version(db) for db in ['card', 'ncbi', 'vfdb']}
+        fasta = os.path.join(self.tempdir.name, 'genome.fasta')
+        with open(fasta, 'w') as f:
+            f.write('>scf_1\n' + 'AC' * 1000 + '\n')
+
+        sketches = DbSketches(sketch_dir)
+        self.assertEqual({'card': False, 'ncbi': False, 'vfdb': False},
+                         sketches.screen(fasta, dbs, read_sequences=abr._read_db_sequences))
+        self.assertEqual(3, len(os.listdir(sketch_dir)))
+
+        # loaded from sketch_dir
+        reloaded = DbSketches(sketch_dir).get('card', dbs['card'], read_sequences=None)
+        self.assertTrue(np.array_equal(sketches.get('card', dbs['card'], read_sequences=None), reloaded))
+
+        # a new version of the db needs a new sketch
+        DbSketches(sketch_dir).get('card', 'new version', read_sequences=abr._read_db_sequences)
+        self.assertEqual(4, len(os.listdir(sketch_dir)))
+
+    def test_random_sequence(self):
+        # unlike the low complexity genome, random sequence shares 11-mers with the dbs by chance: a short contig
+        # still skips some of these small dbs, a plasmid-sized one none of them
+        abr = ABRiannotateBash(abricate_path=FAKE_ABRICATE)
+        dbs = {db: abr.db_version(db) for db in ['card', 'ncbi', 'vfdb', 'plasmidfinder']}
+        sketches = DbSketches()
+        may_hit = {}
+        for length in [200, 5000]:
+            fasta = os.path.join(self.tempdir.name, f'random_{length}.fasta')
+            with open(fasta, 'w') as f:
+                f.write(f'>contig_1\n{random_sequence(length, seed=str(length))}\n')
+            may_hit[length] = sketches.screen(fasta, dbs, read_sequences=abr._read_db_sequences)
+        self.assertIn(False, may_hit[200].values())
+        self.assertNotIn(False, may_hit[5000].values())
+
+    def test_large_input(self):
+        # no db could be skipped, so large inputs are neither screened nor are sketches built
+        gbk = os.path.join(self.tempdir.name, 'large.gbk')
+        write_gbk(gbk, random_sequence(MAX_BASES + 1000, seed='large'))
+        sketch_dir = os.path.join(self.tempdir.name, 'large_sketches')
+        abr = ABRiannotateBash(abricate_path=FAKE_ABRICATE, sketch_dir=sketch_dir)
+        with TemporaryDirectory() as outdir:
+            abr.abriannotate_multidb(gbk=gbk, genome_identifier='test', outdir=outdir, dbs=['card', 'ncbi'],
+                                     prefilter=True)
+            with open(os.path.join(outdir, 'test.abricate.metrics.json')) as f:
+                metrics = json.load(f)
+        self.assertEqual(0, metrics['counters']['prefiltered_dbs'])
+        self.assertEqual(2, len(metrics['abricate_calls']))
+        self.assertFalse(os.path.exists(sketch_dir))
+
+    def test_multidb(self):
+        abr = ABRiannotateBash(abricate_path=FAKE_ABRICATE, sketch_dir=os.path.join(self.tempdir.name, 'sketches'))
+        with TemporaryDirectory() as outdir, TemporaryDirectory() as abricate_dir:
+            _, _, hits_df = abr.abriannotate_multidb(
+                gbk=self.gbk, genome_identifier='test', outdir=outdir, dbs=['card', 'ncbi', 'vfdb'],
+                abricate_dir=abricate_dir, return_hits=True, prefilter=True)
+            with open(os.path.join(outdir, 'test.abricate.metrics.json')) as f:
+                metrics = json.load(f)
+
+            # the skipped dbs are recorded as empty results
+            for db in ['card', 'ncbi', 'vfdb']:
+                self.assertTrue(os.path.isfile(os.path.join(abricate_dir, f'db_{db}.original.tsv')))
+            abr.abriannotate_multidb(gbk=self.gbk, genome_identifier='test', outdir=outdir,
+                                     dbs=['card', 'ncbi', 'vfdb'], abricate_dir=abricate_dir, prefilter=True)
+            with open(os.path.join(outdir, 'test.abricate.metrics.json')) as f:
+                self.assertEqual(3, json.load(f)['counters']['reused_dbs'])
+
+        self.assertEqual(2, metrics['counters']['prefiltered_dbs'])
+        self.assertEqual(['card'], [call['db'] for call in metrics['abricate_calls']])
+        self.assertTrue(set(hits_df.db).issubset({'card'}))
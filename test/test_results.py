@@ -0,0 +1,47 @@
+import os
+import numpy as np
+import pandas as pd
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from abri_annotate.results import hits_table, concat_hits, write_hits, read_hits
+
+ABRICATE_DF = pd.DataFrame({
+    '#FILE': 'genome.fasta', 'SEQUENCE': ['scf_1', 'scf_2'], 'START': [1, 1001], 'END': [900, 1900],
+    'STRAND': ['+', '-'], 'GENE': ['tetM', 'ErmB'], 'COVERAGE': '1-900/900', 'COVERAGE_MAP': '===', 'GAPS': '0/0',
+    '%COVERAGE': [100., 99.5], '%IDENTITY': [99.9, 98.], 'DATABASE': 'card', 'ACCESSION': ['A1', 'A2'],
+    'PRODUCT': ['tetM', 'ErmB'], 'RESISTANCE': ['tetracycline', 'macrolide'],
+})
+ASSIGNMENTS = pd.DataFrame({'gene': ['GENE_1', 'GENE_2'], 'distance': [1., 400.], 'overlap': [1., .5]})
+
+
+class TestResults(TestCase):
+    def setUp(self) -> None:
+        hits_df = hits_table(ABRICATE_DF, ASSIGNMENTS, db='card', annotations=['AR:card:tetM', None],
+                             bad_hits=[False, True])
+        self.hits_df = concat_hits([hits_df, hits_df.iloc[:0]], genome_identifier='genome')
+
+    def test_hits_table(self):
+        self.assertEqual(2, len(self.hits_df))
+        self.assertEqual(['GENE_1', 'GENE_2'], self.hits_df.locus_tag.tolist())
+        self.assertEqual([True, False], self.hits_df.used.tolist())
+        self.assertEqual([False, True], self.hits_df.bad_hit.tolist())
+        for column in ['genome_identifier', 'db', 'gene', 'locus_tag']:
+            self.assertIsInstance(self.hits_df[column].dtype, pd.CategoricalDtype)
+
+    def test_write_read(self):
+        try:
+            import pyarrow
+        except ImportError:
+            self.skipTest('pyarrow is not installed')
+
+        with TemporaryDirectory() as tempdir:
+            for format in ['parquet', 'arrow']:
+                file = os.path.join(tempdir, f'genome.abricate.hits.{format}')
+                write_hits(self.hits_df, file, format=format)
+                hits_df = read_hits(file)
+                self.assertEqual(self.hits_df.locus_tag.tolist(), hits_df.locus_tag.tolist())
+                np.testing.assert_array_equal(self.hits_df.distance, hits_df.distance)
+
+    def test_unknown_format(self):
+        with self.assertRaises(AssertionError):
+            write_hits(self.hits_df, 'genome.abricate.hits.csv', format='csv')
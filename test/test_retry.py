@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from subprocess import CompletedProcess
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from helpers import FAKE_ABRICATE, FakeAbricateTestCase
+from synthetic import write_genbank
+from abri_annotate import ABRiannotateBash
+from abri_annotate.errors import AbricateError, AbricateTimeout
+from abri_annotate.retry import RetryPolicy, run_hedged
+
+
+class TestAbricateError(TestCase):
+    def test_from_process(self):
+        def error(returncode: int, stderr: str = '') -> AbricateError:
+            return AbricateError.from_process(CompletedProcess(['abricate'], returncode, '', stderr), db='card')
+
+        self.assertFalse(error(1, 'ERROR: Could not find database').transient)
+        self.assertFalse(error(0, 'unexpected output').transient)
+        self.assertTrue(error(1, 'blastn: Resource temporarily unavailable').transient)
+        self.assertTrue(error(125, 'Error: OCI runtime error').transient)
+        self.assertTrue(error(-9).transient)
+        self.assertEqual('card', error(1).db)
+        self.assertEqual({'type': 'AbricateError', 'db': 'card', 'file': None, 'returncode': 1, 'transient': False,
+                          'attempts': 1, 'stderr': 'x'}, error(1, 'x').to_dict())
+
+    def test_timeout(self):
+        error = AbricateTimeout('timed out', db='card', timeout=1)
+        self.assertTrue(error.transient)
+        self.assertIsInstance(error, TimeoutError)
+
+
+class TestRunAsync(TestCase):
+    def test_timeout_kills_children(self):
+        with TemporaryDirectory() as tempdir:
+            pid_file = os.path.join(tempdir, 'pid')
+            # like abricate, which runs blastn as a child process
+            command = [sys.executable, '-c', 'import subprocess, sys; subprocess.run([sys.executable, "-c", '
+                                             f'"import os, time; open({pid_file!r}, \'w\').write(str(os.getpid())); '
+                                             f'time.sleep(30)"])']
+            start = time.perf_counter()
+            with self.assertRaises(AbricateTimeout):
+                asyncio.run(ABRiannotateBash._run_async(command, timeout=2))
+            self.assertLess(time.perf_counter() - start, 10)
+            with open(pid_file) as f:
+                pid = int(f.read())
+
+        for _ in range(100):
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                break
+            time.sleep(0.05)
+        else:
+            self.fail(f'child {pid} is still running')
+
+
+class TestRetryPolicy(TestCase):
+    def test_delay(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5)
+        self.assertTrue(0.5 <= policy.delay(0) <= 1)
+        self.assertTrue(2 <= policy.delay(2) <= 4)
+        self.assertTrue(2.5 <= policy.delay(10) <= 5)
+
+    def test_hedge_after(self):
+        policy = RetryPolicy(hedge=3, hedge_min_s=1, min_history=2)
+        self.assertIsNone(policy.hedge_after('card', size=1000))
+        policy.record('card', size=1000, seconds=2)
+        self.assertIsNone(policy.hedge_after('card', size=1000))
+        policy.record('card', size=1000, seconds=4)
+        self.assertAlmostEqual(9, policy.hedge_after('card', size=1000))
+        self.assertAlmostEqual(18, policy.hedge_after('card', size=2000))
+        self.assertAlmostEqual(1, policy.hedge_after('card', size=10))
+        self.assertIsNone(policy.hedge_after('ncbi', size=1000))
+        self.assertIsNone(RetryPolicy().hedge_after('card', size=1000))
+
+    def test_call(self):
+        failures = [AbricateError('transient', transient=True), AbricateError('transient', transient=True)]
+
+        def run(cancel: threading.Event) -> str:
+            if failures:
+                raise failures.pop(0)
+            return 'done'
+
+        self.assertEqual(('done', 3, False), RetryPolicy(retries=2, backoff=0.01).call(run, description='test'))
+
+        failures = [AbricateError('transient', transient=True)] * 3
+        with self.assertRaises(AbricateError) as context:
+            RetryPolicy(retries=2, backoff=0.01).call(run, description='test')
+        self.assertEqual(3, context.exception.attempts)
+
+        failures = [AbricateError('permanent'), AbricateError('permanent')]
+        with self.assertRaises(AbricateError) as context:
+            RetryPolicy(retries=2, backoff=0.01).call(run, description='test')
+        self.assertEqual(1, context.exception.attempts)
+
+    def test_run_hedged(self):
+        calls = []
+
+        def run(cancel: threading.Event) -> int:
+            calls.append(len(calls))
+            if len(calls) == 1:
+                cancel.wait(30)  # the straggler
+                raise AbricateError('cancelled', transient=True)
+            return len(calls)
+
+        start = time.perf_counter()
+        self.assertEqual((2, True), run_hedged(run, hedge_after=0.2))
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertEqual((3, False), run_hedged(run, hedge_after=None))
+
+        # without hedging, there is nothing to cancel: no watchdog and no own session for the process
+        self.assertEqual((None, False), run_hedged(lambda cancel: cancel, hedge_after=None))
+
+
+class TestAbricateRetries(FakeAbricateTestCase):
+    """Injects faults into benchmarks/fake_abricate.py."""
+
+    @classmethod
+    def fake_environ(cls) -> dict:
+        cls.faults = os.path.join(cls.tempdir.name, 'faults')
+        return {'FAKE_ABRICATE_FAULTS': cls.faults}
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.gbk = os.path.join(cls.tempdir.name, 'genome.gbk')
+        write_genbank(cls.gbk, n_scaffolds=2, scaffold_length=50_000)
+
+    def multidb(self, abr: ABRiannotateBash, faults: [str], dbs=('card',)) -> dict:
+        with open(self.faults, 'w') as f:
+            f.write(''.join(f'{fault}\n' for fault in faults))
+        with TemporaryDirectory() as outdir:
+            abr.abriannotate_multidb(gbk=self.gbk, genome_identifier='test', outdir=outdir, dbs=list(dbs))
+            with open(os.path.join(outdir, 'test.abricate.metrics.json')) as f:
+                return json.load(f)
+
+    def test_retries(self):
+        abr = ABRiannotateBash(abricate_path=FAKE_ABRICATE, retries=2, backoff=0.01)
+        metrics = self.multidb(abr, ['fail', 'fail'])
+        self.assertEqual(2, metrics['counters']['retries'])
+        self.assertEqual(3, metrics['abricate_calls'][0]['attempts'])
+
+    def test_failures(self):
+        with self.assertRaises(AbricateError) as context:
+            self.multidb(ABRiannotateBash(abricate_path=FAKE_ABRICATE), ['fail'])
+        self.assertTrue(context.exception.transient)
+        self.assertEqual('card', context.exception.db)
+
+        # permanent errors are not retried
+        with self.assertRaises(AbricateError) as context:
+            self.multidb(ABRiannotateBash(abricate_path=FAKE_ABRICATE, retries=3, backoff=0.01), ['error', 'ok'])
+        self.assertFalse(context.exception.transient)
+        self.assertEqual(1, context.exception.attempts)
+
+    def test_malformed_output(self):
+        abr = ABRiannotateBash(abricate_path=FAKE_ABRICATE, retries=1, backoff=0.01)
+        self.assertEqual(2, self.multidb(abr, ['truncate'])['abricate_calls'][0]['attempts'])
+
+        with self.assertRaises(AbricateError) as context:
+            self.multidb(ABRiannotateBash(abricate_path=FAKE_ABRICATE), ['truncate'])
+        self.assertTrue(context.exception.transient)
+        self.assertIn('truncated', str(context.exception))
+
+        # an unbalanced quote passes malformed_output, but fails to parse
+        self.assertEqual(2, self.multidb(abr, ['quote'])['abricate_calls'][0]['attempts'])
+        with self.assertRaises(AbricateError) as context:
+            self.multidb(ABRiannotateBash(abricate_path=FAKE_ABRICATE), ['quote'])
+        self.assertIn('Failed to parse', str(context.exception))
+
+    def test_timeout(self):
+        abr = ABRiannotateBash(abricate_path=FAKE_ABRICATE, timeout=5, retries=1, backoff=0.01)
+        start = time.perf_counter()
+        metrics = self.multidb(abr, ['sleep 60'])
+        self.assertLess(time.perf_counter() - start, 30)
+        self.assertEqual(2, metrics['abricate_calls'][0]['attempts'])
+
+        with self.assertRaises(AbricateTimeout):
+            self.multidb(ABRiannotateBash(abricate_path=FAKE_ABRICATE, timeout=1), ['sleep 60'])
+
+    def test_hedge(self):
+        abr = ABRiannotateBash(abricate_path=FAKE_ABRICATE, hedge=3)
+        abr.retry.hedge_min_s = 1
+        for _ in range(abr.retry.min_history):
+            self.multidb(abr, [])
+
+        start = time.perf_counter()
+        metrics = self.multidb(abr, ['sleep 60'])
+        self.assertLess(time.perf_counter() - start, 30)
+        self.assertEqual(1, metrics['counters']['hedged_calls'])
+        self.assertTrue(metrics['abricate_calls'][0]['hedged'])
+
+    def test_async(self):
+        abr = ABRiannotateBash(abricate_path=FAKE_ABRICATE, retries=1, backoff=0.01)
+        asyncio.run(abr.load_metadata_async())
+        with open(self.faults, 'w') as f:
+            f.write('fail\n')
+        with TemporaryDirectory() as outdir:
+            asyncio.run(abr.abriannotate_multidb_async(gbk=self.gbk, genome_identifier='test', outdir=outdir,
+                                                       dbs=['card'], timeout=30))
+            with open(os.path.join(outdir, 'test.abricate.metrics.json')) as f:
+                self.assertEqual(1, json.load(f)['counters']['retries'])
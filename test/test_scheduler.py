@@ -0,0 +1,49 @@
+import time
+import threading
+from unittest import TestCase
+import pandas as pd
+from abri_annotate.scheduler import CpuBudget, db_weights
+
+
+class TestScheduler(TestCase):
+    def test_more_tasks_than_cpus(self):
+        budget = CpuBudget(4)
+        budget.add_pending(10)
+        self.assertEqual([1, 1, 1, 1], [budget.acquire(1) for _ in range(4)])
+        self.assertEqual(0, budget.free)
+
+    def test_shares(self):
+        budget = CpuBudget(8)
+        for weight in [3, 1]:
+            budget.add_pending(weight)
+        self.assertEqual(6, budget.acquire(3))
+        self.assertEqual(2, budget.acquire(1))
+        budget.release(6)
+        budget.release(2)
+        self.assertEqual(8, budget.free)
+
+    def test_single_task(self):
+        budget = CpuBudget(8)
+        budget.add_pending(5)
+        with budget.reserve(5) as threads:
+            self.assertEqual(8, threads)
+        self.assertEqual(8, budget.free)
+
+    def test_wait(self):
+        budget = CpuBudget(1)
+        budget.add_pending(2)
+        threads = budget.acquire(1)
+        self.assertEqual(1, threads)
+
+        acquired = []
+        thread = threading.Thread(target=lambda: acquired.append(budget.acquire(1)))
+        thread.start()
+        time.sleep(0.1)
+        self.assertEqual([], acquired)
+        budget.release(threads)
+        thread.join(timeout=5)
+        self.assertEqual([1], acquired)
+
+    def test_db_weights(self):
+        db_versions = pd.DataFrame({'SEQUENCES': [2631, 0]}, index=['card', 'empty'])
+        self.assertEqual({'card': 2631., 'empty': 1.}, db_weights(db_versions, ['card', 'empty']))
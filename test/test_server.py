@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import threading
+from http.client import HTTPConnection
+from concurrent.futures import Future
+
+from helpers import FAKE_ABRICATE, FakeAbricateTestCase
+from synthetic import write_genbank
+from abri_annotate import ABRiannotateBash
+from abri_annotate.server import JobServer, QueueFull, create_http_server
+
+
+class TestServer(FakeAbricateTestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.gbk = os.path.join(cls.tempdir.name, 'genome.gbk')
+        write_genbank(cls.gbk, n_scaffolds=2, scaffold_length=100_000)
+
+        cls.job_server = JobServer(ABRiannotateBash(abricate_path=FAKE_ABRICATE), processes=1, verbose=False,
+                                   abricate_dir=os.path.join(cls.tempdir.name, 'abricate'), dbs=['card', 'ncbi'])
+        cls.http_server = create_http_server(cls.job_server, port=0)
+        cls.thread = threading.Thread(target=cls.http_server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.http_server.shutdown()
+        cls.http_server.server_close()
+        cls.job_server.close()
+        super().tearDownClass()
+
+    def request(self, method: str, path: str, body: dict = None) -> (int, dict):
+        connection = HTTPConnection('127.0.0.1', self.http_server.server_address[1], timeout=10)
+        try:
+            connection.request(method, path, body=None if body is None else json.dumps(body))
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            connection.close()
+
+    def wait(self, job_id: str, timeout: float = 60) -> dict:
+        start = time.time()
+        while time.time() - start < timeout:
+            status, job = self.request('GET', f'/jobs/{job_id}')
+            self.assertEqual(200, status)
+            if job['status'] in ('success', 'failed'):
+                return job
+            time.sleep(0.1)
+        raise TimeoutError(job_id)
+
+    def test_job(self):
+        outdir = os.path.join(self.tempdir.name, 'out1')
+        status, job = self.request('POST', '/jobs', {'gbk': self.gbk, 'genome_identifier': 'test', 'outdir': outdir})
+        self.assertEqual(202, status)
+        self.assertIn(job['status'], ('queued', 'running'))
+
+        job = self.wait(job['id'])
+        self.assertEqual('success', job['status'], job['error'])
+        self.assertGreater(job['n_genes'], 0)
+        self.assertTrue(os.path.isfile(os.path.join(outdir, 'test.abricate.annotations.AR')))
+
+        status, health = self.request('GET', '/health')
+        self.assertEqual(200, status)
+        self.assertEqual('abricate 1.0.1', health['version'])
+        self.assertGreaterEqual(health['success'], 1)
+
+    def test_dbs(self):
+        outdir = os.path.join(self.tempdir.name, 'out2')
+        status, job = self.request('POST', '/jobs', {
+            'gbk': self.gbk, 'genome_identifier': 'test2', 'outdir': outdir, 'dbs': ['vfdb']})
+        self.assertEqual(202, status)
+        self.assertEqual('success', self.wait(job['id'])['status'])
+        self.assertEqual(['db_vfdb.original.tsv'], sorted(
+            f for f in os.listdir(os.path.join(self.tempdir.name, 'abricate', 'test2')) if f.startswith('db_')))
+
+    def test_bad_requests(self):
+        self.assertEqual(404, self.request('GET', '/jobs/unknown')[0])
+        self.assertEqual(404, self.request('GET', '/unknown')[0])
+        self.assertEqual(400, self.request('POST', '/jobs', {'gbk': self.gbk})[0])
+        self.assertEqual(400, self.request('POST', '/jobs', {
+            'gbk': 'missing.gbk', 'genome_identifier': 'test', 'outdir': self.tempdir.name})[0])
+        self.assertEqual(400, self.request('POST', '/jobs', {
+            'gbk': self.gbk, 'genome_identifier': 'test', 'outdir': self.tempdir.name, 'dbs': ['nonexistent']})[0])
+
+    def test_queue_full(self):
+        job_server = JobServer(ABRiannotateBash(abricate_path=FAKE_ABRICATE), max_queue=1, verbose=False)
+        try:
+            job_server._queue.put(None)  # stop the dispatcher, so that the next job stays in the queue
+            job_server._dispatcher.join()
+            job_server.submit(self.gbk, 'test', os.path.join(self.tempdir.name, 'out3'))
+            with self.assertRaises(QueueFull):
+                job_server.submit(self.gbk, 'test', os.path.join(self.tempdir.name, 'out4'))
+        finally:
+            job_server._executor.shutdown()
+
+    def test_max_finished(self):
+        job_server = JobServer(ABRiannotateBash(abricate_path=FAKE_ABRICATE), max_finished=2, verbose=False)
+        try:
+            job_server._queue.put(None)  # stop the dispatcher, jobs are finished by hand
+            job_server._dispatcher.join()
+            jobs = [job_server.submit(self.gbk, f'test{i}', os.path.join(self.tempdir.name, 'out5'))
+                    for i in range(3)]
+            for job in jobs:
+                future = Future()
+                future.set_result({'status': 'success', 'n_genes': 1, 'n_annotations': 0, 'error': None})
+                job_server._slots.acquire()
+                job_server._done(job['id'], future)
+            self.assertIsNone(job_server.status(jobs[0]['id']))
+            self.assertEqual('success', job_server.status(jobs[2]['id'])['status'])
+            self.assertEqual(2, len(job_server.jobs))
+            self.assertEqual(3, job_server.summary()['success'])
+        finally:
+            job_server._executor.shutdown()
@@ -0,0 +1,42 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import pandas as pd
+from abri_annotate.sharding import balance, fasta_lengths, write_shards, merge_shard_hits
+
+FASTA = '>scf_1\nACGTACGTAC\nACGTACGTAC\n>scf_2\nACGTA\n>scf_3\nACGTACGTAC\n>scf_4\nAC\n'
+
+
+class TestSharding(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = TemporaryDirectory()
+        self.fasta = os.path.join(self.tempdir.name, 'test.fasta')
+        with open(self.fasta, 'w') as f:
+            f.write(FASTA)
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_fasta_lengths(self):
+        self.assertEqual({'scf_1': 20, 'scf_2': 5, 'scf_3': 10, 'scf_4': 2}, fasta_lengths(self.fasta))
+
+    def test_balance(self):
+        self.assertEqual([['scf_1'], ['scf_3', 'scf_2', 'scf_4']], balance(fasta_lengths(self.fasta), 2))
+        self.assertEqual(4, len(balance(fasta_lengths(self.fasta), 10)))
+
+    def test_write_shards(self):
+        files = write_shards(self.fasta, 2)
+        self.assertEqual(2, len(files))
+        lengths = [fasta_lengths(file) for file in files]
+        self.assertEqual(fasta_lengths(self.fasta), {k: v for l in lengths for k, v in l.items()})
+        self.assertEqual([20, 17], [sum(l.values()) for l in lengths])
+
+    def test_merge_shard_hits(self):
+        dfs = [
+            pd.DataFrame({'#FILE': 'shard0', 'SEQUENCE': ['scf_1', 'scf_1'], 'START': [50, 7]}),
+            pd.DataFrame({'#FILE': 'shard1', 'SEQUENCE': ['scf_3', 'scf_10'], 'START': [1, 3]}),
+        ]
+        merged = merge_shard_hits(dfs, file='all.fasta')
+        self.assertEqual(['scf_1', 'scf_1', 'scf_10', 'scf_3'], merged.SEQUENCE.tolist())
+        self.assertEqual([7, 50, 3, 1], merged.START.tolist())
+        self.assertEqual({'all.fasta'}, set(merged['#FILE']))
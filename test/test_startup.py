@@ -0,0 +1,15 @@
+import os
+import sys
+from unittest import TestCase
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+from startup import heavy_imports
+
+
+class TestStartup(TestCase):
+    def test_no_heavy_imports(self):
+        # the CLI entry points must not pay for pandas/numpy before they do any work
+        for module in ['abri_annotate', 'abri_annotate.ABRiannotateBash', 'abri_annotate.ABRiannotateDocker',
+                       'abri_annotate.batch']:
+            self.assertEqual([], heavy_imports(module), module)
@@ -0,0 +1,68 @@
+import os
+import sqlite3
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from abri_annotate.results import hits_table, concat_hits
+from abri_annotate.store import ResultStore
+
+from test_results import ABRICATE_DF, ASSIGNMENTS
+
+
+def make_hits(genome_identifier: str, locus_tags: [str]):
+    assignments = ASSIGNMENTS.assign(gene=locus_tags)
+    hits_df = hits_table(ABRICATE_DF, assignments, db='card', annotations=['AR:card:tetM', None],
+                         bad_hits=[False, True])
+    return concat_hits([hits_df], genome_identifier=genome_identifier)
+
+
+class TestResultStore(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = TemporaryDirectory()
+        self.file = os.path.join(self.tempdir.name, 'results.sqlite')
+        self.store = ResultStore(self.file)
+        for genome_identifier in ['g1', 'g2']:
+            self.store.write(genome_identifier, make_hits(genome_identifier, [f'{genome_identifier}_1', None]),
+                             version='abricate 1.0.1', db_versions={'card': 'SEQUENCES=2631, DATE=2023-01-01'},
+                             n_genes=1, n_annotations=1)
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_hits(self):
+        hits = self.store.hits(genome_identifier='g1')
+        self.assertEqual(['tetM', 'ErmB'], hits.gene.tolist())
+        self.assertEqual('g1_1', hits.locus_tag[0])
+        self.assertTrue(hits.locus_tag.isna()[1])
+        self.assertEqual([1, 0], hits.used.tolist())
+        self.assertEqual([900, 1900], hits.end.tolist())
+        self.assertEqual(1, len(self.store.hits(locus_tag='g2_1')))
+        self.assertEqual(0, len(self.store.hits(db='ncbi')))
+
+    def test_genomes_with(self):
+        self.assertEqual(['g1', 'g2'], self.store.genomes_with('tetM'))
+        self.assertEqual([], self.store.genomes_with('ErmB'))  # hit not used
+
+    def test_replace(self):
+        self.store.write('g1', make_hits('g1', ['x', 'y']), version='abricate 1.0.2', db_versions={})
+        self.assertEqual(['x', 'y'], self.store.hits(genome_identifier='g1').locus_tag.tolist())
+        self.assertEqual(4, len(self.store.hits()))
+        genomes = self.store.query('SELECT * FROM genomes ORDER BY genome_identifier')
+        self.assertEqual(['abricate 1.0.2', 'abricate 1.0.1'], genomes.abricate_version.tolist())
+        self.assertEqual(['g2'], self.store.query('SELECT genome_identifier FROM db_versions').genome_identifier.tolist())
+
+    def test_rollback(self):
+        with self.assertRaises(KeyError):
+            self.store.write('g1', make_hits('g1', ['x', 'y']).drop(columns='used'), version='', db_versions={})
+        self.assertEqual('g1_1', self.store.hits(genome_identifier='g1').locus_tag[0])
+
+    def test_indexes(self):
+        with sqlite3.connect(self.file) as connection:
+            plan = connection.execute('EXPLAIN QUERY PLAN SELECT * FROM hits WHERE gene = ?', ('tetM',)).fetchall()
+        self.assertIn('hits_gene', str(plan))
+
+    def test_journal_mode(self):
+        with sqlite3.connect(self.file) as connection:
+            self.assertEqual('delete', connection.execute('PRAGMA journal_mode').fetchone()[0])
+        ResultStore(self.file, wal=True)
+        with sqlite3.connect(self.file) as connection:
+            self.assertEqual('wal', connection.execute('PRAGMA journal_mode').fetchone()[0])
@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+import subprocess
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from helpers import FAKE_ABRICATE
+from synthetic import write_genbank
+from fake_abricate import create_datadir
+from abri_annotate.ABRiannotateBash import worker_runner
+from abri_annotate.work_queue import WorkQueue
+
+WORKER = '''
+import sys
+from abri_annotate.ABRiannotateBash import worker_runner
+
+worker_runner(sys.argv[2:], queue_dir=sys.argv[1], heartbeat=0.2, stale_after=2, poll=0.1, verbose=False,
+              dbs=['card', 'ncbi'], retries=1)
+'''
+
+
+class TestWorkQueue(TestCase):
+    def setUp(self) -> None:
+        self.tempdir = TemporaryDirectory()
+        self.gbk = os.path.join(self.tempdir.name, 'genome.gbk')
+        write_genbank(self.gbk, n_scaffolds=2, scaffold_length=50_000)
+        self.queue = WorkQueue(os.path.join(self.tempdir.name, 'queue'))
+        # once, before the workers start
+        self.datadir = os.path.join(self.tempdir.name, 'db')
+        create_datadir(self.datadir)
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_claim(self):
+        self.queue.submit(self.gbk, 'g1', os.path.join(self.tempdir.name, 'g1'))
+        other = WorkQueue(self.queue.directory)  # e.g. on another node
+
+        task_id, task = self.queue.claim()
+        self.assertEqual('g1', task_id)
+        self.assertEqual(self.gbk, task['gbk'])
+        self.assertEqual((None, None), other.claim())
+        self.assertEqual('running', other.state('g1'))
+        with self.assertRaises(AssertionError):
+            other.submit(self.gbk, 'g1', self.tempdir.name)
+
+        self.queue.complete(task_id, {'status': 'success'})
+        self.assertEqual({'pending': 0, 'running': 0, 'done': 1, 'failed': 0}, other.status())
+        self.assertEqual('g1', other.results()[0]['genome_identifier'])
+
+    def test_worker_runner_options(self):
+        with self.assertRaises(AssertionError) as context:
+            worker_runner(FAKE_ABRICATE, queue_dir=self.queue.directory, dbs=['card'], retires=1)
+        self.assertIn('retires', str(context.exception))
+
+    def test_reclaim_stale(self):
+        self.queue.submit(self.gbk, 'g1', self.tempdir.name)
+        for attempt in range(1, 3):
+            task_id, task = self.queue.claim()
+            self.assertEqual([], self.queue.reclaim_stale(stale_after=60, max_attempts=2))
+            os.utime(self.queue._path('running', task_id), (time.time() - 120,) * 2)  # the worker died
+            self.assertEqual(['g1'], self.queue.reclaim_stale(stale_after=60, max_attempts=2))
+            self.assertFalse(self.queue.heartbeat(task_id))
+        self.assertEqual('failed', self.queue.state('g1'))
+        self.assertEqual(2, self.queue.results()[0]['attempts'])
+
+        # resubmit a failed task
+        self.queue.submit(self.gbk, 'g1', self.tempdir.name)
+        self.assertEqual('pending', self.queue.state('g1'))
+
+    def test_reclaimed_complete(self):
+        self.queue.submit(self.gbk, 'g1', self.tempdir.name)
+        _, slow = self.queue.claim(worker='slow')
+        os.utime(self.queue._path('running', 'g1'), (time.time() - 120,) * 2)
+        self.queue.reclaim_stale(stale_after=60)
+        self.assertFalse(self.queue.complete('g1', {'status': 'failed'}, claim=slow['claim']))  # pending again
+
+        _, new = self.queue.claim(worker='new')
+        self.assertNotEqual(slow['claim'], new['claim'])
+        self.assertFalse(self.queue.heartbeat('g1', claim=slow['claim']))
+        self.assertFalse(self.queue.complete('g1', {'status': 'failed'}, claim=slow['claim']))
+        self.assertEqual('running', self.queue.state('g1'))
+        self.assertTrue(self.queue.heartbeat('g1', claim=new['claim']))
+        self.assertTrue(self.queue.complete('g1', {'status': 'success'}, claim=new['claim']))
+        self.assertEqual('done', self.queue.state('g1'))
+
+    def test_workers(self):
+        genomes = [f'g{i}' for i in range(6)]
+        for genome_identifier in genomes:
+            self.queue.submit(self.gbk, genome_identifier, os.path.join(self.tempdir.name, 'out', genome_identifier))
+        # a task whose worker died
+        self.queue.claim()
+        os.utime(self.queue._path('running', 'g0'), (time.time() - 60,) * 2)
+
+        env = {**os.environ, 'FAKE_ABRICATE_DATADIR': self.datadir}
+        workers = [subprocess.Popen([sys.executable, '-c', WORKER, self.queue.directory, *FAKE_ABRICATE], env=env,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for _ in range(3)]
+        for worker in workers:
+            self.assertEqual(0, worker.wait(timeout=120))
+
+        self.assertEqual({'pending': 0, 'running': 0, 'done': len(genomes), 'failed': 0}, self.queue.status())
+        results = self.queue.results()
+        self.assertEqual(genomes, sorted(result['genome_identifier'] for result in results))
+        self.assertTrue(all(result['n_genes'] > 0 for result in results))
+        self.assertEqual(1, [r for r in results if r['genome_identifier'] == 'g0'][0]['attempts'])
+        for genome_identifier in genomes:
+            outdir = os.path.join(self.tempdir.name, 'out', genome_identifier)
+            self.assertTrue(os.path.isfile(os.path.join(outdir, f'{genome_identifier}.abricate.annotations.AR')))